@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the Docling service
+
+Builds a local PDF corpus (the checked-in sample PDFs plus generated
+text-only, scanned, table-heavy and mixed documents of several sizes), runs
+every document through /upload and writes per-document latency, pages/sec,
+peak RSS and output size as JSON. Nothing leaves the machine.
+
+    python benchmark_docling.py                       # in-process Flask app
+    python benchmark_docling.py --mode gunicorn       # local gunicorn (gunicorn.conf.py)
+    python benchmark_docling.py --output bench.json --baseline baseline.json
+
+The extraction cache is disabled for the run, so repeats measure real
+conversions. With --baseline the median latency of each document is
+compared against a stored run and the script exits with status 1 when a
+document got slower than --threshold (default 20%).
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import fitz  # PyMuPDF
+import psutil
+import requests
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKED_IN_PDFS = ['test_upload.pdf', 'background-checks.pdf']
+
+WORDS = (
+    'docling converts documents into structured markdown while keeping headings tables '
+    'lists and reading order intact so that downstream search and question answering '
+    'can rely on clean text extracted from every page of the uploaded file'
+).split()
+
+def sentence(seed, length=14):
+    """Deterministic pseudo-text so generated PDFs are identical between runs"""
+    return ' '.join(WORDS[(seed * 7 + i * 3) % len(WORDS)] for i in range(length)).capitalize() + '.'
+
+def add_text_page(doc, page_index):
+    page = doc.new_page()
+    page.insert_text((72, 72), f'Section {page_index + 1}', fontsize=16)
+    y = 100
+    for line in range(38):
+        page.insert_text((72, y), sentence(page_index * 40 + line, 12), fontsize=10)
+        y += 17
+    return page
+
+def add_table_page(doc, page_index, rows=18, cols=5):
+    page = doc.new_page()
+    page.insert_text((72, 60), f'Table {page_index + 1}', fontsize=14)
+    left, top, width, height = 60, 80, 480, 24
+    for row in range(rows + 1):
+        page.draw_line((left, top + row * height), (left + width, top + row * height))
+    for col in range(cols + 1):
+        x = left + col * width / cols
+        page.draw_line((x, top), (x, top + rows * height))
+    for row in range(rows):
+        for col in range(cols):
+            value = f'{(page_index + 1) * (row + 1) * (col + 3) % 997:,}' if col else f'Item {row + 1}'
+            page.insert_text((left + col * width / cols + 6, top + row * height + 16), value, fontsize=9)
+    return page
+
+def add_scanned_page(doc, page_index, dpi=110):
+    """Render a text page to an image and insert it as an image-only page"""
+    source = fitz.open()
+    add_text_page(source, page_index)
+    pixmap = source[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    source.close()
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=pixmap.tobytes('png'))
+    return page
+
+def generate_pdf(path, kinds):
+    """Write a PDF whose pages follow ``kinds`` ('text', 'table' or 'scanned')"""
+    builders = {'text': add_text_page, 'table': add_table_page, 'scanned': add_scanned_page}
+    doc = fitz.open()
+    for page_index, kind in enumerate(kinds):
+        builders[kind](doc, page_index)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+GENERATED_DOCUMENTS = {
+    'text_1p': ['text'],
+    'text_10p': ['text'] * 10,
+    'text_50p': ['text'] * 50,
+    'scanned_3p': ['scanned'] * 3,
+    'scanned_10p': ['scanned'] * 10,
+    'tables_5p': ['table'] * 5,
+    'mixed_12p': ['text', 'table', 'scanned'] * 4,
+}
+
+def build_corpus(corpus_dir, only=None):
+    """Copy the checked-in PDFs and generate the synthetic ones; returns document records"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    documents = []
+
+    for filename in CHECKED_IN_PDFS:
+        source = os.path.join(REPO_DIR, filename)
+        if not os.path.exists(source):
+            print(f"⚠️ {filename} not found, skipping")
+            continue
+        path = os.path.join(corpus_dir, filename)
+        shutil.copyfile(source, path)
+        documents.append({'name': os.path.splitext(filename)[0], 'kind': 'checked_in', 'path': path})
+
+    for name, kinds in GENERATED_DOCUMENTS.items():
+        path = os.path.join(corpus_dir, f'{name}.pdf')
+        if not os.path.exists(path):
+            generate_pdf(path, kinds)
+        documents.append({'name': name, 'kind': '+'.join(sorted(set(kinds))), 'path': path})
+
+    if only:
+        documents = [document for document in documents if document['name'] in only]
+    for document in documents:
+        with fitz.open(document['path']) as doc:
+            document['pages'] = doc.page_count
+        document['bytes'] = os.path.getsize(document['path'])
+    return documents
+
+class RSSSampler:
+    """Track the peak RSS (MB) of a set of processes while a request runs"""
+
+    def __init__(self, get_processes, interval=0.02):
+        self.get_processes = get_processes
+        self.interval = interval
+        self.peak_mb = 0
+
+    def current_mb(self):
+        total = 0
+        for process in self.get_processes():
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                continue
+        return total // (1024 * 1024)
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = self.current_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, self.current_mb())
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self.current_mb())
+        return False
+
+class InProcessTarget:
+    """Drive docling_service's Flask app through its test client"""
+    name = 'inprocess'
+
+    def __init__(self, env):
+        os.environ.update(env)
+        sys.path.insert(0, REPO_DIR)
+        import docling_service
+        self.service = docling_service
+        self.client = docling_service.app.test_client()
+
+    def processes(self):
+        return [psutil.Process()]
+
+    def upload(self, path, fields):
+        with open(path, 'rb') as f:
+            response = self.client.post('/upload', data=dict(fields, file=(f, os.path.basename(path))))
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+class GunicornTarget:
+    """Start a local gunicorn with the repo's gunicorn.conf.py and drive it over HTTP"""
+    name = 'gunicorn'
+
+    def __init__(self, env, workers=1, startup_timeout=120):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'docling_service:app', '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', '--timeout', '600'],
+            cwd=REPO_DIR,
+            env=dict(os.environ, **env, WEB_CONCURRENCY=str(workers)),
+        )
+        self.session = requests.Session()
+        deadline = time.time() + startup_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with status {self.process.returncode}')
+            try:
+                if self.session.get(f'{self.base_url}/healthz', timeout=2).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        self.close()
+        raise RuntimeError('gunicorn did not become ready in time')
+
+    def processes(self):
+        try:
+            master = psutil.Process(self.process.pid)
+            return [master] + master.children()
+        except psutil.Error:
+            return []
+
+    def upload(self, path, fields):
+        with open(path, 'rb') as f:
+            response = self.session.post(f'{self.base_url}/upload', data=fields,
+                                         files={'file': (os.path.basename(path), f, 'application/pdf')},
+                                         timeout=900)
+        return response.status_code, response.content
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+def run_document(target, document, repeats, fields):
+    """Upload one document ``repeats`` times and summarise the runs"""
+    runs = []
+    for _ in range(repeats):
+        with RSSSampler(target.processes) as sampler:
+            start_time = time.perf_counter()
+            status, body = target.upload(document['path'], fields)
+            latency = time.perf_counter() - start_time
+
+        run = {
+            'status': status,
+            'latency_seconds': round(latency, 4),
+            'rss_before_mb': sampler.start_mb,
+            'peak_rss_mb': sampler.peak_mb,
+            'response_bytes': len(body),
+        }
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = {}
+        if status == 200 and payload.get('success'):
+            run['output_chars'] = len(payload.get('content', ''))
+            run['conversion_seconds'] = payload.get('metadata', {}).get('conversion_seconds')
+            run['docling_pages'] = payload.get('metadata', {}).get('docling_pages', 0)
+        else:
+            run['error'] = payload.get('error', body[:200].decode('utf-8', 'replace'))
+        runs.append(run)
+
+    ok_runs = [run for run in runs if 'error' not in run]
+    result = {key: document[key] for key in ('name', 'kind', 'pages', 'bytes')}
+    result['runs'] = runs
+    if ok_runs:
+        latency = statistics.median(run['latency_seconds'] for run in ok_runs)
+        result.update({
+            'latency_seconds': round(latency, 4),
+            'latency_min_seconds': min(run['latency_seconds'] for run in ok_runs),
+            'pages_per_second': round(document['pages'] / latency, 3) if latency else None,
+            'peak_rss_mb': max(run['peak_rss_mb'] for run in ok_runs),
+            'peak_rss_delta_mb': max(run['peak_rss_mb'] - run['rss_before_mb'] for run in ok_runs),
+            'output_chars': ok_runs[-1]['output_chars'],
+            'response_bytes': ok_runs[-1]['response_bytes'],
+        })
+    else:
+        result['error'] = runs[-1].get('error')
+    return result
+
+def compare_with_baseline(report, baseline, threshold):
+    """Per-document latency ratio against a baseline run; returns the regressions"""
+    baseline_documents = {document['name']: document for document in baseline.get('documents', [])}
+    regressions = []
+    for document in report['documents']:
+        previous = baseline_documents.get(document['name'])
+        if not previous or not previous.get('latency_seconds') or not document.get('latency_seconds'):
+            continue
+        ratio = document['latency_seconds'] / previous['latency_seconds']
+        document['baseline_latency_seconds'] = previous['latency_seconds']
+        document['latency_ratio'] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(document['name'])
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark for docling_service')
+    parser.add_argument('--mode', choices=['inprocess', 'gunicorn'], default='inprocess')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers (gunicorn mode)')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per document (median is reported)')
+    parser.add_argument('--warmup', action=argparse.BooleanOptionalAction, default=True,
+                        help='convert one document first so model loading is not measured')
+    parser.add_argument('--fast-path', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--only', nargs='*', help='document names to run')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'docling_bench_corpus'))
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed latency increase (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    documents = build_corpus(args.corpus_dir, args.only)
+    print(f"📚 Corpus: {len(documents)} documents in {args.corpus_dir}", file=sys.stderr)
+
+    data_dir = tempfile.mkdtemp(prefix='docling_bench_')
+    env = {
+        'DOCLING_DATA_DIR': data_dir,
+        'DOCLING_CACHE_MAX_MB': '0',     # every run converts
+        'DOCLING_JOB_WORKERS': '0',
+    }
+    fields = {'fast_path': 'true' if args.fast_path else 'false'}
+
+    target = InProcessTarget(env) if args.mode == 'inprocess' else GunicornTarget(env, args.workers)
+    try:
+        if args.warmup and documents:
+            print("🔥 Warm-up conversion...", file=sys.stderr)
+            target.upload(documents[0]['path'], fields)
+
+        results = []
+        for document in documents:
+            print(f"⏱️ {document['name']} ({document['pages']} pages)...", file=sys.stderr)
+            result = run_document(target, document, args.repeats, fields)
+            if 'error' in result:
+                print(f"❌ {document['name']}: {result['error']}", file=sys.stderr)
+            else:
+                print(f"✅ {document['name']}: {result['latency_seconds']}s, "
+                      f"{result['pages_per_second']} pages/s, peak {result['peak_rss_mb']} MB", file=sys.stderr)
+            results.append(result)
+    finally:
+        target.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'mode': target.name,
+            'workers': args.workers if args.mode == 'gunicorn' else 1,
+            'repeats': args.repeats,
+            'fast_path': args.fast_path,
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'documents': results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(report, json.load(f), args.threshold)
+        report['regressions'] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"💾 Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if regressions:
+        print(f"❌ Slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
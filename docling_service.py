@@ -6,173 +6,4179 @@ A simplified Python microservice using Docling for PDF text extraction
 
 import os
 import sys
+import re
+import json
+import time
+import hashlib
 import logging
 import tempfile
 import gc
-from flask import Flask, request, jsonify
+import uuid
+import sqlite3
+import threading
+import itertools
+import heapq
+import math
+import mimetypes
+import zlib
+import importlib
+import cProfile
+import csv
+import html
+import io
+import zipfile
+import pstats
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager, nullcontext
+from collections import OrderedDict
+from functools import lru_cache
+from types import SimpleNamespace
+from html.parser import HTMLParser
+
+_import_started = time.perf_counter()  # Start of the boot latency report (/startup)
+
+from flask import Flask, Request, Response, g, has_request_context, request, jsonify, send_file, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
 import requests
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Initialize Flask app
+app = Flask(__name__)
+CORS(app)  # Enable CORS for React Native
+
+# PyTorch is only imported (by Docling) when the converter is created; this
+# must be set before that happens
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "max_split_size_mb:64")
+
+# Working directory for on-disk state (extraction cache, ...)
+DATA_DIR = os.environ.get('DOCLING_DATA_DIR', os.path.join(tempfile.gettempdir(), 'docling_service'))
+
+# Extraction cache settings
+CACHE_DIR = os.environ.get('DOCLING_CACHE_DIR', os.path.join(DATA_DIR, 'cache'))
+CACHE_MAX_BYTES = int(os.environ.get('DOCLING_CACHE_MAX_MB', '512')) * 1024 * 1024
+CACHE_TTL_SECONDS = int(os.environ.get('DOCLING_CACHE_TTL_HOURS', '168')) * 3600
+CACHE_SCHEMA_VERSION = 2  # 2: entries stored compressed (.jz)
+
+# Exports of stored extractions (GET /documents/<result_id>/export), rendered
+# from the stored DoclingDocument and memoized next to the cache entry
+EXPORT_FORMATS = {
+    'markdown': 'text/markdown',
+    'text': 'text/plain',
+    'html': 'text/html',
+    'json': 'application/json',
+    'tables_csv': 'text/csv',
+    'outline': 'application/json',
+}
+EXPORT_VERSION = 2  # bump when a renderer changes (2: HTML title no longer memoized)
+
+# Upload spooling settings
+SPOOL_DIR = os.environ.get('DOCLING_SPOOL_DIR', os.path.join(DATA_DIR, 'spool'))
+MAX_UPLOAD_BYTES = int(os.environ.get('DOCLING_MAX_UPLOAD_MB', '50')) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 256 * 1024
+MULTIPART_PEEK_BYTES = 8 * 1024  # read ahead for the file part's name (admission precheck)
+# Raw bodies of these types are parsed natively (without Docling)
+NATIVE_UPLOAD_MIMETYPES = ('text/html', 'text/markdown', 'text/csv', 'text/plain',
+                           'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                           'application/vnd.openxmlformats-officedocument.presentationml.presentation')
+RAW_UPLOAD_MIMETYPES = ('application/pdf', 'application/octet-stream', 'image/png', 'image/jpeg',
+                        'image/tiff') + NATIVE_UPLOAD_MIMETYPES
+
+# Remote PDF downloads (pooled session, spooled to disk). Downloaded files are
+# kept in a content-addressed store with their ETag/Last-Modified so unchanged
+# URLs are revalidated with a conditional request instead of downloaded again
+DOWNLOAD_DIR = os.environ.get('DOCLING_DOWNLOAD_DIR', os.path.join(DATA_DIR, 'downloads'))
+DOWNLOAD_STORE_MAX_BYTES = int(os.environ.get('DOCLING_DOWNLOAD_CACHE_MB', '256')) * 1024 * 1024
+DOWNLOAD_MAX_BYTES = int(os.environ.get('DOCLING_DOWNLOAD_MAX_MB', '100')) * 1024 * 1024
+DOWNLOAD_DEADLINE_SECONDS = int(os.environ.get('DOCLING_DOWNLOAD_DEADLINE', '120'))
+DOWNLOAD_TIMEOUT = (5, 30)              # connect / read timeout of each request
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_PARALLEL_MIN_BYTES = 8 * 1024 * 1024  # files this large are fetched as parallel ranges
+DOWNLOAD_PARALLEL_PARTS = 4
+DOWNLOAD_POOL_SIZE = 16
+# Query parameters that only sign a URL (Supabase/S3/GCS); validators are
+# content based, so the same object reached with a new signature can still be revalidated
+SIGNED_URL_PARAMS = ('token', 'signature', 'expires', 'x-amz-signature', 'x-amz-date', 'x-amz-credential',
+                     'x-amz-expires', 'x-amz-security-token', 'x-goog-signature', 'x-goog-date',
+                     'x-goog-credential', 'x-goog-expires')
+
+# gunicorn kills a worker whose request runs longer than this (gunicorn.conf.py)
+WORKER_TIMEOUT_SECONDS = int(os.environ.get('DOCLING_WORKER_TIMEOUT', '120'))
+
+# Single-flight: concurrent requests for the same cache key wait for the first
+# conversion instead of starting their own. A request waits at most
+# FLIGHT_WAIT_SECONDS and never past its own deadline (the worker timeout less
+# FLIGHT_ANSWER_SECONDS to answer); if the first conversion is still running
+# then, it gets a 503 with Retry-After rather than converting a second time
+FLIGHT_DIR = os.path.join(DATA_DIR, 'flights')
+FLIGHT_WAIT_SECONDS = int(os.environ.get('DOCLING_FLIGHT_WAIT', str(WORKER_TIMEOUT_SECONDS * 3 // 4)))
+FLIGHT_ANSWER_SECONDS = 5
+FLIGHT_POLL_SECONDS = 0.1
+
+# Tiered extraction: pages with a clean text layer are read with PyMuPDF,
+# only scanned/complex pages go through the Docling layout/OCR pipeline
+FAST_PATH_ENABLED = os.environ.get('DOCLING_FAST_PATH', 'true').lower() == 'true'
+FAST_PATH_MIN_CHARS = 20           # fewer characters than this = no usable text layer
+FAST_PATH_MAX_IMAGE_RATIO = 0.4    # share of the page covered by images
+FAST_PATH_MAX_BAD_GLYPH_RATIO = 0.1  # replacement/private-use/control characters
+FAST_PATH_MAX_RULING_LINES = 12    # straight lines/rects, a sign of tables or forms
+FAST_PATH_VERSION = 1              # bump when the classifier or fast extractor changes
+
+# Input formats are detected from their leading bytes. DOCX, PPTX, HTML,
+# markdown, CSV and plain text are parsed natively (no Docling, no admission);
+# images are wrapped in a one-page PDF so they go through the OCR path
+SOURCE_FORMATS = ('pdf', 'image', 'docx', 'pptx', 'html', 'markdown', 'csv', 'text')
+NATIVE_PARSER_VERSION = 1          # bump when a native parser's output changes
+FORMAT_SNIFF_BYTES = 64 * 1024
+TEXT_FORMAT_EXTENSIONS = {'.md': 'markdown', '.markdown': 'markdown', '.csv': 'csv', '.tsv': 'csv',
+                          '.txt': 'text', '.html': 'html', '.htm': 'html'}
+# A file named like this must carry the matching signature (an HTML error page
+# saved as report.pdf is rejected instead of being extracted as text)
+BINARY_FORMAT_EXTENSIONS = {'.pdf': 'pdf', '.docx': 'docx', '.pptx': 'pptx', '.png': 'image', '.jpg': 'image',
+                            '.jpeg': 'image', '.tif': 'image', '.tiff': 'image', '.gif': 'image', '.bmp': 'image',
+                            '.webp': 'image'}
+
+# Streaming responses convert Docling pages in groups of this size so the
+# client sees fragments while the rest of the document is still converting
+STREAM_DOCLING_BATCH_PAGES = int(os.environ.get('DOCLING_STREAM_BATCH_PAGES', '4'))
+
+# Batch extraction settings: conversions in parallel (each holds a Docling
+# pipeline's working memory) and concurrent downloads feeding them
+BATCH_MAX_WORKERS = int(os.environ.get('DOCLING_BATCH_MAX_WORKERS', '1'))
+BATCH_DOWNLOAD_WORKERS = int(os.environ.get('DOCLING_BATCH_DOWNLOAD_WORKERS', '4'))
+BATCH_MAX_ITEMS = int(os.environ.get('DOCLING_BATCH_MAX_ITEMS', '50'))
+# Items not started by then are reported as failed so the response beats the worker timeout
+BATCH_DEADLINE_SECONDS = int(os.environ.get('DOCLING_BATCH_DEADLINE', str(WORKER_TIMEOUT_SECONDS * 3 // 4)))
+
+# Background job queue settings
+JOBS_DB_PATH = os.environ.get('DOCLING_JOBS_DB', os.path.join(DATA_DIR, 'jobs.db'))
+JOBS_DIR = os.path.join(DATA_DIR, 'jobs')
+JOB_WORKERS = int(os.environ.get('DOCLING_JOB_WORKERS', '1'))
+JOB_LEASE_SECONDS = int(os.environ.get('DOCLING_JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('DOCLING_JOB_MAX_ATTEMPTS', '3'))
+JOB_RETENTION_SECONDS = int(os.environ.get('DOCLING_JOB_RETENTION_HOURS', '24')) * 3600
+
+# Admission control: conversions are admitted against a per-process memory
+# budget (default 80% of the container limit split across gunicorn workers)
+ADMISSION_BUDGET_MB = int(os.environ['DOCLING_MEMORY_BUDGET_MB']) if os.environ.get('DOCLING_MEMORY_BUDGET_MB') else None
+ADMISSION_QUEUE_TIMEOUT = int(os.environ.get('DOCLING_ADMISSION_TIMEOUT', '30'))
+ADMISSION_MAX_WAITING = int(os.environ.get('DOCLING_ADMISSION_MAX_WAITING', '4'))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get('DOCLING_ADMISSION_RETRY_AFTER', '15'))
+ADMISSION_BASE_MB = 150            # pipeline buffers of any conversion
+ADMISSION_BYTES_FACTOR = 3         # MB per MB of PDF (parsed objects, page streams)
+ADMISSION_PAGE_MB = 40             # per page being laid out (images double it)
+ADMISSION_OUTPUT_MB_PER_PAGE = 0.5  # DoclingDocument and markdown per page
+DOCLING_PAGE_BATCH = 4             # pages Docling holds in memory at once
+
+# Reject bodies whose declared size is over the limit before reading them
+# (the slack covers multipart boundaries and form fields)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024
+
+# Chunking (/chunk and the ``chunk`` option): approximate token budget per chunk
+CHUNK_MAX_TOKENS = int(os.environ.get('DOCLING_CHUNK_MAX_TOKENS', '512'))
+CHUNK_MIN_TOKENS = 32
+CHUNK_LIMIT_TOKENS = 8192
+
+# Per-user vector index for /search: embeddings from DOCLING_EMBEDDING_MODEL
+# (sentence-transformers, CPU) or signed feature hashing when unset/unavailable
+INDEX_DIR = os.environ.get('DOCLING_INDEX_DIR', os.path.join(DATA_DIR, 'index'))
+EMBEDDING_MODEL = os.environ.get('DOCLING_EMBEDDING_MODEL', '')
+EMBEDDING_DIM = int(os.environ.get('DOCLING_EMBEDDING_DIM', '512'))
+SEARCH_MAX_K = 100
+INDEX_CACHE_SIZE = int(os.environ.get('DOCLING_INDEX_CACHE_SIZE', '32'))  # users whose indexes stay open
+
+# Keyword search (/search?mode=keyword): BM25 over an on-disk inverted index
+BM25_K1 = 1.2
+BM25_B = 0.75
+KEYWORD_MAX_SEGMENTS = 8
+KEYWORD_MERGE_SEGMENTS = 4  # smallest segments merged together at a time
+KEYWORD_SNIPPET_CHARS = 240
+USER_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,128}')
+
+# Response compression (negotiated from Accept-Encoding): zstd and br are
+# offered when the zstandard/brotli packages are installed, gzip always
+COMPRESS_MIN_BYTES = int(os.environ.get('DOCLING_COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_SLICE_BYTES = 256 * 1024
+COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/event-stream', 'text/plain', 'text/markdown',
+                      'text/html', 'text/csv')
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 5
+
+# Histogram bounds (seconds) for the /metrics latency series
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Per-request profiling (``profile`` option / ``X-Profile`` header)
+PROFILES_DIR = os.path.join(DATA_DIR, 'profiles')
+PROFILE_MAX_ARTIFACTS = int(os.environ.get('DOCLING_PROFILE_MAX_ARTIFACTS', '20'))
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_RSS_SAMPLE_SECONDS = 0.05
+
+# Load the converter and model weights at import time (in the gunicorn master
+# when preload_app is on, see gunicorn.conf.py) so forked workers share them
+PRELOAD_MODELS = os.environ.get('DOCLING_PRELOAD', 'false').lower() == 'true'
+
+# Quality tiers (``quality`` option) mapped to Docling PDF pipeline settings:
+# fast = text layer and layout only, balanced = OCR and the fast TableFormer,
+# full = OCR and the accurate TableFormer (the stock DocumentConverter pipeline)
+QUALITY_PRESETS = {
+    'fast': {'ocr': False, 'table_mode': None},
+    'balanced': {'ocr': True, 'table_mode': 'fast'},
+    'full': {'ocr': True, 'table_mode': 'accurate'},
+}
+# Rendering picture images costs memory and CPU on every page and neither the
+# responses nor the stored documents keep them, so the full tier only renders
+# them (at 2x) when DOCLING_PICTURE_IMAGES=true
+PICTURE_IMAGES = os.environ.get('DOCLING_PICTURE_IMAGES', 'false').lower() == 'true'
+PICTURE_IMAGES_SCALE = 2.0
+QUALITY_PAGE_MB_FACTOR = {'fast': 0.5, 'balanced': 0.8, 'full': 1.0}  # admission cost per page
+DEFAULT_QUALITY = os.environ.get('DOCLING_QUALITY', 'full')
+if DEFAULT_QUALITY not in QUALITY_PRESETS:
+    raise ValueError(f"DOCLING_QUALITY must be one of {', '.join(QUALITY_PRESETS)}")
+CONVERTER_CACHE_SIZE = int(os.environ.get('DOCLING_CONVERTER_CACHE_SIZE', '2'))  # converters kept per process
+
+# Warm the converter in a background thread when a worker boots by converting
+# a tiny built-in PDF; /ready reports 503 until that has finished. A failed
+# warm-up is retried (after 30s, then 60s, ...) up to DOCLING_WARMUP_ATTEMPTS times
+WARMUP_ENABLED = os.environ.get('DOCLING_WARMUP', 'true').lower() == 'true'
+WARMUP_ATTEMPTS = int(os.environ.get('DOCLING_WARMUP_ATTEMPTS', '3'))
+WARMUP_RETRY_SECONDS = 30
+READY_RETRY_AFTER_SECONDS = 5
+
+# Simulated converter for load testing the Flask/gunicorn layer without
+# loading Docling: each page costs a fixed time and amount of memory
+SIMULATE_CONVERTER = os.environ.get('DOCLING_SIMULATE', 'false').lower() == 'true'
+SIMULATE_PAGE_SECONDS = float(os.environ.get('DOCLING_SIMULATE_PAGE_SECONDS', '0.5'))
+SIMULATE_PAGE_MB = float(os.environ.get('DOCLING_SIMULATE_PAGE_MB', '20'))
+
+class Counter:
+    """Counter with optional labels, rendered in the Prometheus text format"""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+class Histogram(Counter):
+    """Cumulative histogram with fixed upper bounds"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(key, {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['count'] += 1
+            series['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def total(self):
+        with self._lock:
+            return sum(series['sum'] for series in self._values.values())
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in self._values.items():
+                labels = dict(zip(self.labelnames, key))
+                for bound, count in zip(self.buckets, series['buckets']):
+                    samples.append((f'{self.name}_bucket', dict(labels, le=str(bound)), count))
+                samples.append((f'{self.name}_bucket', dict(labels, le='+Inf'), series['count']))
+                samples.append((f'{self.name}_sum', labels, series['sum']))
+                samples.append((f'{self.name}_count', labels, series['count']))
+        return samples
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        return [] if value is None else [(self.name, {}, value)]
+
+def format_metric_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+def render_metrics(metrics):
+    """Render metrics in the Prometheus text exposition format (0.0.4)"""
+    lines = []
+    for metric in metrics:
+        try:
+            samples = metric.samples()
+        except Exception as e:
+            logger.warning(f"⚠️ Metric {metric.name} unavailable: {e}")
+            continue
+        lines.append(f'# HELP {metric.name} {metric.help_text}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in samples:
+            if labels:
+                label_text = ','.join(
+                    '{}="{}"'.format(label, str(label_value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for label, label_value in labels.items())
+                name = f'{name}{{{label_text}}}'
+            lines.append(f'{name} {format_metric_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+DOWNLOAD_SECONDS = Histogram('docling_download_seconds', 'Time to download a remote PDF', ['endpoint'])
+CONVERT_SECONDS = Histogram('docling_convert_seconds', 'Time spent in converter.convert', ['endpoint'])
+EXPORT_SECONDS = Histogram('docling_export_seconds', 'Time spent in export_to_markdown', ['endpoint'])
+SERIALIZE_SECONDS = Histogram('docling_serialize_seconds', 'JSON serialization time of responses', ['endpoint'])
+REQUEST_SECONDS = Histogram('docling_request_seconds', 'Request handling time', ['endpoint'])
+EXTRACTIONS = Counter('docling_extractions_total', 'Extractions by source and outcome (success or error class)',
+                      ['source', 'outcome'])
+DOWNLOADS = Counter('docling_downloads_total', 'Remote PDF downloads by outcome', ['outcome'])
+DOWNLOADED_BYTES = Counter('docling_downloaded_bytes_total', 'Bytes downloaded from remote PDF URLs')
+NATIVE_CONVERSIONS = Counter('docling_native_conversions_total', 'Non-PDF documents parsed without Docling',
+                             ['format'])
+ADMISSION_REJECTED = Counter('docling_admission_rejected_total', 'Conversions rejected by admission control',
+                             ['status'])
+COALESCED = Counter('docling_coalesced_extractions_total', 'Extractions served by a concurrent identical conversion')
+CONVERSIONS = Counter('docling_conversions_total', 'Conversions run (cache misses)')
+PAGES_CONVERTED = Counter('docling_pages_converted_total', 'Pages converted')
+BYTES_CONVERTED = Counter('docling_bytes_converted_total', 'PDF bytes converted')
+CONVERSION_SECONDS = Counter('docling_conversion_seconds_total', 'Wall time spent converting')
+_converter_init_seconds = None
+
+_profile_context = threading.local()
+_profile_lock = threading.Lock()
+_stage_context = threading.local()  # endpoint label of work running outside a request
+
+def stage_endpoint():
+    """Endpoint label for stage metrics: the request's, else what the thread works for"""
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return getattr(_stage_context, 'endpoint', 'background')
+
+@contextmanager
+def timed_stage(name, histogram=None):
+    """Time a pipeline stage for /metrics and, when profiling, for the request breakdown"""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        if histogram is not None:
+            histogram.observe(elapsed, endpoint=stage_endpoint())
+        profiler = getattr(_profile_context, 'profiler', None)
+        if profiler is not None:
+            profiler.add_stage(name, elapsed)
+
+def record_extraction(source, error=None):
+    """Count one extraction outcome; failures are labelled with the error class"""
+    EXTRACTIONS.inc(source=source, outcome=type(error).__name__ if error is not None else 'success')
+
+def record_conversion(pdf_path, plan, entry):
+    """Feed the throughput counters after a conversion (cache miss)"""
+    metadata = entry['metadata']
+    if metadata.get('page_methods'):
+        pages = len(metadata['page_methods'])
+    else:
+        pages = len(plan['pages']) if plan['pages'] else (get_pdf_page_count(pdf_path) or 0)
+    CONVERSIONS.inc()
+    PAGES_CONVERTED.inc(pages)
+    BYTES_CONVERTED.inc(os.path.getsize(pdf_path))
+    CONVERSION_SECONDS.inc(metadata.get('conversion_seconds', 0.0))
+
+def timed_jsonify(body):
+    """``jsonify`` that records serialization time for the current endpoint"""
+    with SERIALIZE_SECONDS.time(endpoint=request.endpoint):
+        return jsonify(body)
+
+class SimulatedDocument:
+    """Stand-in for a DoclingDocument built from the PDF's text layer"""
+
+    def __init__(self, page_texts):
+        self.pages = page_texts
+
+    def export_to_markdown(self, page_no=None):
+        if page_no is not None:
+            return self.pages.get(page_no, '')
+        return '\n\n'.join(self.pages[page_no] for page_no in sorted(self.pages))
+
+class SimulatedConverter:
+    """Mimics ``DocumentConverter.convert`` with a configurable cost per page.
+
+    Sleeps ``page_seconds`` and holds ``page_mb`` of touched memory per page
+    (up to DOCLING_PAGE_BATCH pages at once, like the real pipeline), then
+    returns the PDF's text layer as markdown.
+    """
+
+    def __init__(self, page_seconds, page_mb):
+        self.page_seconds = page_seconds
+        self.page_mb = page_mb
+
+    def initialize_pipeline(self, input_format):
+        pass
+
+    def convert(self, source, page_range=None, **kwargs):
+        fitz = lazy_import('fitz')  # PyMuPDF
+        with fitz.open(source) as doc:
+            first, last = page_range or (1, doc.page_count)
+            page_numbers = range(first, min(last, doc.page_count) + 1)
+            page_texts = {page_no: doc[page_no - 1].get_text() for page_no in page_numbers}
+
+        held = []
+        for page_no in page_numbers:
+            if len(held) >= DOCLING_PAGE_BATCH:
+                held.pop(0)
+            held.append(b'\x01' * int(self.page_mb * 1024 * 1024))
+            time.sleep(self.page_seconds)
+        held.clear()
+
+        return SimpleNamespace(document=SimulatedDocument(page_texts), timings={})
+
+# Heavy modules are imported on first use so the worker binds its port fast;
+# first-import times are reported by /startup
+HEAVY_MODULES = ('docling', 'torch', 'transformers', 'sentence_transformers', 'numpy', 'fitz', 'PyPDF2')
+_lazy_import_seconds = {}
+
+def lazy_import(name):
+    """Import a module on first use, recording how long that first import took"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _lazy_import_seconds.setdefault(name, round(time.perf_counter() - start, 4))
+    return module
+
+def configure_torch():
+    """Inference-only PyTorch settings, applied once Docling has imported it"""
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return
+    torch.set_grad_enabled(False)  # Disable gradients for inference
+    workers = max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+# Lazy loading for Docling converter to reduce memory usage
+_converter = None  # DEFAULT_QUALITY converter
+_converter_error = None
+_converter_lock = threading.Lock()
+_quality_converters = OrderedDict()  # Other tiers, least recently used first
+
+def build_pdf_pipeline_options(quality):
+    """Docling PDF pipeline options for a QUALITY_PRESETS tier"""
+    from docling.datamodel.pipeline_options import PdfPipelineOptions, TableFormerMode
+    preset = QUALITY_PRESETS[quality]
+    options = PdfPipelineOptions()
+    options.do_ocr = preset['ocr']
+    options.do_table_structure = preset['table_mode'] is not None
+    if preset['table_mode'] is not None:
+        options.table_structure_options.mode = TableFormerMode(preset['table_mode'])
+    if PICTURE_IMAGES and quality == 'full':
+        options.generate_picture_images = True
+        options.images_scale = PICTURE_IMAGES_SCALE
+    return options
+
+def create_docling_converter(quality):
+    """A DocumentConverter whose PDF pipeline follows the ``quality`` preset"""
+    try:
+        document_converter = lazy_import('docling.document_converter')
+    except ImportError as e:
+        raise RuntimeError(f"Docling is not installed ({e}), install requirements.txt in the image")
+    configure_torch()
+    from docling.datamodel.base_models import InputFormat
+    return document_converter.DocumentConverter(format_options={
+        InputFormat.PDF: document_converter.PdfFormatOption(pipeline_options=build_pdf_pipeline_options(quality)),
+    })
+
+def get_converter(quality=None):
+    """Get or create the Docling converter for a quality tier.
+
+    The DEFAULT_QUALITY converter is a singleton (preloaded and warmed up);
+    each other tier holds its own layout/table models, so at most
+    CONVERTER_CACHE_SIZE converters are kept, dropping the least recently
+    used tier first. The simulated converter serves every tier.
+    """
+    global _converter, _converter_error, _converter_init_seconds
+    
+    quality = quality or DEFAULT_QUALITY
+    if _converter is not None and (quality == DEFAULT_QUALITY or SIMULATE_CONVERTER):
+        return _converter
+    
+    # Request, job and warm-up threads may all get here first: initialize once
+    with _converter_lock:
+        if _converter_error:
+            raise _converter_error
+        
+        if _converter is None and SIMULATE_CONVERTER:
+            logger.info(f"🧪 Using simulated converter ({SIMULATE_PAGE_SECONDS}s, {SIMULATE_PAGE_MB} MB per page)")
+            _converter = SimulatedConverter(SIMULATE_PAGE_SECONDS, SIMULATE_PAGE_MB)
+        
+        if quality != DEFAULT_QUALITY and not SIMULATE_CONVERTER:
+            converter = _quality_converters.pop(quality, None)
+            if converter is None:
+                logger.info(f"🔄 Initializing Docling DocumentConverter ({quality} quality)...")
+                converter = create_docling_converter(quality)
+            _quality_converters[quality] = converter
+            while _quality_converters and len(_quality_converters) >= CONVERTER_CACHE_SIZE:
+                evicted, _ = _quality_converters.popitem(last=False)
+                logger.info(f"♻️ Dropped the {evicted} quality converter")
+                gc.collect()
+            return converter
+        
+        if _converter is None:
+            try:
+                logger.info(f"🔄 Initializing Docling DocumentConverter ({quality} quality)...")
+                init_start = time.time()
+                
+                # Initialize converter
+                _converter = create_docling_converter(quality)
+                _converter_init_seconds = time.time() - init_start
+                logger.info("✅ Docling DocumentConverter initialized successfully")
+                
+            except Exception as e:
+                error_msg = f"Failed to initialize Docling converter: {str(e)}"
+                logger.error(f"❌ {error_msg}")
+                _converter_error = Exception(error_msg)
+                raise _converter_error
+    
+    return _converter
+
+_preload_stats = None
+
+def get_process_rss_mb():
+    """Resident set size of this process in MB (None without psutil)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss // (1024 * 1024)
+    except ImportError:
+        return None
+
+def preload_models():
+    """Load the converter and its model weights before gunicorn forks workers.
+
+    Builds the PDF pipeline (which loads the layout/table/OCR weights) without
+    converting anything, then freezes the GC so the collector never writes to
+    these objects in the workers and their pages stay shared copy-on-write.
+    """
+    global _preload_stats
+    start_time = time.time()
+    rss_before = get_process_rss_mb()
+
+    converter = get_converter()
+    try:
+        from docling.datamodel.base_models import InputFormat
+        converter.initialize_pipeline(InputFormat.PDF)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not initialize the PDF pipeline during preload: {e}")
+
+    gc.collect()
+    gc.freeze()
+
+    rss_after = get_process_rss_mb()
+    _preload_stats = {
+        'pid': os.getpid(),
+        'seconds': round(time.time() - start_time, 3),
+        'models_rss_mb': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+    }
+    logger.info(f"✅ Preloaded Docling models in {_preload_stats['seconds']}s ({_preload_stats['models_rss_mb']} MB)")
+
+def build_warmup_pdf():
+    """A one-page PDF with a line of text, enough to run every pipeline stage once"""
+    stream = b'BT /F1 18 Tf 72 720 Td (Docling warm-up page) Tj ET'
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+        b'/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream),
+    ]
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref_offset = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b'%010d 00000 n \n' % offset
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+    return bytes(pdf)
+
+# Readiness is replaced as a whole so probes read a consistent snapshot
+_readiness = {'state': 'starting' if WARMUP_ENABLED else 'lazy', 'error': None,
+              'warmup_seconds': None, 'attempts': 0, 'retrying': False, 'since': time.time()}
+_warmup_pid = None
+_warmup_lock = threading.Lock()
+
+def set_readiness(state, **fields):
+    global _readiness
+    _readiness = dict(_readiness, state=state, since=time.time(), **fields)
+
+def is_ready():
+    """Ready once warmed up, or always when warm-up is disabled (converter loads lazily)"""
+    return _readiness['state'] in ('ready', 'lazy')
+
+def warm_up_converter():
+    """Create the converter and convert the built-in PDF, retrying up to WARMUP_ATTEMPTS times"""
+    global _converter_error
+    pdf_data = build_warmup_pdf()
+    for attempt in range(1, WARMUP_ATTEMPTS + 1):
+        set_readiness('warming', attempts=attempt, retrying=False)
+        start_time = time.time()
+        fd, pdf_path = tempfile.mkstemp(suffix='.pdf', prefix='docling_warmup_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pdf_data)
+            # Admitted like any conversion so a request arriving meanwhile is accounted for
+            with get_admission_controller().admit(estimate_conversion_mb(len(pdf_data), 1), None):
+                get_converter().convert(pdf_path)
+            get_admission_controller().record_idle_baseline()
+            set_readiness('ready', warmup_seconds=round(time.time() - start_time, 3), error=None)
+            logger.info(f"🔥 Converter warmed up in {_readiness['warmup_seconds']}s")
+            return
+        except Exception as e:
+            retrying = attempt < WARMUP_ATTEMPTS
+            set_readiness('failed', warmup_seconds=round(time.time() - start_time, 3), error=str(e),
+                          retrying=retrying)
+            if not retrying:
+                logger.error(f"❌ Converter warm-up failed after {attempt} attempts: {e}")
+                return
+            delay = WARMUP_RETRY_SECONDS * 2 ** (attempt - 1)
+            logger.warning(f"⚠️ Converter warm-up failed (attempt {attempt}), retrying in {delay}s: {e}")
+        finally:
+            remove_file(pdf_path)
+        time.sleep(delay)
+        with _converter_lock:
+            _converter_error = None  # Let get_converter try again
+
+def ensure_warmup():
+    """Start the warm-up thread once per process (gunicorn post_worker_init or first request)"""
+    global _warmup_pid
+    if not WARMUP_ENABLED or _warmup_pid == os.getpid():
+        return
+    with _warmup_lock:
+        if _warmup_pid == os.getpid():
+            return
+        _warmup_pid = os.getpid()
+        threading.Thread(target=warm_up_converter, name='converter-warmup', daemon=True).start()
+
+def describe_process_memory(process):
+    """RSS/USS/PSS/shared figures (MB) for a psutil process"""
+    info = process.memory_full_info()
+    return {
+        'pid': process.pid,
+        'rss_mb': info.rss // (1024 * 1024),
+        'uss_mb': info.uss // (1024 * 1024),
+        # PSS splits shared pages between the processes using them (Linux only)
+        'pss_mb': getattr(info, 'pss', 0) // (1024 * 1024),
+        'shared_mb': getattr(info, 'shared', 0) // (1024 * 1024),
+    }
+
+def get_memory_report():
+    """Memory of this worker and, under gunicorn, of the master and all its workers.
+
+    ``total_pss_mb`` is what the instance really uses; ``total_rss_mb`` is
+    what it would use if nothing were shared between processes.
+    """
+    import psutil
+
+    current = psutil.Process()
+    report = {
+        'worker': describe_process_memory(current),
+        'preloaded': _preload_stats is not None,
+        'preload': _preload_stats,
+        'gc_frozen_objects': gc.get_freeze_count(),
+    }
+
+    master = current.parent()
+    try:
+        is_gunicorn = master is not None and 'gunicorn' in ' '.join(master.cmdline())
+    except psutil.Error:
+        is_gunicorn = False
+    if not is_gunicorn:
+        return report
+
+    processes = []
+    for process in [master] + master.children():
+        try:
+            processes.append(describe_process_memory(process))
+        except psutil.Error:
+            continue  # Worker exited or is not readable
+
+    report['master'] = processes[0] if processes else None
+    report['workers'] = processes[1:]
+    report['total_rss_mb'] = sum(item['rss_mb'] for item in processes)
+    report['total_pss_mb'] = sum(item['pss_mb'] for item in processes)
+    report['shared_savings_mb'] = report['total_rss_mb'] - report['total_pss_mb']
+    return report
+
+class AdmissionRejected(Exception):
+    """A conversion was not admitted under the memory budget"""
+
+    def __init__(self, message, status=429, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def get_memory_limit_mb():
+    """Memory available to the container: the cgroup limit if set, else total RAM"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value) // (1024 * 1024)
+        except OSError:
+            continue
+    try:
+        import psutil
+        return psutil.virtual_memory().total // (1024 * 1024)
+    except ImportError:
+        return None
+
+class AdmissionController:
+    """Admits conversions only while their estimated memory fits the budget.
+
+    The budget covers this process: the RSS measured while idle (models and
+    caches) plus the estimates of the conversions in flight. A conversion
+    that does not fit waits for others to finish, up to ``timeout``; when
+    too many are already waiting, or the wait times out, it is rejected
+    with 429 and a Retry-After hint. A conversion that could never fit,
+    even next to the idle baseline recorded after warm-up, is rejected with
+    413. Otherwise, when nothing is in flight the next conversion is always
+    admitted: the allocator keeps RSS high after a large conversion, and
+    that must not turn an idle worker away.
+    """
+
+    def __init__(self, budget_mb, max_waiting):
+        self.budget_mb = budget_mb
+        self.max_waiting = max_waiting
+        self.reserved_mb = 0.0
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.baseline_mb = get_process_rss_mb() or 0
+        self.idle_baseline_mb = self.baseline_mb  # Models loaded, nothing in flight
+        self._condition = threading.Condition()
+
+    def record_idle_baseline(self):
+        """Remember the RSS of the warmed-up, idle process ("can never fit" is judged against it)"""
+        with self._condition:
+            if self.active == 0:
+                self.idle_baseline_mb = self.baseline_mb = get_process_rss_mb() or self.baseline_mb
+
+    def _rejection(self, error):
+        """Count a rejection (``stats()`` and /metrics) and return it to be raised"""
+        self.rejected += 1
+        ADMISSION_REJECTED.inc(status=error.status)
+        return error
+
+    def _reject_if_never_fits(self, cost_mb):
+        if cost_mb > self.budget_mb - self.idle_baseline_mb:
+            raise self._rejection(AdmissionRejected(
+                f'Document needs ~{int(cost_mb)} MB, more than this instance can provide', status=413))
+
+    def _fits(self, cost_mb):
+        return self.baseline_mb + self.reserved_mb + cost_mb <= self.budget_mb
+
+    def precheck(self, cost_mb, queued=True):
+        """Reject early (before reading a request body) what cannot be admitted soon.
+
+        ``queued=False`` only rejects what could never fit (background jobs wait).
+        """
+        self._reject_if_never_fits(cost_mb)
+        if queued and self.waiting >= self.max_waiting and not self._fits(cost_mb):
+            raise self._rejection(
+                AdmissionRejected('Server is busy, please retry', retry_after=ADMISSION_RETRY_AFTER_SECONDS))
+
+    def acquire(self, cost_mb, timeout=None):
+        """Reserve ``cost_mb``; ``timeout`` None waits as long as needed (background jobs)"""
+        with self._condition:
+            self._reject_if_never_fits(cost_mb)
+
+            if self.active == 0:
+                self.baseline_mb = get_process_rss_mb() or self.baseline_mb
+            elif not self._fits(cost_mb):
+                if timeout is not None and self.waiting >= self.max_waiting:
+                    raise self._rejection(
+                        AdmissionRejected('Server is busy, please retry', retry_after=ADMISSION_RETRY_AFTER_SECONDS))
+
+                deadline = None if timeout is None else time.time() + timeout
+                self.waiting += 1
+                try:
+                    while self.active and not self._fits(cost_mb):
+                        remaining = None if deadline is None else deadline - time.time()
+                        if remaining is not None and remaining <= 0:
+                            raise self._rejection(AdmissionRejected(
+                                'Server is busy, please retry', retry_after=ADMISSION_RETRY_AFTER_SECONDS))
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            self.reserved_mb += cost_mb
+            self.active += 1
+
+    def release(self, cost_mb):
+        with self._condition:
+            self.reserved_mb = max(0.0, self.reserved_mb - cost_mb)
+            self.active -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, cost_mb, timeout=None):
+        self.acquire(cost_mb, timeout)
+        try:
+            yield
+        finally:
+            self.release(cost_mb)
+
+    def stats(self):
+        return {
+            'budget_mb': self.budget_mb,
+            'baseline_mb': self.baseline_mb,
+            'idle_baseline_mb': self.idle_baseline_mb,
+            'reserved_mb': round(self.reserved_mb, 1),
+            'active': self.active,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+        }
+
+_admission_controller = None
+
+def get_admission_controller():
+    """Get or create the admission controller for this process"""
+    global _admission_controller
+    if _admission_controller is None:
+        budget_mb = ADMISSION_BUDGET_MB
+        if budget_mb is None:
+            limit_mb = get_memory_limit_mb()
+            workers = max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+            budget_mb = int(limit_mb * 0.8 / workers) if limit_mb else 2048
+        _admission_controller = AdmissionController(budget_mb, ADMISSION_MAX_WAITING)
+    return _admission_controller
+
+def inspect_pdf(pdf_path, pages=None, sample_size=20):
+    """Return ``(page_count, image_density)`` for the pages that will be converted.
+
+    Image density is the average share of the page area covered by images,
+    measured on up to ``sample_size`` evenly spaced pages.
+    """
+    try:
+        fitz = lazy_import('fitz')  # PyMuPDF
+    except ImportError:
+        return (len(pages) if pages else get_pdf_page_count(pdf_path)), 0.0
+
+    try:
+        with fitz.open(pdf_path) as doc:
+            selection = pages or list(range(1, doc.page_count + 1))
+            step = max(1, len(selection) // sample_size)
+            ratios = []
+            for page_no in selection[::step][:sample_size]:
+                page = doc[page_no - 1]
+                page_area = abs(page.rect) or 1.0
+                image_area = sum(abs(page.rect & image['bbox']) for image in page.get_image_info())
+                ratios.append(min(image_area / page_area, 1.0))
+            return len(selection), (sum(ratios) / len(ratios) if ratios else 0.0)
+    except Exception:
+        return (len(pages) if pages else None), 0.0
+
+def estimate_conversion_mb(size_bytes, page_count=None, image_density=0.0, page_factor=1.0):
+    """Rough peak memory (MB) of one conversion beyond the idle process.
+
+    Docling works through a few pages at a time, so the page term is capped
+    at DOCLING_PAGE_BATCH pages; image-heavy pages cost more (rasterized,
+    OCR) and ``page_factor`` scales it for lighter quality tiers. The parsed
+    PDF scales with the file size, the output with pages.
+    """
+    pages_in_flight = min(page_count or DOCLING_PAGE_BATCH, DOCLING_PAGE_BATCH)
+    return (
+        ADMISSION_BASE_MB
+        + size_bytes / (1024 * 1024) * ADMISSION_BYTES_FACTOR
+        + pages_in_flight * ADMISSION_PAGE_MB * (1 + image_density) * page_factor
+        + (page_count or 0) * ADMISSION_OUTPUT_MB_PER_PAGE
+    )
+
+def estimate_extraction_mb(pdf_path, pages=None, quality=None):
+    """Estimate the memory cost of converting ``pages`` of a local PDF at ``quality``"""
+    page_count, image_density = inspect_pdf(pdf_path, pages)
+    return estimate_conversion_mb(os.path.getsize(pdf_path), page_count, image_density,
+                                  QUALITY_PAGE_MB_FACTOR[quality or DEFAULT_QUALITY])
+
+class UploadSpool:
+    """On-disk spool for an upload that is hashed and size-checked as it is written.
+
+    Behaves like the file object it wraps, so Werkzeug can use it as the
+    multipart file stream. Closing the spool deletes the file.
+    """
+
+    def __init__(self, max_bytes=None, suffix='.pdf'):
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=SPOOL_DIR, suffix=suffix, delete=False)
+        self.name = self._file.name
+        self.max_bytes = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+
+    @classmethod
+    def from_stream(cls, stream, max_bytes=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        """Spool a raw request body in fixed-size chunks"""
+        spool = cls(max_bytes=max_bytes)
+        try:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                spool.write(chunk)
+            spool.flush()
+        except Exception:
+            spool.close()
+            raise
+        return spool
+
+    @property
+    def content_hash(self):
+        return self._digest.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge()
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def detach(self, path):
+        """Move the spooled file to ``path`` and keep it after close()"""
+        self._file.flush()
+        self._file.close()
+        os.replace(self.name, path)
+        self.name = path
+        self._detached = True
+
+    def close(self):
+        self._file.close()
+        if not getattr(self, '_detached', False):
+            remove_file(self.name)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class SpoolingRequest(Request):
+    """Request that streams multipart file parts directly into UploadSpool files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = UploadSpool()
+        # Keep track of spools so partially written ones (e.g. over the limit) get removed too
+        self.__dict__.setdefault('_spools', []).append(spool)
+        return spool
+
+    def close(self):
+        super().close()
+        for spool in self.__dict__.get('_spools', []):
+            spool.close()
+
+app.request_class = SpoolingRequest
+
+@lru_cache(maxsize=1)
+def get_docling_version():
+    """Installed Docling version, used as part of the cache key"""
+    try:
+        from importlib.metadata import version
+        return version('docling')
+    except Exception:
+        return 'unknown'
+
+def get_pipeline_signature():
+    """Describe the converter pipeline options that affect the output"""
+    if SIMULATE_CONVERTER:
+        return {'pipeline': 'simulated'}
+    return {'pipeline': 'default', 'quality_presets': QUALITY_PRESETS, 'picture_images': PICTURE_IMAGES}
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Compute the SHA-256 of a file without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Preset dictionary for compressing stored entries: boilerplate of the entry
+# JSON and of Docling/PyMuPDF markdown plus common English words. zlib matches
+# against the last 32 KB, and strings near the end are cheapest to reference,
+# so the most frequent ones come last. Never edit it in place: stored entries
+# can only be read back with the dictionary they were written with, so any
+# change needs a new STORAGE_MAGIC.
+MARKDOWN_DICTIONARY = ''.join([
+    'Table of Contents Introduction Background Overview Summary Conclusion Appendix References '
+    'Abstract Methodology Results Discussion Acknowledgements Figure Table Section Chapter Page ',
+    'Name Date Address Phone Email Signature Total Amount Description Quantity Price Status Notes ',
+    'January February March April May June July August September October November December ',
+    'however therefore including following provided required information agreement between '
+    'service services company customer account payment period report data number time year ',
+    '&amp; &lt; &gt; (c) (b) (a) 1. 2. 3. 4. 5. i. ii. iii. e.g. i.e. etc. ',
+    '\\n\\n| --- | --- | --- | --- |\\n|  |  |  |\\n',
+    '"method": "docling", "reason": "bad_glyphs"}, {"page": ',
+    '"method": "docling", "reason": "fast_path_disabled"}, {"page": ',
+    '"method": "docling", "reason": "image_heavy"}, {"page": ',
+    '"method": "docling", "reason": "table_like"}, {"page": ',
+    '"method": "docling", "reason": "no_text_layer"}, {"page": ',
+    '"method": "pymupdf", "reason": "sparse_text"}, {"page": ',
+    '"method": "pymupdf", "reason": "clean_text_layer"}, {"page": ',
+    '{"content": "', '", "page_spans": [[1, 0, ', '], [2, ', '], [3, ',
+    '"metadata": {"word_count": ', ', "character_count": ', ', "conversion_seconds": ',
+    ', "docling_version": "2.', '", "page_methods": [{"page": 1, ',
+    '"fast_path_pages": ', ', "docling_pages": ', '}, "created_at": 17',
+    '<!-- image -->\\n\\n', '\\n\\n- ', '\\n\\n| ', ' |\\n| ', ' | ', '|\\n|---|---|', '**',
+    '\\n\\n### ', '\\n\\n## ', '\\n\\n',
+    ' the of and to in a is that for on with as by this be are from or at an it not which have ',
+    'will shall may must should can all any each other such been has their was were its ',
+]).encode('utf-8')[-32768:]
+STORAGE_MAGIC = b'DZ1'
+
+def compress_stored(data):
+    """Compress a serialized entry/result for storage (zlib + markdown dictionary)"""
+    compressor = zlib.compressobj(level=9, zdict=MARKDOWN_DICTIONARY)
+    return STORAGE_MAGIC + compressor.compress(data) + compressor.flush()
+
+def decompress_stored(data):
+    """Inverse of ``compress_stored``; data without the header is returned as is"""
+    if isinstance(data, str) or not data.startswith(STORAGE_MAGIC):
+        return data
+    decompressor = zlib.decompressobj(zdict=MARKDOWN_DICTIONARY)
+    return decompressor.decompress(data[len(STORAGE_MAGIC):]) + decompressor.flush()
+
+class ExtractionCache:
+    """Disk-backed, content-addressed cache of extraction results.
+
+    Entries are compressed JSON files (``compress_stored``) named after a key
+    derived from the PDF's SHA-256, the Docling version and the pipeline
+    options; named blobs (the serialized DoclingDocument, rendered exports)
+    sit next to them and share the LRU and size cap. The file mtime tracks the
+    last access (LRU), the stored ``created_at`` drives TTL expiry, and the
+    total size of the directory is capped. Writes go through ``os.replace``
+    so several gunicorn workers can share the same directory.
+    """
+
+    def __init__(self, directory, max_bytes, ttl_seconds):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    def make_key(self, content_hash, options=None):
+        key_material = json.dumps({
+            'schema': CACHE_SCHEMA_VERSION,
+            'content_hash': content_hash,
+            'docling_version': get_docling_version(),
+            'pipeline': get_pipeline_signature(),
+            'options': options or {},
+        }, sort_keys=True)
+        return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+    def _path(self, key, name=None):
+        return os.path.join(self.directory, key[:2], f"{key}.{name}.jz" if name else f"{key}.jz")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(decompress_stored(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+
+        if time.time() - entry.get('created_at', 0) > self.ttl_seconds:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path, None)  # Mark as recently used
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, entry):
+        entry = dict(entry, created_at=time.time())
+        self._write(self._path(key), compress_stored(json.dumps(entry).encode('utf-8')))
+
+    def get_blob(self, key, name):
+        """Bytes stored with ``put_blob`` for an entry, or None"""
+        path = self._path(key, name)
+        try:
+            with open(path, 'rb') as f:
+                data = decompress_stored(f.read())
+        except (OSError, ValueError, zlib.error):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def put_blob(self, key, name, data):
+        """Store ``data`` (bytes) under ``name`` alongside the entry ``key``"""
+        self._write(self._path(key, name), compress_stored(data))
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones over the size cap"""
+        now = time.time()
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(('.jz', '.json')):  # .json: schema 1 entries, left to expire
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # mtime is refreshed on every hit, so it is >= created_at
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        if total_size <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        remove_file(path)
+
+_extraction_cache = None
+
+def get_extraction_cache():
+    """Get or create the extraction cache, or None if it cannot be used"""
+    global _extraction_cache
+    if CACHE_MAX_BYTES <= 0:
+        return None
+    if _extraction_cache is None:
+        try:
+            _extraction_cache = ExtractionCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_TTL_SECONDS)
+        except OSError as e:
+            logger.warning(f"⚠️ Extraction cache disabled: {e}")
+            return None
+    return _extraction_cache
+
+class InvalidOptionError(ValueError):
+    """Invalid extraction option in a request (reported as 400)"""
+
+class PageSelectionError(InvalidOptionError):
+    """Invalid ``pages``/``max_pages`` request parameters"""
+
+class UnsupportedFormatError(InvalidOptionError):
+    """Uploaded or downloaded file is not a supported document format"""
+
+def parse_page_spec(spec):
+    """Parse a page spec such as ``"1-3,5,8-"`` (or ``[1, 2, "4-6"]``) into ranges.
+
+    Returns a list of 1-based ``(start, end)`` tuples where ``end`` may be
+    None for open ranges.
+    """
+    if isinstance(spec, (list, tuple)):
+        parts = [str(part) for part in spec]
+    elif isinstance(spec, (str, int)) and not isinstance(spec, bool):
+        parts = str(spec).split(',')
+    else:
+        raise PageSelectionError(f'Invalid page range: {spec}')
+
+    ranges = []
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else None
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise PageSelectionError(f'Invalid page range: {part}')
+        if start < 1 or (end is not None and end < start):
+            raise PageSelectionError(f'Invalid page range: {part}')
+        ranges.append((start, end))
+
+    if not ranges:
+        raise PageSelectionError('pages must select at least one page')
+    return ranges
+
+def parse_bool(value):
+    """Interpret JSON booleans and form/query strings such as 'true' or '0'"""
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if str(value).strip().lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise InvalidOptionError(f'Invalid boolean value: {value}')
+
+def read_extraction_options(values):
+    """Validate the extraction options of a request.
+
+    ``values`` is the JSON body or the form/query values. Returns a
+    JSON-serializable dict holding only the options that were given:
+    ``pages``/``max_pages`` (page selection), ``fast_path``, ``quality`` and
+    ``format`` (overrides format detection).
+    """
+    options = {}
+    pages = values.get('pages')
+    if pages not in (None, '', []):
+        parse_page_spec(pages)
+        options['pages'] = ','.join(str(part) for part in pages) if isinstance(pages, (list, tuple)) else str(pages)
+
+    max_pages = values.get('max_pages')
+    if max_pages not in (None, ''):
+        try:
+            max_pages = int(max_pages)
+        except (TypeError, ValueError):
+            raise PageSelectionError('max_pages must be an integer')
+        if max_pages < 1:
+            raise PageSelectionError('max_pages must be at least 1')
+        options['max_pages'] = max_pages
+
+    fast_path = values.get('fast_path')
+    if fast_path not in (None, ''):
+        options['fast_path'] = parse_bool(fast_path)
+
+    quality = values.get('quality')
+    if quality not in (None, ''):
+        if not isinstance(quality, str) or quality not in QUALITY_PRESETS:
+            raise InvalidOptionError(f"quality must be one of {', '.join(QUALITY_PRESETS)}")
+        options['quality'] = quality
+
+    source_format = values.get('format')
+    if source_format not in (None, ''):
+        if not isinstance(source_format, str) or source_format not in SOURCE_FORMATS:
+            raise InvalidOptionError(f"format must be one of {', '.join(SOURCE_FORMATS)}")
+        options['format'] = source_format
+
+    return options
+
+def resolve_pages(page_options, total_pages):
+    """Turn page options into a sorted list of 1-based page numbers, or None for all pages"""
+    if 'pages' not in page_options and 'max_pages' not in page_options:
+        return None
+
+    if 'pages' in page_options:
+        selected = set()
+        for start, end in parse_page_spec(page_options['pages']):
+            if end is None:
+                if total_pages is None:
+                    raise PageSelectionError('Open-ended page ranges need PyMuPDF or PyPDF2 to count pages')
+                end = total_pages
+            if total_pages is not None:
+                end = min(end, total_pages)
+            selected.update(range(start, end + 1))
+        pages = sorted(selected)
+    elif total_pages is not None:
+        pages = list(range(1, total_pages + 1))
+    else:
+        pages = list(range(1, page_options['max_pages'] + 1))
+
+    if 'max_pages' in page_options:
+        pages = pages[:page_options['max_pages']]
+
+    if not pages:
+        raise PageSelectionError(f'No pages selected (document has {total_pages} pages)')
+    if total_pages is not None and len(pages) == total_pages:
+        return None
+    return pages
+
+def get_pdf_page_count(pdf_path):
+    """Count pages cheaply without running Docling; None if no PDF library is available"""
+    try:
+        fitz = lazy_import('fitz')  # PyMuPDF
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    except ImportError:
+        pass
+    try:
+        PdfReader = lazy_import('PyPDF2').PdfReader
+        return len(PdfReader(pdf_path).pages)
+    except ImportError:
+        return None
+
+def write_pdf_subset(pdf_path, pages):
+    """Write the given 1-based pages of a PDF to a new spool file and return its path"""
+    fitz = lazy_import('fitz')  # PyMuPDF
+
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    fd, subset_path = tempfile.mkstemp(dir=SPOOL_DIR, suffix='.pdf')
+    os.close(fd)
+    with fitz.open(pdf_path) as doc:
+        doc.select([page - 1 for page in pages])
+        doc.save(subset_path, garbage=3)
+    return subset_path
+
+def classify_page(page):
+    """Decide whether a PyMuPDF page can skip Docling.
+
+    Looks at text-layer coverage, image area, glyph sanity and ruling lines
+    (tables/forms). Returns ``(method, reason)`` with method ``'pymupdf'`` or
+    ``'docling'``.
+    """
+    text = page.get_text('text')
+    char_count = len(text.strip())
+
+    page_area = abs(page.rect) or 1.0
+    image_area = 0.0
+    for image in page.get_image_info():
+        bbox = page.rect & image['bbox']  # Clip to the visible page
+        if not bbox.is_empty:
+            image_area += abs(bbox)
+    image_ratio = min(image_area / page_area, 1.0)
+
+    if char_count < FAST_PATH_MIN_CHARS:
+        # Near-empty pages are read as-is unless they are mostly picture (needs OCR)
+        return ('docling', 'no_text_layer') if image_ratio > 0.1 else ('pymupdf', 'sparse_text')
+
+    if image_ratio > FAST_PATH_MAX_IMAGE_RATIO:
+        return 'docling', 'image_heavy'
+
+    bad_glyphs = sum(
+        1 for char in text
+        if char == '\ufffd' or '\ue000' <= char <= '\uf8ff' or (ord(char) < 32 and char not in '\n\r\t')
+    )
+    if bad_glyphs / max(len(text), 1) > FAST_PATH_MAX_BAD_GLYPH_RATIO:
+        return 'docling', 'bad_glyphs'
+
+    ruling_lines = 0
+    for drawing in page.get_drawings():
+        for item in drawing['items']:
+            if item[0] == 're' or (item[0] == 'l' and (item[1].x == item[2].x or item[1].y == item[2].y)):
+                ruling_lines += 1
+        if ruling_lines >= FAST_PATH_MAX_RULING_LINES:
+            return 'docling', 'table_like'
+
+    return 'pymupdf', 'clean_text_layer'
+
+def page_to_markdown(page):
+    """Render a born-digital page's text layer as simple markdown (paragraphs and headings)"""
+    blocks = [block for block in page.get_text('dict', sort=True)['blocks'] if block['type'] == 0]
+
+    # The most common font size (by characters) is taken as body text
+    size_counts = {}
+    for block in blocks:
+        for line in block['lines']:
+            for span in line['spans']:
+                size = round(span['size'], 1)
+                size_counts[size] = size_counts.get(size, 0) + len(span['text'].strip())
+    body_size = max(size_counts, key=size_counts.get) if size_counts else 0
+
+    paragraphs = []
+    for block in blocks:
+        text = ''
+        for line in block['lines']:
+            line_text = ''.join(span['text'] for span in line['spans']).strip()
+            if not line_text:
+                continue
+            if text.endswith('-') and line_text[:1].islower():
+                text = text[:-1] + line_text  # Re-join hyphenated words
+            else:
+                text = f'{text} {line_text}' if text else line_text
+        if not text:
+            continue
+
+        size = max(span['size'] for line in block['lines'] for span in line['spans'])
+        if body_size and len(text) <= 120 and size >= body_size * 1.2:
+            text = ('## ' if size >= body_size * 1.5 else '### ') + text
+        paragraphs.append(text)
+
+    return '\n\n'.join(paragraphs)
+
+# Set while an extraction runs so every Docling document it produces can be stored
+_document_context = threading.local()
+
+@contextmanager
+def collect_docling_documents():
+    """Collect ``(document, page_map)`` from each ``run_docling`` call in this thread"""
+    previous = getattr(_document_context, 'documents', None)
+    _document_context.documents = documents = []
+    try:
+        yield documents
+    finally:
+        _document_context.documents = previous
+
+def run_docling(pdf_path, pages=None, quality=None):
+    """Run Docling on a local PDF, limited to ``pages`` (1-based) if given.
+
+    A contiguous selection uses Docling's ``page_range``, anything else is
+    first cut down to a smaller PDF with PyMuPDF. Returns
+    ``(document, page_map)`` where ``page_map`` maps Docling's page numbers
+    to the original ones. ``quality`` selects the converter (QUALITY_PRESETS).
+    """
+    converter = get_converter(quality)
+
+    subset_path = None
+    try:
+        if pages is not None and pages[-1] - pages[0] + 1 != len(pages):
+            subset_path = write_pdf_subset(pdf_path, pages)
+        with timed_stage('convert', CONVERT_SECONDS):
+            if pages is None:
+                result = converter.convert(pdf_path)
+            elif subset_path is None:
+                result = converter.convert(pdf_path, page_range=(pages[0], pages[-1]))
+            else:
+                result = converter.convert(subset_path)
+    finally:
+        if subset_path:
+            remove_file(subset_path)
+
+    profiler = getattr(_profile_context, 'profiler', None)
+    if profiler is not None:
+        profiler.add_docling_timings(getattr(result, 'timings', None))
+
+    document = result.document
+    docling_pages = sorted(document.pages.keys())
+    page_map = dict(zip(docling_pages, pages or docling_pages))
+    documents = getattr(_document_context, 'documents', None)
+    if documents is not None:
+        documents.append((document, page_map))
+    return document, page_map
+
+def docling_page_fragments(pdf_path, pages, reasons, quality=None):
+    """Convert ``pages`` with Docling and yield one fragment per page"""
+    document, page_map = run_docling(pdf_path, pages, quality)
+    for docling_page_no, page_no in page_map.items():
+        with timed_stage('export', EXPORT_SECONDS):
+            markdown = document.export_to_markdown(page_no=docling_page_no)
+        yield {
+            'page': page_no,
+            'method': 'docling',
+            'reason': reasons.get(page_no, 'fast_path_disabled'),
+            'markdown': markdown,
+        }
+
+def iter_page_fragments(pdf_path, pages=None, fast_path=True, docling_batch_pages=None, quality=None):
+    """Yield ``{'page', 'method', 'reason', 'markdown'}`` fragments as soon as they are ready.
+
+    With ``fast_path`` each page is classified first and clean pages are
+    yielded straight from PyMuPDF while classification continues. Pages
+    needing Docling are collected and converted together at the end, or in
+    groups of ``docling_batch_pages`` so streaming clients see progress.
+    Fragments are therefore not necessarily in page order.
+    """
+    selection = pages
+    if selection is None:
+        total_pages = get_pdf_page_count(pdf_path)
+        selection = list(range(1, total_pages + 1)) if total_pages else None
+    if selection is None:
+        # Page count unknown (no PDF library): a single Docling pass
+        yield from docling_page_fragments(pdf_path, None, {}, quality)
+        return
+
+    doc = None
+    if fast_path:
+        try:
+            fitz = lazy_import('fitz')  # PyMuPDF
+            doc = fitz.open(pdf_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Fast path unavailable, using Docling for all pages: {e}")
+
+    pending = {}
+    try:
+        for page_no in selection:
+            if doc is not None:
+                page = doc[page_no - 1]
+                with timed_stage('classify'):
+                    method, reason = classify_page(page)
+            else:
+                method, reason = 'docling', 'fast_path_disabled'
+
+            if method == 'pymupdf':
+                with timed_stage('fast_path'):
+                    markdown = page_to_markdown(page)
+                yield {'page': page_no, 'method': method, 'reason': reason, 'markdown': markdown}
+                continue
+
+            pending[page_no] = reason
+            if docling_batch_pages and len(pending) >= docling_batch_pages:
+                yield from docling_page_fragments(pdf_path, sorted(pending), pending, quality)
+                pending = {}
+    finally:
+        if doc is not None:
+            doc.close()
+
+    if pending:
+        yield from docling_page_fragments(pdf_path, sorted(pending), pending, quality)
+
+def join_fragments(fragments):
+    """Join page fragments (in order) into markdown plus ``[page, start, end]`` spans"""
+    parts = []
+    page_spans = []
+    offset = 0
+    for fragment in fragments:
+        if not fragment['markdown']:
+            continue
+        if parts:
+            offset += 2  # '\n\n' separator
+        parts.append(fragment['markdown'])
+        page_spans.append([fragment['page'], offset, offset + len(fragment['markdown'])])
+        offset += len(fragment['markdown'])
+    return '\n\n'.join(parts), page_spans
+
+def assemble_entry(fragments, start_time):
+    """Merge page fragments (any order) into a cache entry with per-page spans"""
+    fragments = sorted(fragments, key=lambda fragment: fragment['page'] or 0)
+    markdown_content, page_spans = join_fragments(fragments)
+
+    page_methods = [
+        {'page': fragment['page'], 'method': fragment['method'], 'reason': fragment['reason']}
+        for fragment in fragments if fragment['page'] is not None
+    ]
+    metadata = {
+        'word_count': len(markdown_content.split()),
+        'character_count': len(markdown_content),
+        'conversion_seconds': round(time.time() - start_time, 3),
+        'docling_version': get_docling_version(),
+    }
+    if page_methods:
+        metadata['page_methods'] = page_methods
+        metadata['fast_path_pages'] = sum(1 for item in page_methods if item['method'] == 'pymupdf')
+        metadata['docling_pages'] = len(page_methods) - metadata['fast_path_pages']
+
+    return {'content': markdown_content, 'page_spans': page_spans, 'metadata': metadata}
+
+def convert_pdf(pdf_path, pages=None, fast_path=True, quality=None):
+    """Extract a local PDF to markdown plus basic stats.
+
+    With ``fast_path`` each page is classified first: pages with a clean
+    text layer are read directly with PyMuPDF and only the remaining
+    (scanned, image-heavy or table-like) pages are sent to Docling. The
+    per-page choice is reported in ``metadata.page_methods``. Without it the
+    whole selection is converted and exported by Docling in one piece.
+    """
+    start_time = time.time()
+
+    if fast_path:
+        return assemble_entry(iter_page_fragments(pdf_path, pages, fast_path=True, quality=quality), start_time)
+
+    document, _ = run_docling(pdf_path, pages, quality)
+    with timed_stage('export', EXPORT_SECONDS):
+        markdown_content = document.export_to_markdown()
+    return {
+        'content': markdown_content,
+        'page_spans': None,
+        'metadata': {
+            'word_count': len(markdown_content.split()),
+            'character_count': len(markdown_content),
+            'conversion_seconds': round(time.time() - start_time, 3),
+            'docling_version': get_docling_version(),
+        },
+    }
+
+def image_filetype(header):
+    """PyMuPDF filetype of an image from its leading bytes, or None"""
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith((b'II*\x00', b'MM\x00*')):
+        return 'tiff'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if header.startswith(b'BM') and header[6:10] == b'\x00\x00\x00\x00':
+        return 'bmp'
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def detect_format(path, filename=None):
+    """Detect the format of a local document from its leading bytes.
+
+    Binary formats are recognised by their signature (OOXML by the parts in
+    the zip). Text files are told apart by the ``filename`` extension, or
+    sniffed as HTML; anything else textual is plain text. Raises
+    ``UnsupportedFormatError`` for empty files, other binary files and
+    files whose content does not match a binary extension (``.pdf``, ...).
+    """
+    with open(path, 'rb') as f:
+        header = f.read(FORMAT_SNIFF_BYTES)
+    if not header:
+        raise UnsupportedFormatError('The document is empty')
+
+    extension = os.path.splitext(filename or '')[1].lower()
+    source_format = sniff_format(path, header, extension)
+    declared_format = BINARY_FORMAT_EXTENSIONS.get(extension)
+    if declared_format and source_format != declared_format:
+        raise UnsupportedFormatError(f'The content does not match the {extension} extension '
+                                     f'(it looks like {source_format})')
+    return source_format
+
+def sniff_format(path, header, extension):
+    """Format of a document from its leading bytes, using ``extension`` only for text formats"""
+    if b'%PDF-' in header[:1024]:  # Readers accept leading junk before the header
+        return 'pdf'
+    if image_filetype(header):
+        return 'image'
+    if header.startswith(b'PK\x03\x04'):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = set(archive.namelist())
+        except zipfile.BadZipFile:
+            names = set()
+        if 'word/document.xml' in names:
+            return 'docx'
+        if 'ppt/presentation.xml' in names:
+            return 'pptx'
+        raise UnsupportedFormatError('Unsupported document format (zip archive that is not DOCX or PPTX)')
+    if b'\x00' in header:
+        raise UnsupportedFormatError('Unsupported document format (binary file)')
+
+    if extension in TEXT_FORMAT_EXTENSIONS:
+        return TEXT_FORMAT_EXTENSIONS[extension]
+    start = header.lstrip(b'\xef\xbb\xbf \t\r\n')[:256].lower()
+    if start.startswith((b'<!doctype html', b'<html')) or b'<body' in start:
+        return 'html'
+    return 'text'
+
+def read_text_file(path):
+    """Decode a text document (UTF-8 with or without BOM, else Windows-1252)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = data.decode('cp1252', errors='replace')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def markdown_table(rows):
+    """Render rows of cell strings as a markdown table (first row is the header)"""
+    rows = [[' '.join(str(cell or '').split()).replace('|', '\\|') for cell in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ''
+    width = max(len(row) for row in rows)
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    lines = ['| ' + ' | '.join(rows[0]) + ' |', '|' + '---|' * width]
+    lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+    return '\n'.join(lines)
+
+def csv_to_markdown(path):
+    """CSV/TSV as a markdown table, with the delimiter sniffed from the first lines"""
+    text = read_text_file(path)
+    try:
+        dialect = csv.Sniffer().sniff(text[:FORMAT_SNIFF_BYTES], delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    return markdown_table(csv.reader(io.StringIO(text), dialect))
+
+class HTMLMarkdownParser(HTMLParser):
+    """Small HTML to markdown converter for headings, paragraphs, lists, tables and code"""
+
+    SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'head', 'svg'}
+    BLOCK_TAGS = {'p', 'div', 'section', 'article', 'main', 'header', 'footer', 'aside', 'nav', 'blockquote',
+                  'ul', 'ol', 'li', 'dl', 'dt', 'dd', 'figure', 'figcaption', 'form', 'br', 'hr',
+                  'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'table', 'address'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self._text = []
+        self._prefix = ''
+        self._skip = 0
+        self._pre = 0
+        self._table = None  # rows of cells while inside a <table>
+        self._list_depth = 0
+        self._in_list = False  # last block is a list item
+
+    def _flush(self):
+        text = ''.join(self._text)
+        self._text = []
+        if self._table is not None:
+            if self._table and self._table[-1]:
+                self._table[-1][-1] += text
+            return
+        text = text.strip('\n') if self._pre else ' '.join(text.split())
+        if text:
+            if self._pre:
+                self.blocks.append(f"```\n{text}\n```")
+            elif self._prefix.lstrip().startswith('- ') and self._in_list:
+                self.blocks[-1] += '\n' + self._prefix + text  # Keep list items together
+            else:
+                self.blocks.append(self._prefix + text)
+            self._in_list = self._prefix.lstrip().startswith('- ')
+        self._prefix = ''
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+            return
+        if self._table is not None:
+            if tag == 'tr':
+                self._flush()
+                self._table.append([])
+            elif tag in ('td', 'th'):
+                self._flush()
+                if not self._table:
+                    self._table.append([])
+                self._table[-1].append('')
+            return
+        if tag in self.BLOCK_TAGS:
+            self._flush()
+        if tag == 'table':
+            self._table = []
+        elif tag in ('ul', 'ol'):
+            self._list_depth += 1
+        elif tag == 'li':
+            self._prefix = '  ' * max(0, self._list_depth - 1) + '- '
+        elif tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            self._prefix = '#' * int(tag[1]) + ' '
+        elif tag == 'blockquote':
+            self._prefix = '> '
+        elif tag == 'pre':
+            self._pre += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+            return
+        if tag == 'table' and self._table is not None:
+            self._flush()
+            rows, self._table = self._table, None
+            table = markdown_table(rows)
+            if table:
+                self.blocks.append(table)
+                self._in_list = False
+            return
+        if self._table is not None:
+            return
+        if tag in self.BLOCK_TAGS:
+            self._flush()
+        if tag in ('ul', 'ol'):
+            self._list_depth = max(0, self._list_depth - 1)
+        elif tag == 'pre':
+            self._pre = max(0, self._pre - 1)
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._text.append(data)
+
+    def markdown(self):
+        self.close()
+        self._flush()
+        return '\n\n'.join(self.blocks)
+
+def html_to_markdown(path):
+    parser = HTMLMarkdownParser()
+    parser.feed(read_text_file(path))
+    return parser.markdown()
+
+def docx_to_markdown(path):
+    """Paragraphs (headings and lists by style) and tables of a DOCX in body order"""
+    docx = lazy_import('docx')
+    document = docx.Document(path)
+    blocks = []
+    for item in document.iter_inner_content():
+        if isinstance(item, docx.table.Table):
+            blocks.append(markdown_table([cell.text for cell in row.cells] for row in item.rows))
+            continue
+        text = item.text.strip()
+        if not text:
+            continue
+        style = item.style.name if item.style is not None else ''
+        if style == 'Title':
+            blocks.append(f'# {text}')
+        elif style.startswith('Heading') and style[8:].isdigit():
+            blocks.append('#' * min(6, int(style[8:])) + f' {text}')
+        elif style.startswith('List Number'):
+            blocks.append(f'1. {text}')
+        elif style.startswith('List'):
+            blocks.append(f'- {text}')
+        else:
+            blocks.append(text)
+    return '\n\n'.join(block for block in blocks if block)
+
+def pptx_fragments(path):
+    """One fragment per slide: title as heading, then text frames and tables"""
+    pptx = lazy_import('pptx')
+    presentation = pptx.Presentation(path)
+    for slide_no, slide in enumerate(presentation.slides, start=1):
+        title_shape = slide.shapes.title
+        title = title_shape.text_frame.text.strip() if title_shape is not None else ''
+        blocks = [f'## {title}'] if title else []
+        for shape in slide.shapes:
+            if shape == title_shape:
+                continue
+            if shape.has_text_frame:
+                lines = [paragraph.text.strip() for paragraph in shape.text_frame.paragraphs]
+                text = '\n'.join(line for line in lines if line)
+                if text:
+                    blocks.append(text)
+            elif getattr(shape, 'has_table', False) and shape.has_table:
+                blocks.append(markdown_table([cell.text for cell in row.cells] for row in shape.table.rows))
+        yield {'page': slide_no, 'method': 'python-pptx', 'reason': None,
+               'markdown': '\n\n'.join(block for block in blocks if block)}
+
+NATIVE_PARSERS = {
+    'docx': ('python-docx', docx_to_markdown),
+    'pptx': ('python-pptx', pptx_fragments),
+    'html': ('html.parser', html_to_markdown),
+    'markdown': ('text', read_text_file),
+    'csv': ('csv', csv_to_markdown),
+    'text': ('text', read_text_file),
+}
+
+def convert_native(path, source_format):
+    """Parse a non-PDF document without Docling into the usual entry shape.
+
+    Presentations keep one span per slide in ``page_spans`` so content
+    paging works as it does for PDF pages.
+    """
+    start_time = time.time()
+    parser_name, parse = NATIVE_PARSERS[source_format]
+    result = parse(path)
+    if isinstance(result, str):
+        markdown_content, page_spans = result.strip(), None
+    else:
+        markdown_content, page_spans = join_fragments(result)
+    NATIVE_CONVERSIONS.inc(format=source_format)
+    return {
+        'content': markdown_content,
+        'page_spans': page_spans,
+        'metadata': {
+            'word_count': len(markdown_content.split()),
+            'character_count': len(markdown_content),
+            'conversion_seconds': round(time.time() - start_time, 3),
+            'parser': parser_name,
+        },
+    }
+
+@contextmanager
+def image_as_pdf(image_path):
+    """Wrap an image in a temporary one-page PDF (removed on exit) for the OCR pipeline"""
+    fitz = lazy_import('fitz')
+    with open(image_path, 'rb') as f:
+        header = f.read(16)
+    with fitz.open(image_path, filetype=image_filetype(header)) as image:
+        pdf_bytes = image.convert_to_pdf()
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    fd, pdf_path = tempfile.mkstemp(dir=SPOOL_DIR, suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_bytes)
+        yield pdf_path
+    finally:
+        remove_file(pdf_path)
+
+def plan_extraction(pdf_path, content_hash=None, options=None, filename=None):
+    """Resolve request options into conversion arguments and a cache key.
+
+    The document format comes from ``options['format']`` or is detected
+    from the file (``filename`` only helps to tell text formats apart).
+    """
+    options = options or {}
+    if os.path.getsize(pdf_path) == 0:
+        raise UnsupportedFormatError('The document is empty')
+    if content_hash is None:
+        content_hash = hash_file(pdf_path)
+    source_format = options.get('format') or detect_format(pdf_path, filename)
+
+    if source_format in NATIVE_PARSERS:
+        if 'pages' in options or 'max_pages' in options:
+            raise PageSelectionError('pages and max_pages are only supported for PDF documents')
+        cache = get_extraction_cache()
+        key_options = {'format': source_format, 'parser': NATIVE_PARSER_VERSION}
+        return {
+            'content_hash': content_hash,
+            'format': source_format,
+            'pages': None,
+            'total_pages': None,
+            'fast_path': False,
+            'quality': None,
+            'cache': cache,
+            'cache_key': cache.make_key(content_hash, key_options) if cache else None,
+        }
+
+    if source_format == 'image' and ('pages' in options or 'max_pages' in options):
+        raise PageSelectionError('pages and max_pages are only supported for PDF documents')
+    total_pages = get_pdf_page_count(pdf_path) if ('pages' in options or 'max_pages' in options) else None
+    pages = resolve_pages(options, total_pages)
+    fast_path = options.get('fast_path', FAST_PATH_ENABLED)
+    quality = options.get('quality', DEFAULT_QUALITY)
+
+    key_options = {'fast_path': FAST_PATH_VERSION if fast_path else False, 'quality': quality}
+    if pages:
+        key_options['pages'] = pages
+    if source_format != 'pdf':
+        key_options['format'] = source_format
+
+    cache = get_extraction_cache()
+    return {
+        'content_hash': content_hash,
+        'format': source_format,
+        'pages': pages,
+        'total_pages': total_pages,
+        'fast_path': fast_path,
+        'quality': quality,
+        'cache': cache,
+        'cache_key': cache.make_key(content_hash, key_options) if cache else None,
+    }
+
+class FlightBusy(AdmissionRejected):
+    """The identical conversion a request waited for was still running at the end of its wait"""
+
+    def __init__(self):
+        super().__init__('An identical conversion is still running, please retry',
+                         status=503, retry_after=ADMISSION_RETRY_AFTER_SECONDS)
+
+class SingleFlight:
+    """Coalesce concurrent conversions of the same extraction cache key.
+
+    Within a process the first caller leads and later ones wait on its
+    event; across gunicorn workers the leader also holds an exclusive
+    ``flock`` on ``<cache_key>.lock``, which followers poll and the leader
+    unlinks when it is done, so only identical keys ever wait for each other.
+    Followers take the leader's entry (or re-read the cache) when it is done
+    and only convert themselves if the leader failed; a follower whose wait
+    ends while the leader is still converting raises ``FlightBusy``.
+    """
+
+    def __init__(self, directory, wait_seconds):
+        self.directory = directory
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> in-process leader's flight
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _lock_path(self, key):
+        return os.path.join(self.directory, f'{key}.lock')
+
+    def _lock_file(self, key, deadline, lookup):
+        """Flock the key's lock file as leader.
+
+        Returns ``(file, entry)``: the locked file and None, or None and the
+        entry another worker stored while this one waited. Raises
+        ``FlightBusy`` if another worker still holds the lock at ``deadline``
+        (None waits as long as it is held).
+        """
+        import fcntl
+        path = self._lock_path(key)
+        waited = False
+        while True:
+            lock_file = open(path, 'a')
+            try:
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if deadline is not None and time.time() >= deadline:
+                            lock_file.close()
+                            raise FlightBusy()
+                        waited = True
+                        time.sleep(FLIGHT_POLL_SECONDS)
+                try:
+                    current = os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+            except BaseException:
+                lock_file.close()
+                raise
+            if current:
+                # Another worker led before this one got the lock: its result may be cached now
+                entry = lookup() if waited else None
+                if entry is None:
+                    return lock_file, None
+                lock_file.close()
+                return None, entry
+            # The leader unlinked this file on its way out: try the cache, else a fresh file
+            lock_file.close()
+            entry = lookup()
+            if entry is not None:
+                return None, entry
+
+    @staticmethod
+    def _coalesced(entry):
+        """A follower's view of the leader's entry, flagged ``coalesced``"""
+        return dict(entry, metadata=dict(entry['metadata'], coalesced=True))
+
+    @contextmanager
+    def join(self, key, lookup, deadline=None, background=False):
+        """Yield a flight whose ``entry`` is another caller's result, or None to convert.
+
+        The leader sets ``flight.entry`` once it has a result so waiting
+        threads of this process can use it even without a cache. Entries
+        handed to followers carry ``metadata.coalesced``. Followers wait up
+        to ``wait_seconds`` and never past ``deadline`` (a request's own);
+        ``background`` callers (job workers) wait as long as the leader runs.
+        """
+        if background:
+            deadline = None
+        elif deadline is None:
+            deadline = time.time() + self.wait_seconds
+        else:
+            deadline = min(deadline, time.time() + self.wait_seconds)
+        while True:
+            with self._lock:
+                leader = self._flights.get(key)
+                if leader is None:
+                    flight = self._flights[key] = SimpleNamespace(entry=None, done=threading.Event())
+            if leader is None:
+                break
+            leader.done.wait(None if deadline is None else max(0.0, deadline - time.time()))
+            entry = leader.entry or lookup()
+            if entry is not None:
+                COALESCED.inc()
+                yield SimpleNamespace(entry=self._coalesced(entry))
+                return
+            if not leader.done.is_set():
+                raise FlightBusy()
+            # The leader failed: lead the next attempt
+
+        try:
+            lock_file, entry = self._lock_file(key, deadline, lookup)
+            try:
+                if entry is not None:
+                    COALESCED.inc()
+                    flight.entry = entry
+                    yield SimpleNamespace(entry=self._coalesced(entry))
+                else:
+                    yield flight
+            finally:
+                if lock_file is not None:
+                    try:
+                        os.unlink(self._lock_path(key))  # Still holding the flock, so it is ours
+                    except OSError:
+                        pass
+                    lock_file.close()  # Releases the flock
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+_single_flight = None
+
+def get_single_flight():
+    """Get or create this process's single-flight coordinator (None if unusable)"""
+    global _single_flight
+    if _single_flight is None:
+        try:
+            _single_flight = SingleFlight(FLIGHT_DIR, FLIGHT_WAIT_SECONDS)
+        except OSError as e:
+            logger.warning(f"⚠️ Single-flight coalescing disabled: {e}")
+            return None
+    return _single_flight
+
+def request_deadline():
+    """Time by which the current request must have answered, or None outside a request"""
+    if not has_request_context() or 'request_start' not in g:
+        return None
+    elapsed = time.perf_counter() - g.request_start
+    return time.time() - elapsed + WORKER_TIMEOUT_SECONDS - FLIGHT_ANSWER_SECONDS
+
+def join_flight(plan, background=False):
+    """Single-flight context for a plan; a no-op flight when there is no cache key"""
+    single_flight = get_single_flight() if plan['cache_key'] else None
+    if single_flight is None:
+        return nullcontext(SimpleNamespace(entry=None))
+    return single_flight.join(plan['cache_key'], lambda: lookup_cached_entry(plan),
+                              deadline=request_deadline(), background=background)
+
+def lookup_cached_entry(plan):
+    """Return the cached entry for an extraction plan, or None"""
+    if not plan['cache']:
+        return None
+    entry = plan['cache'].get(plan['cache_key'])
+    if entry is not None:
+        logger.info(f"⚡ Extraction cache hit for {plan['content_hash'][:12]}")
+    return entry
+
+def store_entry(plan, entry):
+    """Add request-level metadata to a fresh entry and store it in the cache"""
+    entry['metadata']['content_hash'] = plan['content_hash']
+    entry['metadata']['source_format'] = plan['format']
+    entry['metadata']['quality'] = plan['quality']
+    entry['metadata']['partial'] = plan['pages'] is not None
+    if plan['pages'] is not None:
+        entry['metadata']['pages'] = plan['pages']
+        entry['metadata']['total_pages'] = plan['total_pages']
+
+    if plan['cache']:
+        entry['metadata']['result_id'] = plan['cache_key']  # GET /results/<result_id>
+        try:
+            plan['cache'].put(plan['cache_key'], entry)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to store extraction in cache: {e}")
+    return entry
+
+def serialize_docling_documents(documents):
+    """Compact stored form of an extraction's Docling documents, or None if they cannot be stored.
+
+    Each part keeps its page map (Docling page -> original page). Picture
+    and page images are dropped: exports only use placeholders for them.
+    """
+    parts = []
+    for document, page_map in documents:
+        if not hasattr(document, 'export_to_dict'):
+            return None  # Simulated documents: exports use the markdown
+        data = document.export_to_dict()
+        for picture in data.get('pictures', []):
+            picture['image'] = None
+        for page in data.get('pages', {}).values():
+            page['image'] = None
+        parts.append({'page_map': [[docling_page, page] for docling_page, page in page_map.items()],
+                      'document': data})
+    return json.dumps({'parts': parts}, separators=(',', ':')).encode('utf-8')
+
+def store_docling_documents(plan, documents):
+    """Keep the Docling documents of a fresh extraction for /documents/<result_id>/export"""
+    if not plan['cache'] or not documents:
+        return
+    try:
+        data = serialize_docling_documents(documents)
+        if data is not None:
+            plan['cache'].put_blob(plan['cache_key'], 'docling', data)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to store the Docling document: {e}")
+
+def extract_with_cache(pdf_path, content_hash=None, options=None, background=False, refresh=False, filename=None):
+    """Convert a local document, serving repeated content from the extraction cache.
+
+    ``content_hash`` may be passed when it was already computed (e.g. while
+    spooling an upload). ``options`` comes from ``read_extraction_options``.
+    Formats with a native parser are converted inline, without admission;
+    images are converted as a one-page PDF.
+    Cache misses go through admission control and raise ``AdmissionRejected``
+    when the conversion cannot be admitted within ADMISSION_QUEUE_TIMEOUT, or
+    ``FlightBusy`` when an identical conversion outlasts the wait for it
+    (``background`` callers such as job workers wait as long as needed).
+    ``refresh`` converts even when the entry is cached (used when profiling).
+    Returns ``(entry, cache_hit)`` where ``entry`` holds ``content`` and
+    ``metadata`` (including the ``content_hash`` of the PDF).
+    """
+    plan = plan_extraction(pdf_path, content_hash, options, filename)
+
+    entry = None if refresh else lookup_cached_entry(plan)
+    if entry is not None:
+        return entry, True
+
+    if plan['format'] in NATIVE_PARSERS:
+        # Milliseconds of work: not worth queueing behind PDF conversions
+        entry = convert_native(pdf_path, plan['format'])
+        logger.info(f"📝 Parsed {plan['format']} natively in {entry['metadata']['conversion_seconds']}s")
+        return store_entry(plan, entry), False
+
+    # Identical conversions already running (retries, other workers) are waited for
+    with nullcontext(SimpleNamespace(entry=None)) if refresh else join_flight(plan, background) as flight:
+        if flight.entry is not None:
+            logger.info(f"🤝 Reusing the concurrent conversion of {plan['content_hash'][:12]}")
+            return flight.entry, False
+
+        with image_as_pdf(pdf_path) if plan['format'] == 'image' else nullcontext(pdf_path) as source_path:
+            cost_mb = estimate_extraction_mb(source_path, plan['pages'], plan['quality'])
+            # Without a cache there is nowhere to keep the documents, so they are not collected
+            with get_admission_controller().admit(cost_mb, None if background else ADMISSION_QUEUE_TIMEOUT), \
+                    collect_docling_documents() if plan['cache'] else nullcontext([]) as documents:
+                entry = convert_pdf(source_path, pages=plan['pages'], fast_path=plan['fast_path'],
+                                    quality=plan['quality'])
+            record_conversion(source_path, plan, entry)
+        flight.entry = store_entry(plan, entry)
+        store_docling_documents(plan, documents)
+        return flight.entry, False
+
+def replay_cached_entry(entry):
+    """Yield the page fragments of a cached entry from its stored spans"""
+    content = entry['content']
+    methods = {item['page']: item for item in entry['metadata'].get('page_methods', [])}
+    default_method = entry['metadata'].get('parser', 'docling')
+    for page_no, start, end in entry.get('page_spans') or [[None, 0, len(content)]]:
+        method = methods.get(page_no, {})
+        yield {
+            'page': page_no,
+            'method': method.get('method', default_method),
+            'reason': method.get('reason'),
+            'markdown': content[start:end],
+        }
+
+def iter_extraction(pdf_path, plan):
+    """Streaming counterpart of ``extract_with_cache`` for a cache miss.
+
+    Yields ``('page', fragment)`` records while the conversion runs, then a
+    single ``('done', entry, False)``. Admission is up to the caller.
+    """
+    start_time = time.time()
+    # Keep the markdown only when it has to be written to the cache
+    keep_content = plan['cache'] is not None
+    fragments = []
+    word_count = character_count = 0
+
+    with collect_docling_documents() if keep_content else nullcontext([]) as documents:
+        for fragment in iter_page_fragments(pdf_path, plan['pages'], fast_path=plan['fast_path'],
+                                            docling_batch_pages=STREAM_DOCLING_BATCH_PAGES,
+                                            quality=plan['quality']):
+            word_count += len(fragment['markdown'].split())
+            character_count += len(fragment['markdown'])
+            fragments.append(fragment if keep_content else dict(fragment, markdown=''))
+            yield 'page', fragment
+
+    entry = assemble_entry(fragments, start_time)
+    if not keep_content:
+        entry['metadata'].update(word_count=word_count, character_count=character_count)
+    record_conversion(pdf_path, plan, entry)
+    entry = store_entry(plan, entry)
+    store_docling_documents(plan, documents)
+    yield 'done', entry, False
+
+class DownloadError(Exception):
+    """A remote PDF could not be downloaded (``status`` is the HTTP status to answer with)"""
+
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+class DownloadStore:
+    """Content-addressed store of downloaded PDFs plus a URL -> validators map.
+
+    Files live at ``<sha256[:2]>/<sha256>.pdf`` and are evicted least recently
+    used first above ``max_bytes``. The map (SQLite, shared by all workers)
+    remembers each URL's ETag/Last-Modified and content hash. Callers get hard
+    links to stored files, so eviction never pulls a file from under a conversion.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url_key TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(os.path.join(self.directory, 'urls.db'), timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    def _path(self, content_hash):
+        return os.path.join(self.directory, content_hash[:2], f'{content_hash}.pdf')
+
+    def lookup(self, url_key):
+        """Validators and content hash of a URL whose file is still stored, or None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM urls WHERE url_key = ?', (url_key,)).fetchone()
+        if row is None or not os.path.exists(self._path(row['content_hash'])):
+            return None
+        return dict(row)
+
+    def remember(self, url_key, etag, last_modified, content_hash, size):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?, ?)',
+                         (url_key, etag, last_modified, content_hash, size, time.time()))
+
+    def checkout(self, content_hash, path):
+        """Hard-link a stored file to ``path``; False if it has been evicted"""
+        try:
+            os.link(self._path(content_hash), path)
+        except OSError:
+            return False
+        os.utime(self._path(content_hash), None)  # Mark as recently used
+        return True
+
+    def add(self, path, content_hash):
+        stored = self._path(content_hash)
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        try:
+            os.link(path, stored)
+        except FileExistsError:
+            os.utime(stored, None)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.pdf'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            remove_file(path)
+            total_size -= size
+
+_download_store = None
+_http_session = None
+_http_session_pid = None
+
+def get_download_store():
+    """Get or create the download store, or None if disabled or unusable"""
+    global _download_store
+    if DOWNLOAD_STORE_MAX_BYTES <= 0:
+        return None
+    if _download_store is None:
+        try:
+            _download_store = DownloadStore(DOWNLOAD_DIR, DOWNLOAD_STORE_MAX_BYTES)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"⚠️ Download store disabled: {e}")
+            return None
+    return _download_store
+
+def get_http_session():
+    """Pooled ``requests.Session`` with retries, one per process (never shared across a fork)"""
+    global _http_session, _http_session_pid
+    if _http_session is None or _http_session_pid != os.getpid():
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                      allowed_methods=('GET', 'HEAD'), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=DOWNLOAD_POOL_SIZE, pool_maxsize=DOWNLOAD_POOL_SIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = 'docling-service'
+        _http_session, _http_session_pid = session, os.getpid()
+    return _http_session
+
+def url_cache_key(pdf_url):
+    """The URL without signature/expiry query parameters"""
+    from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+    parts = urlsplit(pdf_url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if name.lower() not in SIGNED_URL_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ''))
+
+def check_download_deadline(deadline):
+    if time.time() > deadline:
+        raise DownloadError(f'Download took longer than {DOWNLOAD_DEADLINE_SECONDS}s', status=504)
+
+def check_download_size(size):
+    if size > DOWNLOAD_MAX_BYTES:
+        raise DownloadError(f'Remote PDF is larger than {DOWNLOAD_MAX_BYTES // (1024 * 1024)} MB', status=413)
+
+def abort_download(response):
+    """Shut the socket down so a read blocked in another thread returns at once"""
+    try:
+        response.raw.shutdown()  # close() alone waits for the blocked read
+    except (RuntimeError, ValueError):
+        pass  # The connection was already released
+    response.close()
+
+@contextmanager
+def download_deadline(response, deadline):
+    """Abort ``response`` once the deadline passes, so a trickling body cannot hold a worker"""
+    timer = threading.Timer(max(0.0, deadline - time.time()), abort_download, args=(response,))
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    except Exception:
+        check_download_deadline(deadline)  # Report the deadline rather than the closed connection
+        raise
+    finally:
+        timer.cancel()
+    check_download_deadline(deadline)
+
+def stream_download(response, path, deadline):
+    """Write a streamed response body to ``path``; returns ``(size, content_hash)``"""
+    size = 0
+    sha256 = hashlib.sha256()
+    with open(path, 'wb') as f, download_deadline(response, deadline):
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            check_download_size(size)
+            sha256.update(chunk)
+            f.write(chunk)
+    expected = response.headers.get('Content-Length')
+    if expected and not response.headers.get('Content-Encoding') and size != int(expected):
+        raise DownloadError('Truncated download')
+    return size, sha256.hexdigest()
+
+def download_ranges(session, pdf_url, path, size, validator, deadline):
+    """Fetch ``size`` bytes as DOWNLOAD_PARALLEL_PARTS concurrent range requests into ``path``"""
+    part_size = math.ceil(size / DOWNLOAD_PARALLEL_PARTS)
+
+    def fetch_part(start):
+        end = min(start + part_size, size) - 1
+        headers = {'Range': f'bytes={start}-{end}', 'If-Range': validator}
+        with session.get(pdf_url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            # A 200 here means the file changed since the first response (If-Range)
+            if response.status_code != 206 or not response.headers.get('Content-Range', '').startswith(f'bytes {start}-'):
+                raise DownloadError('Remote PDF changed during a ranged download')
+            offset = start
+            with download_deadline(response, deadline):
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+        if offset != end + 1:
+            raise DownloadError('Truncated range response')
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.ftruncate(fd, size)
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_PARALLEL_PARTS) as pool:
+            for future in [pool.submit(fetch_part, start) for start in range(0, size, part_size)]:
+                future.result()
+    finally:
+        os.close(fd)
+
+def download_pdf(pdf_url, conditional=True):
+    """Download a remote PDF to a spool file (the caller removes it).
+
+    Returns ``(path, content_hash)``; the hash is computed while streaming
+    (or taken from the store on a 304) so the file is never read back for it.
+
+    Uses the pooled session with per-request timeouts, an overall deadline
+    and a size cap. Large files served with ``Accept-Ranges`` are fetched as
+    parallel range requests. A URL seen before is revalidated with
+    ``If-None-Match``/``If-Modified-Since``; a 304 is served from the store.
+    Failures raise ``DownloadError``.
+    """
+    store = get_download_store()
+    url_key = url_cache_key(pdf_url)
+    known = store.lookup(url_key) if store and conditional else None
+    headers = {}
+    if known is not None:
+        if known['etag']:
+            headers['If-None-Match'] = known['etag']
+        if known['last_modified']:
+            headers['If-Modified-Since'] = known['last_modified']
+
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix='.pdf')
+    os.close(fd)
+    deadline = time.time() + DOWNLOAD_DEADLINE_SECONDS
+    session = get_http_session()
+    try:
+        with timed_stage('download', DOWNLOAD_SECONDS):
+            with session.get(pdf_url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 304 and known is not None:
+                    remove_file(path)
+                    if store.checkout(known['content_hash'], path):
+                        logger.info(f"♻️ Not modified, reusing stored download {known['content_hash'][:12]}")
+                        DOWNLOADS.inc(outcome='not_modified')
+                        return path, known['content_hash']
+                    return download_pdf(pdf_url, conditional=False)  # Evicted meanwhile
+                if response.status_code >= 400:
+                    raise DownloadError(f'Remote server answered {response.status_code}')
+
+                size = int(response.headers.get('Content-Length') or 0)
+                check_download_size(size)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                validator = etag if etag and not etag.startswith('W/') else last_modified
+                ranged = (response.status_code == 200 and size >= DOWNLOAD_PARALLEL_MIN_BYTES and validator
+                          and response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+                          and 'Content-Encoding' not in response.headers)
+                if not ranged:
+                    size, content_hash = stream_download(response, path, deadline)
+            if ranged:
+                download_ranges(session, pdf_url, path, size, validator, deadline)
+                content_hash = hash_file(path)  # Parts arrive out of order
+
+        DOWNLOADS.inc(outcome='ranged' if ranged else 'downloaded')
+        DOWNLOADED_BYTES.inc(size)
+        if store is not None and (etag or last_modified):
+            try:
+                store.add(path, content_hash)
+                store.remember(url_key, etag, last_modified, content_hash, size)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ Failed to keep download for revalidation: {e}")
+        return path, content_hash
+    except requests.Timeout:
+        remove_file(path)
+        DOWNLOADS.inc(outcome='error')
+        raise DownloadError('Timed out downloading the remote PDF', status=504)
+    except requests.RequestException as e:
+        remove_file(path)
+        DOWNLOADS.inc(outcome='error')
+        raise DownloadError(f'Could not download the remote PDF: {e}')
+    except Exception:
+        remove_file(path)
+        DOWNLOADS.inc(outcome='error')
+        raise
+
+def remove_file(path):
+    """Delete a file, ignoring errors (used for temp/spool cleanup)"""
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+def declared_name(filename, pdf_url):
+    """Name a document was sent under: the client's ``filename``, else the URL's last path segment"""
+    from urllib.parse import unquote, urlsplit
+    return filename or os.path.basename(unquote(urlsplit(pdf_url or '').path))
+
+def fetch_pdf(pdf_url):
+    """Resolve ``pdf_url`` to a local path, downloading remote PDFs.
+
+    Returns ``(path, is_temporary, content_hash)``; ``path`` is None when the
+    PDF cannot be accessed and ``content_hash`` is only known for downloads.
+    Temporary files must be removed by the caller.
+    """
+    processed_url = process_pdf_url(pdf_url)
+    if not processed_url:
+        return None, False, None
+    if processed_url.startswith(('http://', 'https://')):
+        path, content_hash = download_pdf(processed_url)
+        return path, True, content_hash
+    return processed_url, False, None
+
+def build_extraction_response(entry, filename, extraction_method, cache_hit):
+    """Build the JSON body shared by /extract, /upload and /batch_extract"""
+    # Extract title from filename if not available from document
+    doc_title = os.path.splitext(filename)[0].replace('_', ' ').replace('-', ' ').title()
+    
+    return {
+        'success': True,
+        'title': doc_title,
+        'content': entry['content'],
+        'metadata': {
+            **entry['metadata'],
+            'filename': filename,
+            'extraction_method': extraction_method,
+            'cached': cache_hit,
+        },
+        'extraction_confidence': 0.95
+    }
+
+def read_response_shape(values):
+    """Validate ``fields``, ``content_offset``/``content_limit`` and ``content_pages``.
+
+    Returns None when the full body was asked for. ``fields`` is a comma
+    separated (or JSON) list of top-level keys or dotted paths such as
+    ``metadata.word_count``.
+    """
+    shape = {}
+    fields = values.get('fields')
+    if fields not in (None, '', []):
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        if not isinstance(fields, (list, tuple)) or not all(isinstance(field, str) for field in fields):
+            raise InvalidOptionError('fields must be a comma separated list of field names')
+        shape['fields'] = [field.strip() for field in fields if field.strip()]
+
+    for name in ('content_offset', 'content_limit'):
+        value = values.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise InvalidOptionError(f'{name} must be an integer')
+        if value < (1 if name == 'content_limit' else 0):
+            raise InvalidOptionError(f'{name} must be at least {1 if name == "content_limit" else 0}')
+        shape[name] = value
+
+    content_pages = values.get('content_pages')
+    if content_pages not in (None, '', []):
+        if 'content_offset' in shape or 'content_limit' in shape:
+            raise InvalidOptionError('content_pages cannot be combined with content_offset/content_limit')
+        shape['content_pages'] = parse_page_spec(content_pages)
+    return shape or None
+
+def select_fields(body, fields):
+    """Copy only the given (dotted) fields of a response body; ``success`` is always kept"""
+    selected = {'success': body.get('success', True)}
+    for field in fields:
+        source, target = body, selected
+        *parents, leaf = field.split('.')
+        for name in parents:
+            source = source.get(name) if isinstance(source, dict) else None
+            if source is None:
+                break
+            target = target.setdefault(name, {})
+        if isinstance(source, dict) and leaf in source:
+            target[leaf] = source[leaf]
+    return selected
+
+def shape_extraction_response(body, shape, page_spans=None):
+    """Apply a ``read_response_shape`` result to an extraction body.
+
+    Slices ``content`` by character offset/limit or by page (using the
+    stored ``page_spans``), describes the slice in ``content_range`` and
+    then keeps only the requested fields.
+    """
+    if not shape:
+        return body
+    content = body.get('content')
+    if content is not None and ('content_offset' in shape or 'content_limit' in shape):
+        start = min(shape.get('content_offset', 0), len(content))
+        end = len(content) if 'content_limit' not in shape else min(start + shape['content_limit'], len(content))
+        body['content'] = content[start:end]
+        body['content_range'] = {
+            'offset': start,
+            'length': end - start,
+            'total': len(content),
+            'next_offset': end if end < len(content) else None,
+        }
+    elif content is not None and 'content_pages' in shape:
+        if not page_spans:
+            raise InvalidOptionError('content_pages needs per-page spans (fast path extraction)')
+        spans = [
+            (page_no, start, end) for page_no, start, end in page_spans
+            if any(low <= page_no and (high is None or page_no <= high) for low, high in shape['content_pages'])
+        ]
+        body['content'] = '\n\n'.join(content[start:end] for _, start, end in spans)
+        body['content_range'] = {
+            'pages': [page_no for page_no, _, _ in spans],
+            'available_pages': [page_no for page_no, _, _ in page_spans],
+            'total': len(content),
+        }
+
+    if 'fields' in shape:
+        fields = shape['fields'] + (['content_range'] if 'content_range' in body else [])
+        body = select_fields(body, fields)
+    return body
+
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+TABLE_SEPARATOR_PATTERN = re.compile(r'^\|?\s*:?-{3,}')
+
+def estimate_tokens(text):
+    """Approximate token count (about 4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+def split_markdown_blocks(content):
+    """Split markdown into heading, table, code and paragraph blocks with character offsets"""
+    lines = content.splitlines(keepends=True)
+    blocks = []
+    offset = 0
+    index = 0
+    while index < len(lines):
+        stripped = lines[index].strip()
+        if not stripped:
+            offset += len(lines[index])
+            index += 1
+            continue
+
+        heading = HEADING_PATTERN.match(stripped)
+        end_index = index + 1
+        if heading:
+            kind = 'heading'
+        elif stripped.startswith('```'):
+            kind = 'code'
+            while end_index < len(lines) and not lines[end_index].strip().startswith('```'):
+                end_index += 1
+            end_index = min(end_index + 1, len(lines))
+        elif stripped.startswith('|'):
+            kind = 'table'
+            while end_index < len(lines) and lines[end_index].strip().startswith('|'):
+                end_index += 1
+        else:
+            kind = 'text'
+            while end_index < len(lines):
+                following = lines[end_index].strip()
+                if not following or following.startswith(('|', '```')) or HEADING_PATTERN.match(following):
+                    break
+                end_index += 1
+
+        text = ''.join(lines[index:end_index])
+        block = {'kind': kind, 'text': text.rstrip('\n'), 'start': offset, 'end': offset + len(text.rstrip('\n'))}
+        if heading:
+            block['level'] = len(heading.group(1))
+            block['title'] = heading.group(2)
+        blocks.append(block)
+        offset += len(text)
+        index = end_index
+    return blocks
+
+def split_text_spans(text, max_chars):
+    """Offsets of pieces of at most ~``max_chars``, cut at sentence ends where possible"""
+    spans = []
+    start = end = 0
+    sentence_end = None
+    for match in re.finditer(r'\S+\s*', text):
+        if match.end() - start > max_chars and end > start:
+            cut = sentence_end if sentence_end and sentence_end - start > max_chars // 2 else end
+            spans.append((start, cut))
+            start = cut
+            sentence_end = None
+        end = match.end()
+        if re.search(r'[.!?]["\')\]]?\s*$', match.group()):
+            sentence_end = end
+    if end > start:
+        spans.append((start, end))
+    return spans
+
+def split_block(block, max_tokens):
+    """Split a block larger than ``max_tokens``; table pieces repeat the header rows"""
+    if estimate_tokens(block['text']) <= max_tokens:
+        return [block]
+
+    if block['kind'] == 'table':
+        lines = block['text'].split('\n')
+        header_size = 2 if len(lines) > 2 and TABLE_SEPARATOR_PATTERN.match(lines[1].strip()) else 0
+        header = '\n'.join(lines[:header_size])
+        pieces = []
+        rows = []
+        offset = block['start'] + sum(len(line) + 1 for line in lines[:header_size])
+        row_start = offset
+        for line in lines[header_size:]:
+            candidate = '\n'.join(([header] if header else []) + rows + [line])
+            if rows and estimate_tokens(candidate) > max_tokens:
+                pieces.append({'kind': 'table', 'text': '\n'.join(([header] if header else []) + rows),
+                               'start': row_start, 'end': offset - 1})
+                rows = []
+                row_start = offset
+            rows.append(line)
+            offset += len(line) + 1
+        pieces.append({'kind': 'table', 'text': '\n'.join(([header] if header else []) + rows),
+                       'start': row_start, 'end': block['end']})
+        return pieces
+
+    return [
+        {'kind': block['kind'], 'text': block['text'][start:end].strip(),
+         'start': block['start'] + start, 'end': block['start'] + end}
+        for start, end in split_text_spans(block['text'], max_tokens * 4)
+    ]
+
+def chunk_markdown(content, page_spans=None, max_tokens=None):
+    """Group extracted markdown into chunks of at most ``max_tokens`` that follow its structure.
+
+    A heading starts a new chunk; paragraphs, tables and code blocks are
+    added whole while they fit, and blocks that are too large on their own
+    are split (paragraphs at sentence ends, tables by rows with the header
+    repeated). Each chunk carries its section path (enclosing headings),
+    the pages it covers (from ``page_spans``) and an approximate token count.
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    spans = sorted(page_spans or [], key=lambda span: span[1])
+
+    def pages_between(start, end):
+        if not spans:
+            return None
+        return sorted({page for page, span_start, span_end in spans
+                       if page is not None and span_start < end and start < span_end})
+
+    chunks = []
+    section = []
+    current = None
+
+    def new_chunk():
+        return {'parts': [], 'section_path': [title for _, title in section], 'start': None, 'end': None,
+                'has_body': False}
+
+    def add(chunk, block):
+        chunk['parts'].append(block['text'])
+        chunk['start'] = block['start'] if chunk['start'] is None else chunk['start']
+        chunk['end'] = block['end']
+
+    def flush(chunk):
+        if chunk is None or not chunk['has_body']:
+            return
+        text = '\n\n'.join(chunk['parts'])
+        chunks.append({
+            'index': len(chunks),
+            'text': text,
+            'tokens': estimate_tokens(text),
+            'section_path': chunk['section_path'],
+            'pages': pages_between(chunk['start'], chunk['end']),
+            'start': chunk['start'],
+            'end': chunk['end'],
+        })
+
+    for block in split_markdown_blocks(content):
+        if block['kind'] == 'heading':
+            section = [entry for entry in section if entry[0] < block['level']] + [(block['level'], block['title'])]
+            if current is not None and current['has_body']:
+                flush(current)
+                current = None
+            if current is None:
+                current = new_chunk()
+            # Consecutive headings stay together with the content that follows them
+            current['section_path'] = [title for _, title in section]
+            add(current, block)
+            continue
+
+        for piece in split_block(block, max_tokens):
+            if current is None:
+                current = new_chunk()
+            elif current['has_body'] and \
+                    estimate_tokens('\n\n'.join(current['parts'] + [piece['text']])) > max_tokens:
+                flush(current)
+                current = new_chunk()
+            add(current, piece)
+            current['has_body'] = True
+
+    if current is not None and not current['has_body'] and current['parts']:
+        current['has_body'] = True  # Trailing headings without content
+    flush(current)
+    return chunks
+
+def read_chunk_size(values, required=False):
+    """``max_tokens`` to chunk with, or None when chunks were not requested"""
+    max_tokens = values.get('max_tokens')
+    if max_tokens in (None, ''):
+        if required or parse_bool(values.get('chunk', False)):
+            return CHUNK_MAX_TOKENS
+        return None
+    try:
+        max_tokens = int(max_tokens)
+    except (TypeError, ValueError):
+        raise InvalidOptionError('max_tokens must be an integer')
+    if not CHUNK_MIN_TOKENS <= max_tokens <= CHUNK_LIMIT_TOKENS:
+        raise InvalidOptionError(f'max_tokens must be between {CHUNK_MIN_TOKENS} and {CHUNK_LIMIT_TOKENS}')
+    return max_tokens
+
+def add_chunks(body, entry, max_tokens):
+    """Attach structure-aware chunks of the entry's content to a response body"""
+    body['chunks'] = chunk_markdown(entry['content'], entry.get('page_spans'), max_tokens)
+    body['metadata']['chunk_count'] = len(body['chunks'])
+    body['metadata']['max_tokens'] = max_tokens
+    return body
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[\'’][a-z]+)?')
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from has have in is it its of on or that the this to was were will with'.split())
+
+class HashingEmbedder:
+    """Signed feature hashing of word unigrams and bigrams: no model, fully offline"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.name = f'hashing-v1-{dim}'
+
+    def embed(self, texts):
+        np = lazy_import('numpy')
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+            features = {}
+            for feature in itertools.chain(words, (f'{a} {b}' for a, b in zip(words, words[1:]))):
+                features[feature] = features.get(feature, 0) + 1
+            for feature, count in features.items():
+                digest = zlib.crc32(feature.encode('utf-8'))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                matrix[row, digest % self.dim] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+class SentenceTransformerEmbedder:
+    """Small CPU sentence-embedding model (sentence-transformers)"""
+
+    def __init__(self, model_name):
+        SentenceTransformer = lazy_import('sentence_transformers').SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f'st:{model_name}'
+
+    def embed(self, texts):
+        np = lazy_import('numpy')
+        vectors = self.model.encode(list(texts), batch_size=32, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    """Embedding model from DOCLING_EMBEDDING_MODEL, else the hashing fallback"""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            if EMBEDDING_MODEL:
+                try:
+                    _embedder = SentenceTransformerEmbedder(EMBEDDING_MODEL)
+                    logger.info(f"✅ Loaded embedding model {EMBEDDING_MODEL} ({_embedder.dim} dims)")
+                except Exception as e:
+                    logger.warning(f"⚠️ Embedding model unavailable, using hashing embeddings: {e}")
+            if _embedder is None:
+                _embedder = HashingEmbedder(EMBEDDING_DIM)
+    return _embedder
+
+class VectorIndex:
+    """Append-only per-user chunk index: float32 vectors memory-mapped for search.
+
+    Files in the user's directory:
+    ``vectors.f32`` (row-major float32 embeddings), ``chunks.jsonl`` (one
+    JSON record per row), ``offsets.u64`` (byte offset of each record) and
+    ``meta.json`` (embedder, dimension, committed row count, documents).
+    Rows past the committed count (an interrupted append) are truncated
+    before the next append. Appends take an exclusive ``flock`` so gunicorn
+    workers can share an index; readers never block.
+    """
+
+    def __init__(self, directory, embedder_name, dim):
+        self.directory = directory
+        self.embedder_name = embedder_name
+        self.dim = dim
+        self._vectors_path = os.path.join(directory, 'vectors.f32')
+        self._chunks_path = os.path.join(directory, 'chunks.jsonl')
+        self._offsets_path = os.path.join(directory, 'offsets.u64')
+        self._meta_path = os.path.join(directory, 'meta.json')
+        self._lock_path = os.path.join(directory, 'lock')
+        self._mapped = None  # (count, vectors memmap, offsets memmap)
+
+    def read_meta(self):
+        try:
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return {'embedder': self.embedder_name, 'dim': self.dim, 'count': 0, 'chunks_bytes': 0, 'documents': {}}
+        if meta['embedder'] != self.embedder_name or meta['dim'] != self.dim:
+            raise ValueError(f"Index was built with {meta['embedder']} ({meta['dim']} dims), "
+                             f"not {self.embedder_name}; delete it to re-index")
+        return meta
+
+    def has_document(self, document_id):
+        return document_id in self.read_meta()['documents']
+
+    @contextmanager
+    def _exclusive(self):
+        import fcntl
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add_document(self, document_id, records, vectors):
+        """Append one document's chunk records and vectors; returns False if it was already indexed"""
+        np = lazy_import('numpy')
+        with self._exclusive():
+            meta = self.read_meta()
+            if document_id in meta['documents']:
+                return False
+
+            count = meta['count']
+            # Drop whatever an interrupted append left past the committed rows
+            for path, size in ((self._vectors_path, count * self.dim * 4), (self._offsets_path, count * 8),
+                               (self._chunks_path, meta['chunks_bytes'])):
+                with open(path, 'ab') as f:
+                    f.truncate(size)
+
+            offsets = []
+            position = meta['chunks_bytes']
+            with open(self._chunks_path, 'ab') as f:
+                for record in records:
+                    line = (json.dumps(dict(record, document_id=document_id)) + '\n').encode('utf-8')
+                    offsets.append(position)
+                    f.write(line)
+                    position += len(line)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._vectors_path, 'ab') as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._offsets_path, 'ab') as f:
+                f.write(np.asarray(offsets, dtype=np.uint64).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            meta['documents'][document_id] = {
+                'filename': records[0].get('filename') if records else None,
+                'rows': [count, count + len(records)],
+                'added_at': time.time(),
+            }
+            meta['count'] = count + len(records)
+            meta['chunks_bytes'] = position
+            temp_path = f'{self._meta_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(meta, f)
+            os.replace(temp_path, self._meta_path)
+            return True
+
+    def _map(self, count):
+        """Memory-map the first ``count`` rows (re-mapped only when the index grew)"""
+        np = lazy_import('numpy')
+        if self._mapped is None or self._mapped[0] != count:
+            vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(count, self.dim))
+            offsets = np.memmap(self._offsets_path, dtype=np.uint64, mode='r', shape=(count,))
+            self._mapped = (count, vectors, offsets)
+        return self._mapped[1], self._mapped[2]
+
+    def search(self, query_vector, k=10, document_id=None, block_rows=65536):
+        """Top-``k`` rows by cosine similarity as ``(score, record)`` pairs"""
+        np = lazy_import('numpy')
+        meta = self.read_meta()
+        count = meta['count']
+        if count == 0:
+            return [], 0
+
+        vectors, offsets = self._map(count)
+        start, end = 0, count
+        if document_id is not None:
+            if document_id not in meta['documents']:
+                return [], count
+            start, end = meta['documents'][document_id]['rows']
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = np.empty(end - start, dtype=np.float32)
+        # Blocked matrix-vector products keep the temporary memory bounded
+        for block_start in range(start, end, block_rows):
+            block_end = min(block_start + block_rows, end)
+            scores[block_start - start:block_end - start] = vectors[block_start:block_end] @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        records = self.read_records([start + int(row) for row in top], count)
+        return [(float(scores[row]), record) for row, record in zip(top, records)], count
+
+    def read_records(self, rows, count=None):
+        """Chunk records stored at ``rows``"""
+        if count is None:
+            count = self.read_meta()['count']
+        _, offsets = self._map(count)
+        records = []
+        with open(self._chunks_path, 'rb') as f:
+            for row in rows:
+                f.seek(int(offsets[row]))
+                records.append(json.loads(f.readline()))
+        return records
+
+    def close(self):
+        """Drop the memory maps (unmapped once no in-flight search holds them)"""
+        self._mapped = None
+
+def encode_varint(value, out):
+    """Append ``value`` as a LEB128 varint to the bytearray ``out``"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_postings(data):
+    """Decode ``(doc_delta, tf)`` varint pairs back into ``[(row, tf), ...]``"""
+    postings = []
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+    row = 0
+    for index in range(0, len(values), 2):
+        row += values[index]
+        postings.append((row, values[index + 1]))
+    return postings
+
+def encode_postings(postings):
+    """Encode ``[(row, tf), ...]`` (ascending rows) as delta/tf varint pairs"""
+    out = bytearray()
+    previous = 0
+    for row, tf in postings:
+        encode_varint(row - previous, out)
+        encode_varint(tf, out)
+        previous = row
+    return bytes(out)
+
+def keyword_terms(text):
+    """Lower-cased word tokens without stop words (shared by indexing and queries)"""
+    return [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+class KeywordIndex:
+    """On-disk BM25 inverted index over the chunks of a user's ``VectorIndex``.
+
+    Rows are the vector index's rows, so results share its chunk records.
+    Every added document becomes an immutable segment: ``kw-<n>.post``
+    (varint delta-encoded row ids and term frequencies) and ``kw-<n>.json``
+    (term -> offset, length, document frequency). While there are more than
+    KEYWORD_MAX_SEGMENTS, the KEYWORD_MERGE_SEGMENTS smallest are merged, so
+    large segments are rewritten rarely. Chunk lengths live in
+    ``kw-lengths.u32`` and ``kw-meta.json`` (written last) commits the state.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.directory = store.directory
+        self._meta_path = os.path.join(self.directory, 'kw-meta.json')
+        self._lengths_path = os.path.join(self.directory, 'kw-lengths.u32')
+        self._segments = {}  # segment number -> (terms, mmap of postings)
+        self._lengths = None  # memmap of kw-lengths.u32, re-mapped when the file grows
+
+    def read_meta(self):
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'segments': [], 'next_segment': 1, 'documents': {}, 'chunk_count': 0, 'total_length': 0}
+
+    def _write_meta(self, meta):
+        temp_path = f'{self._meta_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self._meta_path)
+
+    def has_document(self, document_id):
+        return document_id in self.read_meta()['documents']
+
+    def _segment_paths(self, number):
+        base = os.path.join(self.directory, f'kw-{number:06d}')
+        return f'{base}.post', f'{base}.json'
+
+    def _write_segment(self, number, postings_by_term):
+        postings_path, terms_path = self._segment_paths(number)
+        terms = {}
+        with open(postings_path, 'wb') as f:
+            offset = 0
+            for term in sorted(postings_by_term):
+                data = encode_postings(postings_by_term[term])
+                f.write(data)
+                terms[term] = [offset, len(data), len(postings_by_term[term])]
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(terms_path, 'w') as f:
+            json.dump(terms, f)
+
+    def _load_segment(self, number):
+        segment = self._segments.get(number)
+        if segment is None:
+            import mmap
+            postings_path, terms_path = self._segment_paths(number)
+            with open(terms_path) as f:
+                terms = json.load(f)
+            with open(postings_path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(postings_path) else b''
+            segment = self._segments[number] = (terms, data)
+        return segment
+
+    def _map_lengths(self):
+        """Chunk lengths by row, memory-mapped once and re-mapped only after an append"""
+        np = lazy_import('numpy')
+        rows = os.path.getsize(self._lengths_path) // 4
+        if self._lengths is None or len(self._lengths) != rows:
+            self._lengths = np.memmap(self._lengths_path, dtype=np.uint32, mode='r', shape=(rows,))
+        return self._lengths
+
+    def _postings(self, number, term):
+        terms, data = self._load_segment(number)
+        location = terms.get(term)
+        if location is None:
+            return []
+        offset, length, _ = location
+        return decode_postings(data[offset:offset + length])
+
+    def add_document(self, document_id, first_row, texts):
+        """Index the chunk ``texts`` stored at rows ``first_row...``; False if already indexed"""
+        np = lazy_import('numpy')
+        with self.store._exclusive():
+            meta = self.read_meta()
+            if document_id in meta['documents']:
+                return False
+
+            postings_by_term = {}
+            lengths = []
+            for offset, text in enumerate(texts):
+                terms = keyword_terms(text)
+                lengths.append(len(terms))
+                frequencies = {}
+                for term in terms:
+                    frequencies[term] = frequencies.get(term, 0) + 1
+                for term, tf in frequencies.items():
+                    postings_by_term.setdefault(term, []).append((first_row + offset, tf))
+
+            number = meta['next_segment']
+            self._write_segment(number, postings_by_term)
+            fd = os.open(self._lengths_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.pwrite(fd, np.asarray(lengths, dtype=np.uint32).tobytes(), first_row * 4)
+            finally:
+                os.close(fd)
+
+            meta['segments'].append(number)
+            meta['next_segment'] = number + 1
+            meta['documents'][document_id] = [first_row, first_row + len(texts)]
+            meta['chunk_count'] += len(texts)
+            meta['total_length'] += sum(lengths)
+            replaced = meta.pop('obsolete_segments', [])  # Left behind by older versions
+            while len(meta['segments']) > KEYWORD_MAX_SEGMENTS:
+                replaced.extend(self._merge(meta))
+            self._write_meta(meta)
+            # Replaced files go as soon as the new meta is committed; open mmaps stay valid
+            for number in replaced:
+                for path in self._segment_paths(number):
+                    remove_file(path)
+            return True
+
+    def _merge(self, meta):
+        """Merge the KEYWORD_MERGE_SEGMENTS smallest segments into one; returns the replaced numbers"""
+        sizes = {number: os.path.getsize(self._segment_paths(number)[0]) for number in meta['segments']}
+        replaced = sorted(meta['segments'], key=lambda number: (sizes[number], number))[:KEYWORD_MERGE_SEGMENTS]
+        merged = {}
+        for number in replaced:
+            terms, _ = self._load_segment(number)
+            for term in terms:
+                merged.setdefault(term, []).extend(self._postings(number, term))
+        for postings in merged.values():
+            postings.sort()  # Merged segments need not be adjacent
+        number = meta['next_segment']
+        self._write_segment(number, merged)
+        meta['segments'] = [segment for segment in meta['segments'] if segment not in replaced] + [number]
+        meta['next_segment'] = number + 1
+        for segment in replaced:
+            self._segments.pop(segment, None)
+        return replaced
+
+    def _term_postings(self, meta, terms):
+        """``{term: postings}`` over the segments of ``meta``"""
+        for number in list(self._segments):
+            if number not in meta['segments']:
+                del self._segments[number]  # Merged away (by this or another process)
+        postings = {}
+        for term in terms:
+            for number in meta['segments']:
+                postings.setdefault(term, []).extend(self._postings(number, term))
+        return postings
+
+    def search(self, query, k=10, document_id=None):
+        """Top-``k`` rows by BM25 as ``(score, row)`` pairs"""
+        np = lazy_import('numpy')
+        meta = self.read_meta()
+        chunk_count = meta['chunk_count']
+        terms = set(keyword_terms(query))
+        if not chunk_count or not terms:
+            return [], chunk_count
+
+        row_range = None
+        if document_id is not None:
+            if document_id not in meta['documents']:
+                return [], chunk_count
+            row_range = meta['documents'][document_id]
+
+        try:
+            postings_by_term = self._term_postings(meta, terms)
+        except FileNotFoundError:
+            # A merge replaced the segments after the meta was read: the new meta has them
+            meta = self.read_meta()
+            chunk_count = meta['chunk_count']
+            postings_by_term = self._term_postings(meta, terms)
+
+        candidates = sorted({row for postings in postings_by_term.values() for row, _ in postings
+                             if not row_range or row_range[0] <= row < row_range[1]})
+        if not candidates:
+            return [], chunk_count
+
+        # Only the candidates' lengths are read from the mapped file
+        average_length = meta['total_length'] / chunk_count or 1.0
+        k1, b = BM25_K1, BM25_B
+        lengths = self._map_lengths()[np.asarray(candidates, dtype=np.int64)]
+        norms = dict(zip(candidates, (k1 * (1 - b + b * lengths / average_length)).tolist()))
+        scores = {}
+        for term, postings in postings_by_term.items():
+            if not postings:
+                continue
+            idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, tf in postings:
+                if row in norms:
+                    scores[row] = scores.get(row, 0.0) + idf * tf * (k1 + 1) / (tf + norms[row])
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, row) for row, score in top], chunk_count
+
+    def close(self):
+        """Drop the segment and length maps (unmapped once no in-flight search holds them)"""
+        self._segments = {}
+        self._lengths = None
+
+def keyword_snippet(text, query, width=KEYWORD_SNIPPET_CHARS):
+    """Offsets of the query terms in ``text`` and a snippet window around the first one"""
+    terms = set(keyword_terms(query))
+    highlights = [[match.start(), match.end()] for match in TOKEN_PATTERN.finditer(text.lower())
+                  if match.group() in terms]
+    start = max(0, highlights[0][0] - width // 3) if highlights else 0
+    end = min(len(text), start + width)
+    if start > 0:
+        space = text.find(' ', start, highlights[0][0] if highlights else end)
+        start = space + 1 if space != -1 else start
+    return {'text': text[start:end], 'start': start, 'end': end}, highlights
+
+_vector_indexes = OrderedDict()  # Least recently used first
+_keyword_indexes = OrderedDict()
+_vector_indexes_lock = threading.Lock()
+
+def read_user_id(values):
+    """Validated ``user_id`` (used as a directory name)"""
+    user_id = values.get('user_id')
+    if not isinstance(user_id, str) or not USER_ID_PATTERN.fullmatch(user_id):
+        raise InvalidOptionError('user_id must be 1-128 letters, digits, "-" or "_"')
+    return user_id
+
+def cached_index(indexes, user_id, create):
+    """LRU lookup in a per-user index cache; the caller holds _vector_indexes_lock.
+
+    At most INDEX_CACHE_SIZE users' indexes stay open; the least recently
+    used is closed so its memory maps are released.
+    """
+    index = indexes.pop(user_id, None)
+    if index is None:
+        index = create()
+    indexes[user_id] = index
+    while len(indexes) > INDEX_CACHE_SIZE:
+        _, evicted = indexes.popitem(last=False)
+        evicted.close()
+    return index
+
+def get_vector_index(user_id):
+    """Get the (cached) vector index of a user"""
+    embedder = get_embedder()
+    with _vector_indexes_lock:
+        return cached_index(_vector_indexes, user_id,
+                            lambda: VectorIndex(os.path.join(INDEX_DIR, user_id), embedder.name, embedder.dim))
+
+def get_keyword_index(user_id):
+    """Get the (cached) keyword index of a user"""
+    store = get_vector_index(user_id)
+    with _vector_indexes_lock:
+        return cached_index(_keyword_indexes, user_id, lambda: KeywordIndex(store))
+
+def document_id_for(entry):
+    """Stable id of an extracted document (content hash plus page selection)"""
+    metadata = entry['metadata']
+    if not metadata.get('partial'):
+        return metadata['content_hash'][:32]
+    selection = json.dumps([metadata['content_hash'], metadata.get('pages')])
+    return hashlib.sha256(selection.encode('utf-8')).hexdigest()[:32]
+
+def index_entry(user_id, entry, filename, max_tokens=None):
+    """Chunk, embed and append an extracted document to the user's vector and keyword indexes"""
+    document_id = document_id_for(entry)
+    chunks = chunk_markdown(entry['content'], entry.get('page_spans'), max_tokens)
+    records = [
+        {key: chunk[key] for key in ('index', 'text', 'tokens', 'section_path', 'pages')}
+        for chunk in chunks
+    ]
+    for record in records:
+        record['filename'] = filename
+
+    index = get_vector_index(user_id)
+    added = False
+    if records and not index.has_document(document_id):
+        start_time = time.time()
+        vectors = get_embedder().embed([record['text'] for record in records])
+        added = index.add_document(document_id, records, vectors)
+        if added:
+            logger.info(f"🧭 Indexed {len(records)} chunks of {filename} for {user_id} "
+                        f"in {time.time() - start_time:.2f}s")
+
+    # The keyword index reuses the stored chunks (also for documents indexed before it existed)
+    keyword_index = get_keyword_index(user_id)
+    rows = index.read_meta()['documents'].get(document_id, {}).get('rows')
+    if rows and not keyword_index.has_document(document_id):
+        texts = [record['text'] for record in index.read_records(range(*rows))]
+        keyword_index.add_document(document_id, rows[0], texts)
+    return {'user_id': user_id, 'document_id': document_id, 'chunks': len(records), 'added': added}
+
+def try_index_entry(user_id, entry, filename, max_tokens=None):
+    """``index_entry`` for extraction endpoints: indexing problems do not fail the extraction"""
+    try:
+        return index_entry(user_id, entry, filename, max_tokens)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to index {filename} for {user_id}: {e}")
+        return {'user_id': user_id, 'error': str(e)}
+
+def read_index_request(values):
+    """``user_id`` when the request asked for ``index``, else None"""
+    if not parse_bool(values.get('index', False)):
+        return None
+    return read_user_id(values)
+
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+def read_stream_format(values):
+    """Return 'ndjson', 'sse' or None from the ``stream`` option or the Accept header"""
+    stream = values.get('stream')
+    if stream in (None, '', False):
+        best = request.accept_mimetypes.best
+        return next((name for name, mimetype in STREAM_MIMETYPES.items() if mimetype == best), None)
+    if stream in STREAM_MIMETYPES:
+        return stream
+    if parse_bool(stream):
+        return 'ndjson'
+    return None
+
+def stream_extraction_response(stream_format, pdf_path, filename, extraction_method,
+                               content_hash=None, options=None, cleanup=None, source_name=None):
+    """Stream an extraction as NDJSON lines or Server-Sent Events.
+
+    Emits one ``page`` record per page fragment as soon as it is converted
+    (fast-path pages first, Docling pages in small groups), then a
+    ``summary`` record shaped like the regular response without ``content``
+    and with time-to-first-fragment in ``metadata.timings``. Failures are
+    reported as an ``error`` record. ``cleanup`` runs when the stream ends.
+    ``source_name`` (default ``filename``) is the name used for format detection.
+
+    Cache lookup and admission happen before the response starts, so a
+    rejected conversion still gets a regular 429/413 status.
+    """
+    source_name = source_name or filename
+    plan = plan_extraction(pdf_path, content_hash, options, source_name)
+    cached_entry = lookup_cached_entry(plan)
+    cache_hit = True
+    if cached_entry is None and plan['format'] != 'pdf':
+        # Native formats parse in milliseconds and images are a single page: convert up front
+        cached_entry, cache_hit = extract_with_cache(pdf_path, content_hash, options, filename=source_name)
+    cost_mb = None
+    flights = ExitStack()  # Held until the stream ends so identical requests wait for it
+    flight = SimpleNamespace(entry=None)
+    if cached_entry is None:
+        try:
+            flight = flights.enter_context(join_flight(plan))
+        except BaseException:
+            flights.close()
+            raise
+        cached_entry = flight.entry
+        cache_hit = False  # Coalesced with a concurrent conversion
+    if cached_entry is not None:
+        flights.close()
+        records = itertools.chain((('page', fragment) for fragment in replay_cached_entry(cached_entry)),
+                                  [('done', cached_entry, cache_hit)])
+    else:
+        cost_mb = estimate_extraction_mb(pdf_path, plan['pages'], plan['quality'])
+        try:
+            get_admission_controller().acquire(cost_mb, ADMISSION_QUEUE_TIMEOUT)
+        except BaseException:
+            flights.close()
+            raise
+        records = iter_extraction(pdf_path, plan)
+
+    def encode(record_type, body):
+        payload = json.dumps(dict(body, type=record_type))
+        if stream_format == 'sse':
+            return f"event: {record_type}\ndata: {payload}\n\n"
+        return payload + '\n'
+
+    def generate():
+        start_time = time.time()
+        first_fragment_seconds = None
+        cache_hit = True
+        try:
+            for record in records:
+                if record[0] == 'page':
+                    if first_fragment_seconds is None:
+                        first_fragment_seconds = round(time.time() - start_time, 3)
+                    yield encode('page', record[1])
+                    continue
+                
+                _, entry, cache_hit = record
+                flight.entry = entry
+                summary = build_extraction_response(entry, filename, extraction_method, cache_hit)
+                del summary['content']
+                summary['metadata']['timings'] = {
+                    'first_fragment_seconds': first_fragment_seconds,
+                    'total_seconds': round(time.time() - start_time, 3),
+                }
+                logger.info(f"✅ Streamed {entry['metadata']['word_count']} words from {filename}")
+                record_extraction(extraction_method)
+                yield encode('summary', summary)
+        except Exception as e:
+            logger.error(f"❌ Streaming extraction error: {e}")
+            record_extraction(extraction_method, e)
+            yield encode('error', {'error': f'PDF extraction failed: {str(e)}', 'success': False})
+        finally:
+            if cost_mb is not None:
+                get_admission_controller().release(cost_mb)
+            flights.close()
+            if cleanup:
+                cleanup()
+            if not cache_hit:
+                gc.collect()
+
+    # stream_with_context keeps the request (and its upload spool) alive until the stream ends
+    return Response(
+        stream_with_context(generate()),
+        mimetype=STREAM_MIMETYPES[stream_format],
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint.
+
+    Reports the cached readiness state and never touches the converter, so a
+    probe cannot trigger or queue behind model initialization.
+    """
+    try:
+        import psutil
+        memory = psutil.virtual_memory()
+        memory_info = {
+            'memory_percent': memory.percent,
+            'memory_used_mb': memory.used // (1024 * 1024),
+            'memory_available_mb': memory.available // (1024 * 1024)
+        }
+    except ImportError:
+        memory_info = {'error': 'psutil not available'}
+    
+    readiness = _readiness
+    return jsonify({
+        'status': 'healthy',
+        'service': 'docling_extraction_service',
+        'docling_available': readiness['state'] in ('ready', 'lazy'),
+        'docling_error': readiness['error'],
+        'state': readiness['state'],
+        'memory': memory_info
+    })
+
+@app.route('/memory', methods=['GET'])
+def memory_report():
+    """Report per-process memory, showing how much the workers share"""
+    try:
+        report = get_memory_report()
+        report['admission'] = get_admission_controller().stats()
+        return jsonify(report)
+    except ImportError:
+        return jsonify({'error': 'psutil not available'}), 501
+    except Exception as e:
+        logger.error(f"❌ Memory report error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+class RequestProfiler:
+    """Profile one extraction: wall/CPU time, peak RSS, stages and hottest functions.
+
+    cProfile follows the request thread and the threads it starts, directly,
+    through an executor or from those threads (Docling runs its pipeline
+    stages on their own threads); threads started by other requests or
+    background work are left alone. Each thread's profiler is disabled when
+    its ``run`` returns, and threads still running when the profile stops
+    are left out of the report. Docling's own per-stage timings (layout,
+    OCR, tables, ...) are switched on for the duration. Profiled requests
+    run one at a time.
+    """
+
+    def __init__(self, keep_artifact=False):
+        self.request_id = uuid.uuid4().hex
+        self.keep_artifact = keep_artifact
+        self.stages = {}
+        self.docling_stages = {}
+        self._profiles = []
+        self._threads_lock = threading.Lock()
+        self._profiled_threads = set()  # idents of the request thread and the threads it started
+        self._stopped = False
+        self._sampling = threading.Event()
+        self.peak_rss_mb = None
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_docling_timings(self, timings):
+        for key, item in (timings or {}).items():
+            self.docling_stages[key] = self.docling_stages.get(key, 0.0) + float(sum(item.times))
+
+    def _profile_thread(self, thread):
+        """Run ``thread`` under its own cProfile (it was started by a profiled thread)"""
+        run = thread.run
+
+        def profiled_run():
+            profile = cProfile.Profile()
+            with self._threads_lock:
+                if self._stopped:
+                    return run()
+                self._profiled_threads.add(threading.get_ident())
+            profile.enable()
+            try:
+                return run()
+            finally:
+                profile.disable()
+                with self._threads_lock:
+                    self._profiled_threads.discard(threading.get_ident())
+                    if not self._stopped:
+                        self._profiles.append(profile)
+
+        thread.run = profiled_run
+
+    def _start_thread(self, thread):
+        # Replaces threading.Thread.start while the profile is active
+        if threading.get_ident() in self._profiled_threads:
+            self._profile_thread(thread)
+        return self._thread_start(thread)
+
+    def _sample_rss(self):
+        while not self._sampling.wait(PROFILE_RSS_SAMPLE_SECONDS):
+            rss_mb = get_process_rss_mb()
+            if rss_mb is not None and (self.peak_rss_mb is None or rss_mb > self.peak_rss_mb):
+                self.peak_rss_mb = rss_mb
+
+    def __enter__(self):
+        _profile_lock.acquire()
+        self._docling_settings = None
+        try:
+            from docling.datamodel.settings import settings
+            self._docling_settings = settings
+            self._docling_profiling = settings.debug.profile_pipeline_timings
+            settings.debug.profile_pipeline_timings = True
+        except ImportError:
+            pass
+
+        self.rss_start_mb = self.peak_rss_mb = get_process_rss_mb()
+        threading.Thread(target=self._sample_rss, name='profile-rss', daemon=True).start()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        _profile_context.profiler = self
+
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        self._profiled_threads.add(threading.get_ident())
+        self._thread_start = threading.Thread.start
+        threading.Thread.start = lambda thread: self._start_thread(thread)
+        profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profiles[0].disable()
+        threading.Thread.start = self._thread_start
+        with self._threads_lock:
+            self._stopped = True
+            self._profiled_threads.clear()
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.cpu_seconds = time.process_time() - self._cpu_start
+        _profile_context.profiler = None
+        self._sampling.set()
+        rss_end_mb = get_process_rss_mb()
+        if rss_end_mb is not None and (self.peak_rss_mb is None or rss_end_mb > self.peak_rss_mb):
+            self.peak_rss_mb = rss_end_mb
+        if self._docling_settings is not None:
+            self._docling_settings.debug.profile_pipeline_timings = self._docling_profiling
+        _profile_lock.release()
+        return False
+
+    def report(self):
+        """Summary for ``metadata.profile`` (stores the full profile when requested)"""
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            try:
+                stats.add(profile)
+            except (TypeError, ValueError):
+                continue  # Thread produced no samples
+
+        top_functions = []
+        stats.sort_stats('cumulative')
+        for func in stats.fcn_list[:PROFILE_TOP_FUNCTIONS]:
+            primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[func]
+            filename, line, name = func
+            top_functions.append({
+                'function': f'{name} ({os.path.basename(filename)}:{line})' if line else name,
+                'calls': calls,
+                'total_seconds': round(total_time, 4),
+                'cumulative_seconds': round(cumulative_time, 4),
+            })
+
+        report = {
+            'request_id': self.request_id,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'rss_start_mb': self.rss_start_mb,
+            'peak_rss_mb': self.peak_rss_mb,
+            'peak_rss_delta_mb': (self.peak_rss_mb - self.rss_start_mb
+                                  if self.peak_rss_mb is not None and self.rss_start_mb is not None else None),
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'docling_stages': {name: round(seconds, 4) for name, seconds in self.docling_stages.items()},
+            'profiled_threads': len(self._profiles),
+            'top_functions': top_functions,
+        }
+
+        if self.keep_artifact:
+            try:
+                os.makedirs(PROFILES_DIR, exist_ok=True)
+                stats.dump_stats(os.path.join(PROFILES_DIR, f'{self.request_id}.prof'))
+                prune_profile_artifacts()
+                report['artifact_url'] = f'/profiles/{self.request_id}'
+            except OSError as e:
+                logger.warning(f"⚠️ Failed to store profile artifact: {e}")
+        return report
+
+def prune_profile_artifacts():
+    """Keep only the PROFILE_MAX_ARTIFACTS most recent profile files"""
+    paths = sorted(
+        (os.path.join(PROFILES_DIR, name) for name in os.listdir(PROFILES_DIR) if name.endswith('.prof')),
+        key=os.path.getmtime, reverse=True)
+    for path in paths[PROFILE_MAX_ARTIFACTS:]:
+        remove_file(path)
+
+def read_profile_mode(values):
+    """Return None, 'summary' or 'full' from the ``profile`` option or ``X-Profile`` header"""
+    value = values.get('profile', request.headers.get('X-Profile'))
+    if value in (None, ''):
+        return None
+    if isinstance(value, str) and value.lower() in ('full', 'store'):
+        return 'full'
+    try:
+        return 'summary' if parse_bool(value) else None
+    except InvalidOptionError:
+        raise InvalidOptionError("profile must be a boolean or 'full'")
+
+def get_peak_rss_bytes():
+    """Peak resident set size of this process (ru_maxrss is in KB on Linux)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def per_second(amount_counter):
+    seconds = CONVERSION_SECONDS.total()
+    return amount_counter.total() / seconds if seconds else 0.0
+
+def process_rss_bytes():
+    rss_mb = get_process_rss_mb()
+    return None if rss_mb is None else rss_mb * 1024 * 1024
+
+HTTP_REQUESTS = Counter('docling_http_requests_total', 'HTTP requests by endpoint and status', ['endpoint', 'status'])
+SCRAPE_GAUGES = [
+    Gauge('docling_pages_per_second', 'Pages converted per second of conversion time',
+          lambda: per_second(PAGES_CONVERTED)),
+    Gauge('docling_bytes_per_second', 'PDF bytes converted per second of conversion time',
+          lambda: per_second(BYTES_CONVERTED)),
+    Gauge('docling_job_queue_depth', 'Jobs queued or running', lambda: get_job_queue().depth()),
+    Gauge('docling_admission_active', 'Conversions admitted and running',
+          lambda: get_admission_controller().active),
+    Gauge('docling_admission_waiting', 'Conversions waiting for memory',
+          lambda: get_admission_controller().waiting),
+    Gauge('docling_admission_reserved_bytes', 'Memory reserved by running conversions',
+          lambda: int(get_admission_controller().reserved_mb * 1024 * 1024)),
+    Gauge('docling_converter_init_seconds', 'Time taken to create the DocumentConverter',
+          lambda: _converter_init_seconds),
+    Gauge('docling_module_import_seconds', 'Time taken to import docling_service',
+          lambda: _module_import_seconds),
+    Gauge('docling_ready', 'Whether the converter is warmed up (see /ready)', lambda: int(is_ready())),
+    Gauge('docling_process_rss_bytes', 'Resident set size of this process', process_rss_bytes),
+    Gauge('docling_process_peak_rss_bytes', 'Peak resident set size of this process', get_peak_rss_bytes),
+]
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    """Record request latency and status for /metrics"""
+    endpoint = request.endpoint or 'unknown'
+    if endpoint != 'metrics' and 'request_start' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+@lru_cache(maxsize=None)
+def get_response_encodings():
+    """Content codings this process can produce, in order of preference"""
+    encodings = []
+    for encoding, module in (('zstd', 'zstandard'), ('br', 'brotli')):
+        try:
+            __import__(module)
+            encodings.append(encoding)
+        except ImportError:
+            pass
+    return tuple(encodings) + ('gzip',)
+
+def choose_response_encoding(accept_encodings):
+    """Pick the coding with the highest client q-value (ties: our preference)"""
+    best, best_quality = None, 0
+    for encoding in get_response_encodings():
+        quality = accept_encodings[encoding]  # Honours '*' and q=0
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+class StreamCompressor:
+    """Incremental gzip/zstd/brotli compressor.
+
+    ``flush`` emits everything compressed so far as a decodable block, so a
+    streamed record reaches the client without waiting for the next one.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'zstd':
+            import zstandard
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif encoding == 'br':
+            import brotli
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip wrapper
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(self._flush_mode)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def compress_chunks(chunks, compressor, flush_each=False):
+    """Lazily compress a response body in slices, without a second full buffer"""
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            view = memoryview(chunk)
+            for start in range(0, len(view), COMPRESS_SLICE_BYTES):
+                data = compressor.compress(view[start:start + COMPRESS_SLICE_BYTES])
+                if data:
+                    yield data
+            if flush_each:
+                yield compressor.flush()
+        yield compressor.finish()
+    finally:
+        # Closing the inner generator runs its cleanup (admission release, spool removal)
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)  # Enable CORS for React Native
+@app.after_request
+def compress_response(response):
+    """Compress JSON/NDJSON/SSE/text responses according to Accept-Encoding.
 
-# Set memory optimization for PyTorch if available
-try:
-    import torch
-    torch.set_grad_enabled(False)  # Disable gradients for inference
-    os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "max_split_size_mb:64"
-except ImportError:
-    pass
+    Buffered bodies under COMPRESS_MIN_BYTES are left alone; streamed bodies
+    are compressed record by record with a flush after each one.
+    """
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
 
-# Lazy loading for Docling converter to reduce memory usage
-_converter = None
-_converter_error = None
+    response.vary.add('Accept-Encoding')
+    streamed = response.is_streamed
+    if not streamed and (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = choose_response_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
 
-def get_converter():
-    """Get or create Docling converter singleton"""
-    global _converter, _converter_error
-    
-    if _converter_error:
-        raise _converter_error
-    
-    if _converter is None:
-        try:
-            logger.info("🔄 Initializing Docling DocumentConverter...")
-            
-            # Install requirements if not already installed
-            try:
-                from docling.document_converter import DocumentConverter
-            except ImportError:
-                logger.info("Installing docling...")
-                import subprocess
-                subprocess.check_call([sys.executable, "-m", "pip", "install", "docling", "flask", "flask-cors", "requests"])
-                from docling.document_converter import DocumentConverter
-            
-            # Initialize converter
-            _converter = DocumentConverter()
-            logger.info("✅ Docling DocumentConverter initialized successfully")
-            
-        except Exception as e:
-            error_msg = f"Failed to initialize Docling converter: {str(e)}"
-            logger.error(f"❌ {error_msg}")
-            _converter_error = Exception(error_msg)
-            raise _converter_error
-    
-    return _converter
+    response.response = compress_chunks(response.response, StreamCompressor(encoding), flush_each=streamed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers.pop('Content-Length', None)
+    return response
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this worker process (not aggregated across workers)"""
+    body = render_metrics([
+        DOWNLOAD_SECONDS, CONVERT_SECONDS, EXPORT_SECONDS, SERIALIZE_SECONDS, REQUEST_SECONDS,
+        HTTP_REQUESTS, EXTRACTIONS, DOWNLOADS, DOWNLOADED_BYTES, ADMISSION_REJECTED, COALESCED, NATIVE_CONVERSIONS,
+        CONVERSIONS, PAGES_CONVERTED, BYTES_CONVERTED, CONVERSION_SECONDS,
+    ] + SCRAPE_GAUGES)
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/startup', methods=['GET'])
+def startup_report():
+    """Boot latency of this worker: module import time and deferred heavy imports.
+
+    For a per-module breakdown of the import itself run
+    ``python -X importtime -c 'import docling_service'``.
+    """
     try:
         import psutil
-        memory_info = {
-            'memory_percent': psutil.virtual_memory().percent,
-            'memory_used_mb': psutil.virtual_memory().used // (1024 * 1024),
-            'memory_available_mb': psutil.virtual_memory().available // (1024 * 1024)
-        }
+        process_age = round(time.time() - psutil.Process().create_time(), 3)
     except ImportError:
-        memory_info = {'error': 'psutil not available'}
-    
-    # Test if Docling is actually available
-    docling_available = False
-    docling_error = None
-    try:
-        converter = get_converter()
-        if converter is not None:
-            docling_available = True
-            logger.info("✅ Docling converter is available and ready")
-        else:
-            logger.warning("⚠️ Docling converter is None")
-    except Exception as e:
-        logger.error(f"❌ Docling converter test failed: {e}")
-        docling_available = False
-        docling_error = str(e)
-    
+        process_age = None
     return jsonify({
-        'status': 'healthy',
-        'service': 'docling_extraction_service',
-        'docling_available': docling_available,
-        'docling_error': docling_error,
-        'memory': memory_info
+        'pid': os.getpid(),
+        'module_import_seconds': round(_module_import_seconds, 4),
+        'process_age_seconds': process_age,
+        'lazy_import_seconds': _lazy_import_seconds,
+        'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in sys.modules],
+        'modules_loaded': len(sys.modules),
+        'converter_loaded': _converter is not None,
+        'default_quality': DEFAULT_QUALITY,
+        'cached_quality_converters': list(_quality_converters),
+        'converter_init_seconds': _converter_init_seconds,
+        'preload': _preload_stats,
     })
 
+@app.route('/profiles/<request_id>', methods=['GET'])
+def get_profile(request_id):
+    """Download a stored cProfile artifact (load with ``pstats.Stats``)"""
+    if not re.fullmatch(r'[0-9a-f]{32}', request_id):
+        return jsonify({'error': 'Invalid profile id', 'success': False}), 400
+    path = os.path.join(PROFILES_DIR, f'{request_id}.prof')
+    if not os.path.exists(path):
+        return jsonify({'error': 'Profile not found', 'success': False}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'{request_id}.prof')
+
 @app.route('/healthz', methods=['GET'])
 def healthz():
-    """Simple health check for Render"""
+    """Liveness: the worker is up and serving requests"""
     return jsonify({"ok": True})
 
-@app.route('/upload', methods=['POST'])
-def upload_and_extract():
-    """Upload and extract content from PDF file using Docling"""
-    try:
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once the converter has been warmed up, 503 before or if that failed.
+
+    Retry-After is set while the warm-up is running or will be retried; once
+    every attempt has failed the worker needs a restart.
+    """
+    readiness = _readiness
+    body = dict(readiness, ready=is_ready())
+    if body['ready']:
+        return jsonify(body)
+    response = jsonify(body)
+    if readiness['state'] != 'failed' or readiness['retrying']:
+        response.headers['Retry-After'] = str(READY_RETRY_AFTER_SECONDS)
+    return response, 503
+
+def receive_upload():
+    """Spool the document uploaded with the current request.
+
+    Accepts either a multipart form with a ``file`` field or a raw body of
+    one of RAW_UPLOAD_MIMETYPES (filename from ``X-Filename`` or
+    ``?filename=``). The format is detected from the content later on.
+    Returns ``(spool, filename, None)`` or ``(None, None, error_response)``.
+    """
+    if request.mimetype in RAW_UPLOAD_MIMETYPES:
+        filename = request.headers.get('X-Filename') or request.args.get('filename')
+        if not filename:
+            # The Content-Type gives the extension, and so the format the content must match
+            filename = 'document' + (mimetypes.guess_extension(request.mimetype) or '').replace('.bin', '')
+    else:
         # Check if file was uploaded
         if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
+            return None, None, (jsonify({'error': 'No file uploaded'}), 400)
         
         file = request.files['file']
         if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+            return None, None, (jsonify({'error': 'No file selected'}), 400)
+        filename = file.filename
+    
+    if request.mimetype in RAW_UPLOAD_MIMETYPES:
+        spool = UploadSpool.from_stream(request.stream)
+    else:
+        # The multipart parser already streamed the part into our spool
+        spool = file.stream
+    spool.flush()
+    return spool, filename, None
+
+def upload_too_large_response():
+    """413 response for uploads over MAX_UPLOAD_BYTES"""
+    logger.warning(f"❌ Upload rejected: larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    return jsonify({
+        'error': f'File too large (limit {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)',
+        'success': False
+    }), 413
+
+def admission_rejected_response(error):
+    """429/413/503 JSON response for a conversion that was not admitted"""
+    body = {'error': str(error), 'success': False}
+    headers = {}
+    if error.retry_after:
+        body['retry_after'] = error.retry_after
+        headers['Retry-After'] = str(error.retry_after)
+    return jsonify(body), error.status, headers
+
+class PeekedStream(io.RawIOBase):
+    """A WSGI input stream with the bytes already read from it put back in front"""
+
+    def __init__(self, head, stream):
+        self._head = memoryview(head)
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def peek_multipart_filename():
+    """File name of the ``file`` part of a multipart body, read without consuming the body"""
+    stream = request.environ['wsgi.input']
+    head = stream.read(min(MULTIPART_PEEK_BYTES, request.content_length))
+    request.environ['wsgi.input'] = PeekedStream(head, stream)
+    match = re.search(rb'name="file"; filename="([^"\r\n]*)"', head)
+    return match.group(1).decode('utf-8', 'replace') if match else None
+
+def declared_upload_format():
+    """Format an upload declares before its body is read, or None if it does not say.
+
+    Raw bodies are named by ``X-Filename``/``filename`` or their Content-Type;
+    multipart bodies by the name of their file part.
+    """
+    if request.mimetype == 'multipart/form-data':
+        filename = peek_multipart_filename()
+    else:
+        filename = (request.headers.get('X-Filename') or request.args.get('filename')
+                    or 'document' + (mimetypes.guess_extension(request.mimetype) or ''))
+    extension = os.path.splitext(filename or '')[1].lower()
+    return BINARY_FORMAT_EXTENSIONS.get(extension) or TEXT_FORMAT_EXTENSIONS.get(extension)
+
+@app.before_request
+def reject_before_reading_body():
+    """Turn away uploads that are too large or cannot be admitted, before reading them"""
+    if request.method != 'POST' or request.content_length is None:
+        return None
+    if request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return upload_too_large_response()
+    if request.endpoint in ('upload_and_extract', 'chunk_pdf', 'create_job') and not request.is_json:
+        source_format = declared_upload_format()
+        if source_format in NATIVE_PARSERS:
+            return None  # Parsed without Docling, never admitted
+        try:
+            # Images are converted as a single page; anything undeclared is costed as a PDF
+            page_count = 1 if source_format == 'image' else None
+            get_admission_controller().precheck(
+                estimate_conversion_mb(request.content_length, page_count), queued=request.endpoint != 'create_job')
+        except AdmissionRejected as e:
+            logger.warning(f"⚠️ Upload rejected before reading: {e}")
+            return admission_rejected_response(e)
+    return None
+
+@app.route('/upload', methods=['POST'])
+def upload_and_extract():
+    """Upload and extract content from PDF file using Docling.
+
+    The bytes are streamed straight into a spool file that is hashed on the
+    fly and handed to Docling without further copies.
+    """
+    spool = None
+    try:
+        spool, filename, error_response = receive_upload()
+        if error_response:
+            return error_response
         
-        # Check file extension
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Only PDF files are supported'}), 400
+        options = read_extraction_options(request.values)
+        stream_format = read_stream_format(request.values)
+        profile_mode = read_profile_mode(request.values)
+        chunk_tokens = read_chunk_size(request.values)
+        index_user = read_index_request(request.values)
+        shape = read_response_shape(request.values)
+        if (profile_mode or chunk_tokens or index_user or shape) and stream_format:
+            return jsonify({'error': 'profile, chunk, index, fields and content paging are not available '
+                                     'for streaming responses', 'success': False}), 400
         
-        logger.info(f"🔄 Processing uploaded PDF: {file.filename}")
+        logger.info(f"🔄 Processing upload: {filename} ({spool.size} bytes)")
         
-        # Save uploaded file temporarily
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        file.save(temp_file.name)
+        if stream_format:
+            # The stream now owns the spool and removes it when it finishes
+            response = stream_extraction_response(
+                stream_format, spool.name, filename, 'docling_upload',
+                content_hash=spool.content_hash, options=options, cleanup=spool.close)
+            spool = None
+            return response
         
-        try:
-            # Use Docling's conversion on the temp file
-            converter = get_converter()
-            result = converter.convert(temp_file.name)
-            
-            # Export to markdown - this is the main content
-            markdown_content = result.document.export_to_markdown()
-            
-            # Extract title from filename if not available from document
-            doc_title = file.filename.replace('.pdf', '').replace('_', ' ').replace('-', ' ').title()
-            
-            # Calculate basic statistics
-            word_count = len(markdown_content.split())
-            
-            logger.info(f"✅ Successfully extracted {word_count} words from uploaded {file.filename}")
-            
-            # Force garbage collection to free memory
+        # Use Docling's conversion on the spool file (or a cached result)
+        profiler = RequestProfiler(keep_artifact=profile_mode == 'full') if profile_mode else None
+        with profiler or nullcontext():
+            entry, cache_hit = extract_with_cache(
+                spool.name, content_hash=spool.content_hash, options=options, refresh=profiler is not None,
+                filename=filename)
+        
+        logger.info(f"✅ Successfully extracted {entry['metadata']['word_count']} words from uploaded {filename}")
+        
+        # Force garbage collection to free memory
+        if not cache_hit:
             gc.collect()
-            
-            return jsonify({
-                'success': True,
-                'title': doc_title,
-                'content': markdown_content,
-                'metadata': {
-                    'filename': file.filename,
-                    'word_count': word_count,
-                    'character_count': len(markdown_content),
-                    'extraction_method': 'docling_upload',
-                },
-                'extraction_confidence': 0.95
-            })
-            
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
-                
+        
+        record_extraction('docling_upload')
+        body = build_extraction_response(entry, filename, 'docling_upload', cache_hit)
+        if chunk_tokens:
+            add_chunks(body, entry, chunk_tokens)
+        if index_user:
+            body['metadata']['index'] = try_index_entry(index_user, entry, filename, chunk_tokens)
+        if profiler is not None:
+            body['metadata']['profile'] = profiler.report()
+        return timed_jsonify(shape_extraction_response(body, shape, entry.get('page_spans')))
+    
+    except RequestEntityTooLarge as e:
+        record_extraction('docling_upload', e)
+        return upload_too_large_response()
+    except InvalidOptionError as e:
+        record_extraction('docling_upload', e)
+        return jsonify({'error': str(e), 'success': False}), 400
+    except AdmissionRejected as e:
+        logger.warning(f"⚠️ Upload not admitted: {e}")
+        record_extraction('docling_upload', e)
+        return admission_rejected_response(e)
     except Exception as e:
         logger.error(f"❌ Upload extraction error: {e}")
+        record_extraction('docling_upload', e)
         return jsonify({
             'error': f'PDF upload extraction failed: {str(e)}',
             'success': False
         }), 500
+    finally:
+        # Remove the spool file right away instead of waiting for request teardown
+        if spool is not None:
+            spool.close()
 
 @app.route('/extract', methods=['POST'])
 def extract_pdf_content():
@@ -188,54 +4194,513 @@ def extract_pdf_content():
         if not pdf_url:
             return jsonify({'error': 'pdf_url must be provided'}), 400
         
-        logger.info(f"🔄 Processing PDF: {filename} from {pdf_url}")
+        options = read_extraction_options(data)
+        stream_format = read_stream_format(data)
+        profile_mode = read_profile_mode(data)
+        chunk_tokens = read_chunk_size(data)
+        index_user = read_index_request(data)
+        shape = read_response_shape(data)
+        if (profile_mode or chunk_tokens or index_user or shape) and stream_format:
+            return jsonify({'error': 'profile, chunk, index, fields and content paging are not available '
+                                     'for streaming responses', 'success': False}), 400
         
-        # Handle different URL types
-        processed_url = process_pdf_url(pdf_url)
+        logger.info(f"🔄 Processing PDF: {filename} from {pdf_url}")
         
-        if not processed_url:
-            return jsonify({
-                'error': f'Cannot access PDF file at: {pdf_url}',
-                'success': False
-            }), 400
+        # The profile covers the download as well as the conversion
+        profiler = RequestProfiler(keep_artifact=profile_mode == 'full') if profile_mode else None
+        with profiler or nullcontext():
+            # Handle different URL types (remote PDFs are downloaded so they can be hashed)
+            pdf_path, is_temporary, content_hash = fetch_pdf(pdf_url)
+            
+            if not pdf_path:
+                return jsonify({
+                    'error': f'Cannot access PDF file at: {pdf_url}',
+                    'success': False
+                }), 400
+            
+            if stream_format:
+                try:
+                    return stream_extraction_response(
+                        stream_format, pdf_path, filename, 'docling_simple', content_hash=content_hash,
+                        options=options, cleanup=(lambda: remove_file(pdf_path)) if is_temporary else None,
+                        source_name=declared_name(data.get('filename'), pdf_url))
+                except Exception:
+                    if is_temporary:
+                        remove_file(pdf_path)
+                    raise
+            
+            try:
+                # Use Docling's conversion (or a cached result)
+                entry, cache_hit = extract_with_cache(pdf_path, content_hash=content_hash, options=options,
+                                                      refresh=profiler is not None,
+                                                      filename=declared_name(data.get('filename'), pdf_url))
+            finally:
+                if is_temporary:
+                    remove_file(pdf_path)
         
-        # Use Docling's conversion
-        converter = get_converter()
-        result = converter.convert(processed_url)
+        logger.info(f"✅ Successfully extracted {entry['metadata']['word_count']} words from {filename}")
         
-        # Export to markdown - this is the main content
-        markdown_content = result.document.export_to_markdown()
+        # Force garbage collection to free memory
+        if not cache_hit:
+            gc.collect()
         
-        # Extract title from filename if not available from document
-        doc_title = filename.replace('.pdf', '').replace('_', ' ').replace('-', ' ').title()
+        record_extraction('docling_simple')
+        body = build_extraction_response(entry, filename, 'docling_simple', cache_hit)
+        if chunk_tokens:
+            add_chunks(body, entry, chunk_tokens)
+        if index_user:
+            body['metadata']['index'] = try_index_entry(index_user, entry, filename, chunk_tokens)
+        if profiler is not None:
+            body['metadata']['profile'] = profiler.report()
+        return timed_jsonify(shape_extraction_response(body, shape, entry.get('page_spans')))
         
-        # Calculate basic statistics
-        word_count = len(markdown_content.split())
+    except InvalidOptionError as e:
+        record_extraction('docling_simple', e)
+        return jsonify({'error': str(e), 'success': False}), 400
+    except AdmissionRejected as e:
+        logger.warning(f"⚠️ Extraction not admitted: {e}")
+        record_extraction('docling_simple', e)
+        return admission_rejected_response(e)
+    except DownloadError as e:
+        logger.warning(f"⚠️ Download failed: {e}")
+        record_extraction('docling_simple', e)
+        return jsonify({'error': str(e), 'success': False}), e.status
+    except Exception as e:
+        logger.error(f"❌ Extraction error: {e}")
+        record_extraction('docling_simple', e)
+        return jsonify({
+            'error': f'PDF extraction failed: {str(e)}',
+            'success': False
+        }), 500
+
+@app.route('/results/<result_id>', methods=['GET'])
+def get_result(result_id):
+    """Serve a stored extraction result (``metadata.result_id``) without converting.
+
+    Accepts the same ``fields``, ``content_offset``/``content_limit`` and
+    ``content_pages`` query parameters as /extract, so clients can fetch a
+    large document lazily in slices.
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', result_id):
+        return jsonify({'error': 'Invalid result id', 'success': False}), 400
+    try:
+        shape = read_response_shape(request.args)
+    except InvalidOptionError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+
+    cache = get_extraction_cache()
+    entry = cache.get(result_id) if cache else None
+    if entry is None:
+        return jsonify({'error': 'Result not found or expired', 'success': False}), 404
+
+    body = build_extraction_response(entry, request.args.get('filename', 'document.pdf'), 'stored', True)
+    try:
+        return timed_jsonify(shape_extraction_response(body, shape, entry.get('page_spans')))
+    except InvalidOptionError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+
+MARKDOWN_LIST_ITEM = re.compile(r'\s*(?:[-*+]|\d+[.)])\s+(.*)')
+MARKDOWN_TABLE_RULE = re.compile(r'\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?')
+
+def split_table_row(line):
+    """Cells of a markdown table row (``\\|`` is a literal pipe)"""
+    cells = re.split(r'(?<!\\)\|', line.strip().strip('|'))
+    return [cell.strip().replace('\\|', '|') for cell in cells]
+
+def markdown_blocks(markdown):
+    """Parse markdown (as produced by the fast path and native parsers) into export blocks"""
+    blocks = []
+    paragraph = []
+    lines = iter(markdown.split('\n'))
+
+    def end_paragraph():
+        if paragraph:
+            blocks.append({'type': 'paragraph', 'text': ' '.join(paragraph)})
+            paragraph.clear()
+
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or re.fullmatch(r'[-*_]{3,}|<!--.*-->', stripped):  # Rules, image placeholders
+            end_paragraph()
+        elif stripped.startswith('```'):
+            end_paragraph()
+            code = list(itertools.takewhile(lambda code_line: not code_line.strip().startswith('```'), lines))
+            blocks.append({'type': 'code', 'text': '\n'.join(code)})
+        elif re.match(r'#{1,6} ', stripped):
+            end_paragraph()
+            marks, _, text = stripped.partition(' ')
+            blocks.append({'type': 'heading', 'level': len(marks), 'text': text.strip()})
+        elif stripped.startswith('|'):
+            end_paragraph()
+            if MARKDOWN_TABLE_RULE.fullmatch(stripped):
+                continue
+            if blocks and blocks[-1]['type'] == 'table' and blocks[-1].get('open'):
+                blocks[-1]['rows'].append(split_table_row(stripped))
+            else:
+                blocks.append({'type': 'table', 'rows': [split_table_row(stripped)], 'open': True})
+            continue
+        elif MARKDOWN_LIST_ITEM.fullmatch(line):
+            end_paragraph()
+            blocks.append({'type': 'list_item', 'text': MARKDOWN_LIST_ITEM.fullmatch(line).group(1).strip()})
+        else:
+            paragraph.append(stripped)
+        if blocks and blocks[-1].get('open'):
+            del blocks[-1]['open']  # Any other line ends the table
+    end_paragraph()
+    if blocks and blocks[-1].get('open'):
+        del blocks[-1]['open']
+    return blocks
+
+def docling_blocks(document, page_no):
+    """Export blocks of one page of a DoclingDocument, in reading order"""
+    blocks = []
+    for item, _ in document.iterate_items(page_no=page_no):
+        label = getattr(item.label, 'value', item.label)
+        text = (getattr(item, 'text', None) or '').strip()
+        if label in ('table', 'document_index'):
+            rows = [[cell.text for cell in row] for row in item.data.grid]
+            if rows:
+                blocks.append({'type': 'table', 'rows': rows})
+        elif not text:
+            continue
+        elif label == 'title':
+            blocks.append({'type': 'heading', 'level': 1, 'text': text})
+        elif label == 'section_header':
+            blocks.append({'type': 'heading', 'level': min(6, getattr(item, 'level', 1) + 1), 'text': text})
+        elif label == 'list_item':
+            blocks.append({'type': 'list_item', 'text': text})
+        elif label in ('code', 'formula'):
+            blocks.append({'type': 'code', 'text': text})
+        else:
+            blocks.append({'type': 'paragraph', 'text': text})
+    return blocks
+
+def load_docling_pages(cache, result_id):
+    """Map original page numbers to ``(DoclingDocument, docling_page)`` from the stored parts"""
+    data = cache.get_blob(result_id, 'docling')
+    if data is None:
+        return {}
+    try:
+        DoclingDocument = lazy_import('docling_core.types.doc').DoclingDocument
+    except ImportError:
+        return {}
+    pages = {}
+    for part in json.loads(data)['parts']:
+        document = DoclingDocument.model_validate(part['document'])
+        for docling_page, page in part['page_map']:
+            pages[page] = (document, docling_page)
+    return pages
+
+def build_export_pages(cache, result_id, entry):
+    """Blocks of every page of a stored extraction.
+
+    Pages converted by Docling are read from the stored DoclingDocument; fast
+    path pages, native formats and entries without a stored document fall
+    back to parsing the stored markdown.
+    """
+    docling_pages = load_docling_pages(cache, result_id)
+    content = entry['content']
+    if entry.get('page_spans'):
+        spans = entry['page_spans']
+    elif docling_pages:
+        spans = [[page, None, None] for page in sorted(docling_pages)]
+    else:
+        spans = [[None, 0, len(content)]]
+
+    pages = []
+    for page_no, start, end in spans:
+        if page_no in docling_pages:
+            blocks = docling_blocks(*docling_pages[page_no])
+        else:
+            blocks = markdown_blocks(content[start:end])
+        pages.append({'page': page_no, 'source': 'docling' if page_no in docling_pages else 'markdown',
+                      'blocks': blocks})
+    return pages
+
+def render_text(pages):
+    parts = []
+    for page in pages:
+        for block in page['blocks']:
+            if block['type'] == 'table':
+                parts.append('\n'.join('\t'.join(row) for row in block['rows']))
+            elif block['type'] == 'list_item':
+                parts.append(f"- {block['text']}")
+            else:
+                parts.append(block['text'])
+    return '\n\n'.join(parts)
+
+def render_html_body(pages):
+    """``<section>`` per page; the page wrapper is added per request by ``wrap_html``"""
+    escape = lambda text: html.escape(text, quote=False)
+    body = []
+    for page in pages:
+        body.append(f'<section data-page="{page["page"]}">' if page['page'] is not None else '<section>')
+        in_list = False
+        for block in page['blocks']:
+            if in_list and block['type'] != 'list_item':
+                body.append('</ul>')
+                in_list = False
+            if block['type'] == 'heading':
+                body.append(f"<h{block['level']}>{escape(block['text'])}</h{block['level']}>")
+            elif block['type'] == 'list_item':
+                if not in_list:
+                    body.append('<ul>')
+                    in_list = True
+                body.append(f"<li>{escape(block['text'])}</li>")
+            elif block['type'] == 'table':
+                header, *rows = block['rows']
+                body.append('<table>')
+                body.append('<tr>' + ''.join(f'<th>{escape(cell)}</th>' for cell in header) + '</tr>')
+                body.extend('<tr>' + ''.join(f'<td>{escape(cell)}</td>' for cell in row) + '</tr>' for row in rows)
+                body.append('</table>')
+            elif block['type'] == 'code':
+                body.append(f"<pre><code>{escape(block['text'])}</code></pre>")
+            else:
+                body.append(f"<p>{escape(block['text'])}</p>")
+        if in_list:
+            body.append('</ul>')
+        body.append('</section>')
+    return '\n'.join(body)
+
+def wrap_html(body, title):
+    return ('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+            f'<title>{html.escape(title, quote=False)}</title>\n</head>\n<body>\n{body}\n</body>\n</html>\n')
+
+def render_tables_csv(pages, table=None):
+    """Tables as CSV separated by blank lines, or only the ``table``-th one (1-based)"""
+    tables = [block['rows'] for page in pages for block in page['blocks'] if block['type'] == 'table']
+    if table is not None:
+        if not 1 <= table <= len(tables):
+            raise InvalidOptionError(f'table must be between 1 and {len(tables)}' if tables else 'No tables found')
+        tables = [tables[table - 1]]
+    output = io.StringIO()
+    for index, rows in enumerate(tables):
+        if index:
+            output.write('\r\n')
+        csv.writer(output).writerows(rows)
+    return output.getvalue()
+
+def render_outline(pages):
+    return [{'level': block['level'], 'text': block['text'], 'page': page['page']}
+            for page in pages for block in page['blocks'] if block['type'] == 'heading']
+
+def render_export(cache, result_id, entry, export_format, title):
+    """Render (or fetch the memoized) ``export_format`` of a stored extraction as bytes.
+
+    The HTML title depends on the request, so only the HTML body is memoized.
+    """
+    if export_format == 'markdown':
+        return entry['content'].encode('utf-8')
+    if export_format == 'html':
+        return wrap_html(render_export(cache, result_id, entry, 'html_body', title).decode('utf-8'),
+                         title).encode('utf-8')
+
+    blob_name = f'{export_format}.v{EXPORT_VERSION}'
+    data = cache.get_blob(result_id, blob_name)
+    if data is not None:
+        return data
+
+    # Every other format is rendered from the JSON pages, which are memoized too
+    pages_data = cache.get_blob(result_id, f'json.v{EXPORT_VERSION}')
+    if pages_data is None:
+        with timed_stage('export', EXPORT_SECONDS):
+            pages = build_export_pages(cache, result_id, entry)
+        pages_data = json.dumps({'pages': pages}).encode('utf-8')
+        cache.put_blob(result_id, f'json.v{EXPORT_VERSION}', pages_data)
+    if export_format == 'json':
+        return pages_data
+
+    pages = json.loads(pages_data)['pages']
+    if export_format == 'text':
+        data = render_text(pages).encode('utf-8')
+    elif export_format == 'html_body':
+        data = render_html_body(pages).encode('utf-8')
+    elif export_format == 'tables_csv':
+        data = render_tables_csv(pages).encode('utf-8')
+    else:
+        data = json.dumps({'outline': render_outline(pages)}).encode('utf-8')
+    cache.put_blob(result_id, blob_name, data)
+    return data
+
+@app.route('/documents/<result_id>/export', methods=['GET'])
+def export_document(result_id):
+    """Render a stored extraction (``metadata.result_id``) in another format without converting.
+
+    ``format`` is one of EXPORT_FORMATS (default ``markdown``); ``table``
+    selects a single table (1-based) for ``tables_csv``. Docling pages are
+    rendered from the DoclingDocument stored at conversion time, the others
+    from the stored markdown. Each rendered format is memoized.
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', result_id):
+        return jsonify({'error': 'Invalid result id', 'success': False}), 400
+    export_format = request.args.get('format', 'markdown')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}", 'success': False}), 400
+    table = request.args.get('table')
+    if table is not None:
+        if export_format != 'tables_csv' or not table.isdigit():
+            return jsonify({'error': 'table must be a positive integer and needs format=tables_csv',
+                            'success': False}), 400
+        table = int(table)
+
+    cache = get_extraction_cache()
+    entry = cache.get(result_id) if cache else None
+    if entry is None:
+        return jsonify({'error': 'Result not found or expired', 'success': False}), 404
+
+    filename = request.args.get('filename', 'document.pdf')
+    title = os.path.splitext(filename)[0].replace('_', ' ').replace('-', ' ').title()
+    try:
+        if table is not None:
+            pages = json.loads(render_export(cache, result_id, entry, 'json', title))['pages']
+            data = render_tables_csv(pages, table).encode('utf-8')
+        else:
+            data = render_export(cache, result_id, entry, export_format, title)
+    except InvalidOptionError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    except Exception as e:
+        logger.error(f"❌ Export error: {e}")
+        return jsonify({'error': f'Export failed: {str(e)}', 'success': False}), 500
+    return Response(data, mimetype=EXPORT_FORMATS[export_format])
+
+@app.route('/chunk', methods=['POST'])
+def chunk_pdf():
+    """Extract a PDF and return token-bounded chunks that follow its structure.
+
+    Takes the /extract JSON body (``pdf_url``) or an /upload file, plus
+    ``max_tokens`` (default DOCLING_CHUNK_MAX_TOKENS). The response carries
+    ``chunks`` instead of ``content``.
+    """
+    spool = None
+    try:
+        if request.is_json:
+            data = request.get_json(silent=True)
+            if not data:
+                return jsonify({'error': 'No data provided'}), 400
+            pdf_url = data.get('pdf_url')
+            filename = data.get('filename', 'document.pdf')
+            if not pdf_url:
+                return jsonify({'error': 'pdf_url must be provided'}), 400
+            options = read_extraction_options(data)
+            max_tokens = read_chunk_size(data, required=True)
+            index_user = read_index_request(data)
+            
+            pdf_path, is_temporary, content_hash = fetch_pdf(pdf_url)
+            if not pdf_path:
+                return jsonify({
+                    'error': f'Cannot access PDF file at: {pdf_url}',
+                    'success': False
+                }), 400
+            try:
+                entry, cache_hit = extract_with_cache(pdf_path, content_hash=content_hash, options=options,
+                                                      filename=declared_name(data.get('filename'), pdf_url))
+            finally:
+                if is_temporary:
+                    remove_file(pdf_path)
+        else:
+            spool, filename, error_response = receive_upload()
+            if error_response:
+                return error_response
+            options = read_extraction_options(request.values)
+            max_tokens = read_chunk_size(request.values, required=True)
+            index_user = read_index_request(request.values)
+            entry, cache_hit = extract_with_cache(spool.name, content_hash=spool.content_hash, options=options,
+                                                  filename=filename)
         
-        logger.info(f"✅ Successfully extracted {word_count} words from {filename}")
+        body = add_chunks(build_extraction_response(entry, filename, 'docling_chunk', cache_hit), entry, max_tokens)
+        del body['content']
+        if index_user:
+            body['metadata']['index'] = try_index_entry(index_user, entry, filename, max_tokens)
         
-        # Force garbage collection to free memory
-        gc.collect()
+        logger.info(f"✅ Split {filename} into {len(body['chunks'])} chunks of up to {max_tokens} tokens")
         
-        return jsonify({
-            'success': True,
-            'title': doc_title,
-            'content': markdown_content,
-            'metadata': {
-                'filename': filename,
-                'word_count': word_count,
-                'character_count': len(markdown_content),
-                'extraction_method': 'docling_simple',
-            },
-            'extraction_confidence': 0.95
-        })
+        if not cache_hit:
+            gc.collect()
         
+        record_extraction('docling_chunk')
+        return timed_jsonify(body)
+    
+    except RequestEntityTooLarge as e:
+        record_extraction('docling_chunk', e)
+        return upload_too_large_response()
+    except InvalidOptionError as e:
+        record_extraction('docling_chunk', e)
+        return jsonify({'error': str(e), 'success': False}), 400
+    except AdmissionRejected as e:
+        logger.warning(f"⚠️ Chunking not admitted: {e}")
+        record_extraction('docling_chunk', e)
+        return admission_rejected_response(e)
+    except DownloadError as e:
+        logger.warning(f"⚠️ Download failed: {e}")
+        record_extraction('docling_chunk', e)
+        return jsonify({'error': str(e), 'success': False}), e.status
     except Exception as e:
-        logger.error(f"❌ Extraction error: {e}")
+        logger.error(f"❌ Chunking error: {e}")
+        record_extraction('docling_chunk', e)
         return jsonify({
-            'error': f'PDF extraction failed: {str(e)}',
+            'error': f'PDF chunking failed: {str(e)}',
             'success': False
         }), 500
+    finally:
+        if spool is not None:
+            spool.close()
+
+@app.route('/search', methods=['GET', 'POST'])
+def search():
+    """Top-k chunks of a user's indexed documents for a query.
+
+    Parameters (query string or JSON body): ``user_id``, ``q``, optional
+    ``k`` (default 10), ``document_id`` to search a single document and
+    ``mode``: ``semantic`` (default, vector similarity) or ``keyword``
+    (BM25, with snippet and highlight offsets).
+    """
+    try:
+        values = (request.get_json(silent=True) or {}) if request.is_json else request.values
+        user_id = read_user_id(values)
+        query = values.get('q') or ''
+        if not isinstance(query, str) or not query.strip():
+            return jsonify({'error': 'q must be a non-empty string', 'success': False}), 400
+        query = query.strip()
+        document_id = values.get('document_id')
+        if document_id is not None and not isinstance(document_id, str):
+            return jsonify({'error': 'document_id must be a string', 'success': False}), 400
+        try:
+            k = int(values.get('k', 10))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'k must be an integer', 'success': False}), 400
+        k = max(1, min(k, SEARCH_MAX_K))
+        mode = values.get('mode', 'semantic')
+        if mode not in ('semantic', 'keyword'):
+            return jsonify({'error': 'mode must be semantic or keyword', 'success': False}), 400
+        
+        start_time = time.perf_counter()
+        if mode == 'keyword':
+            matches, total_chunks = get_keyword_index(user_id).search(
+                query, k=k, document_id=document_id)
+            records = get_vector_index(user_id).read_records([row for _, row in matches])
+            results = []
+            for (score, _), record in zip(matches, records):
+                snippet, highlights = keyword_snippet(record['text'], query)
+                results.append(dict(record, score=round(score, 4), snippet=snippet, highlights=highlights))
+        else:
+            query_vector = get_embedder().embed([query])[0]
+            matches, total_chunks = get_vector_index(user_id).search(
+                query_vector, k=k, document_id=document_id)
+            results = [dict(record, score=round(score, 4)) for score, record in matches]
+        
+        return timed_jsonify({
+            'success': True,
+            'mode': mode,
+            'results': results,
+            'total_chunks': total_chunks,
+            'took_ms': round((time.perf_counter() - start_time) * 1000, 2),
+        })
+    
+    except InvalidOptionError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    except Exception as e:
+        logger.error(f"❌ Search error: {e}")
+        return jsonify({'error': f'Search failed: {str(e)}', 'success': False}), 500
 
 def process_pdf_url(pdf_url):
     """Process and validate PDF URL for different sources"""
@@ -271,48 +4736,542 @@ def process_pdf_url(pdf_url):
         logger.error(f"❌ Error processing URL: {e}")
         return None
 
+def download_batch_item(pdf_data):
+    """Download stage of the batch pipeline: resolve one item to a local file"""
+    pdf_url = pdf_data.get('pdf_url')
+    if not pdf_url:
+        raise ValueError('pdf_url must be provided')
+    read_extraction_options(pdf_data)  # Fail invalid items before downloading them
+    pdf_path, is_temporary, content_hash = fetch_pdf(pdf_url)
+    if not pdf_path:
+        raise ValueError(f'Cannot access PDF file at: {pdf_url}')
+    return pdf_path, is_temporary, content_hash
+
+def convert_batch_item(pdf_data, pdf_path, is_temporary, content_hash):
+    """Conversion stage of the batch pipeline: extract one downloaded item"""
+    started_at = time.time()
+    filename = pdf_data.get('filename', 'document.pdf')
+    try:
+        entry, cache_hit = extract_with_cache(pdf_path, content_hash=content_hash,
+                                              options=read_extraction_options(pdf_data),
+                                              filename=declared_name(pdf_data.get('filename'), pdf_data['pdf_url']))
+    finally:
+        if is_temporary:
+            remove_file(pdf_path)
+    return build_extraction_response(entry, filename, 'docling_batch', cache_hit), started_at, time.time()
+
+def run_batch(pdfs, max_workers):
+    """Extract a list of PDF items with downloads overlapping conversions.
+
+    Downloads run on their own small pool; each finished download is handed
+    to a conversion pool bounded to ``max_workers``. At most twice that many
+    items are downloading or downloaded-but-unconverted at a time, so spool
+    files do not pile up behind slow conversions. Items not started within
+    BATCH_DEADLINE_SECONDS fail instead of holding the response past the
+    worker timeout. Results keep the input order and every item reports its
+    own success/error and timings.
+    """
+    results = [None] * len(pdfs)
+    batch_start = time.time()
+    deadline = batch_start + BATCH_DEADLINE_SECONDS
+    max_in_flight = 2 * max_workers
+
+    def failure(index, error, timings):
+        record_extraction('docling_batch', error)
+        return {
+            'success': False,
+            'error': str(error),
+            'filename': pdfs[index].get('filename', 'unknown'),
+            'index': index,
+            'timings': timings,
+        }
+
+    def download(index):
+        _stage_context.endpoint = 'batch_extract'
+        started_at = time.time()
+        try:
+            return download_batch_item(pdfs[index]), None, round(time.time() - started_at, 3)
+        except Exception as e:
+            return None, e, round(time.time() - started_at, 3)
+
+    def convert(pdf_data, *downloaded):
+        _stage_context.endpoint = 'batch_extract'
+        return convert_batch_item(pdf_data, *downloaded)
+
+    pending = iter(range(len(pdfs)))
+    in_flight = 0
+    futures = {}  # future -> (stage, index, download_seconds, queued_at)
+    with ThreadPoolExecutor(max_workers=BATCH_DOWNLOAD_WORKERS, thread_name_prefix='batch-download') as download_pool, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch-convert') as convert_pool:
+        while True:
+            while in_flight < max_in_flight and time.time() < deadline:
+                index = next(pending, None)
+                if index is None:
+                    break
+                futures[download_pool.submit(download, index)] = ('download', index, None, None)
+                in_flight += 1
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index, download_seconds, queued_at = futures.pop(future)
+                if stage == 'download':
+                    downloaded, error, download_seconds = future.result()
+                    if error is not None:
+                        results[index] = failure(index, error, {'download_seconds': download_seconds})
+                        in_flight -= 1
+                        continue
+                    convert_future = convert_pool.submit(convert, pdfs[index], *downloaded)
+                    futures[convert_future] = ('convert', index, download_seconds, time.time())
+                    continue
+
+                in_flight -= 1
+                timings = {'download_seconds': download_seconds}
+                try:
+                    result, started_at, finished_at = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Batch item {index} failed: {e}")
+                    results[index] = failure(index, e, timings)
+                    continue
+                timings.update({
+                    # Time spent waiting for a free conversion worker
+                    'queue_seconds': round(started_at - queued_at, 3),
+                    'conversion_seconds': round(finished_at - started_at, 3),
+                    'total_seconds': round(finished_at - batch_start, 3),
+                })
+                record_extraction('docling_batch')
+                results[index] = dict(result, index=index, timings=timings)
+
+    for index in pending:
+        results[index] = failure(index, TimeoutError(
+            f'Not started within the {BATCH_DEADLINE_SECONDS}s batch deadline; submit large batches to /jobs'), {})
+
+    gc.collect()
+    return results
+
 @app.route('/batch_extract', methods=['POST'])
 def batch_extract():
-    """Extract content from multiple PDFs"""
+    """Extract content from multiple PDFs.
+
+    Body: ``{"pdfs": [{"pdf_url": ..., "filename": ...}, ...], "max_workers": 2}``.
+    ``max_workers`` (optional) is capped by ``DOCLING_BATCH_MAX_WORKERS``.
+    """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         pdfs = data.get('pdfs', [])
         
         if not pdfs:
             return jsonify({'error': 'No PDFs provided'}), 400
         
-        results = []
+        if not isinstance(pdfs, list) or not all(isinstance(pdf_data, dict) for pdf_data in pdfs):
+            return jsonify({'error': 'pdfs must be a list of objects'}), 400
         
-        for pdf_data in pdfs:
-            try:
-                # Process each PDF individually
-                individual_result = extract_pdf_content()
-                if individual_result[1] == 200:  # Success
-                    results.append(individual_result[0].get_json())
-                else:
-                    results.append({
-                        'success': False,
-                        'error': individual_result[0].get_json().get('error'),
-                        'filename': pdf_data.get('filename', 'unknown')
-                    })
-            except Exception as e:
-                results.append({
-                    'success': False,
-                    'error': str(e),
-                    'filename': pdf_data.get('filename', 'unknown')
-                })
+        if len(pdfs) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'Too many PDFs (limit {BATCH_MAX_ITEMS})'}), 400
         
-        return jsonify({
+        try:
+            max_workers = int(data.get('max_workers', BATCH_MAX_WORKERS))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'max_workers must be an integer'}), 400
+        max_workers = max(1, min(max_workers, BATCH_MAX_WORKERS))
+        
+        logger.info(f"🔄 Processing batch of {len(pdfs)} PDFs with {max_workers} conversion worker(s)")
+        
+        start_time = time.time()
+        results = run_batch(pdfs, max_workers)
+        
+        return timed_jsonify({
             'success': True,
             'results': results,
             'total_processed': len(results),
-            'successful_extractions': len([r for r in results if r.get('success')])
+            'successful_extractions': len([r for r in results if r.get('success')]),
+            'max_workers': max_workers,
+            'total_seconds': round(time.time() - start_time, 3)
         })
         
     except Exception as e:
         logger.error(f"❌ Batch extraction error: {e}")
         return jsonify({'error': str(e), 'success': False}), 500
 
+class JobQueue:
+    """Durable job queue backed by SQLite in WAL mode.
+
+    Jobs survive worker recycling (``--max-requests``) and crashes: a running
+    job holds a lease that its worker keeps extending, and jobs whose lease
+    expired are handed to the next worker that asks for work, up to
+    ``JOB_MAX_ATTEMPTS`` times. Every gunicorn worker shares the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    result TEXT,
+                    page_spans TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_expires_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)')
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'page_spans' not in columns:  # Databases created before content_pages worked on jobs
+                conn.execute('ALTER TABLE jobs ADD COLUMN page_spans TEXT')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind, payload, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, payload, status, stage, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(payload), 'queued', 'queued', now, now),
+            )
+        return job_id
+
+    def claim(self):
+        """Atomically take the oldest runnable job, or return None"""
+        now = time.time()
+        with self._connect() as conn:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                # Give up on jobs that keep killing their worker
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', stage = 'failed', updated_at = ?, "
+                    "error = 'Job abandoned after repeated worker failures' "
+                    "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                    (now, now, JOB_MAX_ATTEMPTS),
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'running' AND lease_expires_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', stage = 'starting', attempts = attempts + 1, "
+                    "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    (now + JOB_LEASE_SECONDS, now, row['id']),
+                )
+                conn.execute('COMMIT')
+                job = dict(row)
+                job['payload'] = json.loads(job['payload'])
+                job['status'] = 'running'
+                job['attempts'] += 1
+                return job
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def heartbeat(self, job_id):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = 'running'",
+                (now + JOB_LEASE_SECONDS, job_id),
+            )
+
+    def update_progress(self, job_id, stage, progress):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ?, lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (stage, progress, now + JOB_LEASE_SECONDS, now, job_id),
+            )
+
+    def finish(self, job_id, result=None, error=None, page_spans=None):
+        """Record the outcome; ``page_spans`` (kept apart from the result) serve ``content_pages``"""
+        status = 'failed' if error else 'succeeded'
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, stage = ?, progress = ?, result = ?, page_spans = ?, error = ?, '
+                'lease_expires_at = NULL, updated_at = ? WHERE id = ?',
+                (status, status, 1.0 if result is not None else 0.0,
+                 compress_stored(json.dumps(result).encode('utf-8')) if result is not None else None,
+                 json.dumps(page_spans) if page_spans else None,
+                 error, time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(decompress_stored(job['result'])) if job['result'] else None
+        job['page_spans'] = json.loads(job['page_spans']) if job['page_spans'] else None
+        return job
+
+    def depth(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def purge(self, older_than):
+        """Delete finished jobs last updated before ``older_than``; returns their payloads"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT payload FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                (older_than,),
+            ).fetchall()
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                (older_than,),
+            )
+        return [json.loads(row['payload']) for row in rows]
+
+_job_queue = None
+_job_workers_pid = None
+_job_workers_lock = threading.Lock()
+_job_wakeup = threading.Event()
+
+def get_job_queue():
+    """Get or create the job queue singleton"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(JOBS_DB_PATH)
+    return _job_queue
+
+def run_job(queue, job):
+    """Execute one claimed job and record its result"""
+    job_id = job['id']
+    payload = job['payload']
+    filename = payload.get('filename', 'document.pdf')
+
+    # Keep the lease alive while Docling runs (it gives no progress callbacks)
+    done = threading.Event()
+
+    def keep_lease():
+        while not done.wait(JOB_LEASE_SECONDS / 3):
+            try:
+                queue.heartbeat(job_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Job {job_id} heartbeat failed: {e}")
+
+    threading.Thread(target=keep_lease, name=f'job-lease-{job_id[:8]}', daemon=True).start()
+
+    try:
+        if job['kind'] == 'upload':
+            pdf_path, is_temporary = payload['spool_path'], False
+            content_hash = payload.get('content_hash')
+            extraction_method = 'docling_upload'
+        else:
+            queue.update_progress(job_id, 'downloading', 0.1)
+            pdf_path, is_temporary, content_hash = fetch_pdf(payload['pdf_url'])
+            if not pdf_path:
+                raise ValueError(f"Cannot access PDF file at: {payload['pdf_url']}")
+            extraction_method = 'docling_simple'
+
+        queue.update_progress(job_id, 'converting', 0.3)
+        try:
+            # Background work waits for memory instead of being turned away
+            entry, cache_hit = extract_with_cache(
+                pdf_path, content_hash=content_hash, options=payload.get('options'), background=True,
+                filename=payload.get('source_name', filename))
+        finally:
+            if is_temporary:
+                remove_file(pdf_path)
+
+        queue.finish(job_id, result=build_extraction_response(entry, filename, extraction_method, cache_hit),
+                     page_spans=entry.get('page_spans'))
+        record_extraction('job')
+        logger.info(f"✅ Job {job_id} finished: {entry['metadata']['word_count']} words from {filename}")
+    except Exception as e:
+        logger.error(f"❌ Job {job_id} failed: {e}")
+        record_extraction('job', e)
+        queue.finish(job_id, error=f'PDF extraction failed: {str(e)}')
+    finally:
+        done.set()
+        if job['kind'] == 'upload':
+            remove_file(payload['spool_path'])
+        gc.collect()
+
+def job_worker_loop():
+    """Background worker: pull jobs from the durable queue until the process exits"""
+    queue = get_job_queue()
+    _stage_context.endpoint = 'jobs'
+    last_purge = 0
+    while True:
+        try:
+            if time.time() - last_purge > 3600:
+                for payload in queue.purge(time.time() - JOB_RETENTION_SECONDS):
+                    if payload.get('spool_path'):
+                        remove_file(payload['spool_path'])
+                last_purge = time.time()
+
+            job = queue.claim()
+            if job is None:
+                _job_wakeup.wait(timeout=2)
+                _job_wakeup.clear()
+                continue
+
+            logger.info(f"🔄 Running job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+            run_job(queue, job)
+        except Exception as e:
+            logger.error(f"❌ Job worker error: {e}")
+            time.sleep(2)
+
+def ensure_job_workers():
+    """Start this process's job worker threads (once per forked gunicorn worker)"""
+    global _job_workers_pid
+    if JOB_WORKERS <= 0 or _job_workers_pid == os.getpid():
+        return
+    with _job_workers_lock:
+        if _job_workers_pid == os.getpid():
+            return
+        get_job_queue()
+        for index in range(JOB_WORKERS):
+            threading.Thread(target=job_worker_loop, name=f'job-worker-{index}', daemon=True).start()
+        _job_workers_pid = os.getpid()
+        logger.info(f"🧵 Started {JOB_WORKERS} job worker thread(s) in process {os.getpid()}")
+
+@app.before_request
+def start_background_workers():
+    """Start job workers and the warm-up in this process (gunicorn post_worker_init or first request)"""
+    ensure_warmup()
+    ensure_job_workers()
+
+def job_status_body(job):
+    """Public view of a job row"""
+    body = {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'stage': job['stage'],
+        'progress': job['progress'],
+        'attempts': job['attempts'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+    }
+    if job['status'] == 'succeeded':
+        body['result'] = job['result']
+    elif job['status'] == 'failed':
+        body['error'] = job['error']
+    return body
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue an extraction and return a job id immediately.
+
+    Takes the same payloads as /extract (JSON with ``pdf_url``) or /upload
+    (multipart ``file`` or raw ``application/pdf`` body). Poll
+    ``GET /jobs/<id>`` for status, progress and the result.
+    """
+    spool = None
+    try:
+        queue = get_job_queue()
+        job_id = uuid.uuid4().hex
+        
+        if request.is_json:
+            data = request.get_json(silent=True)
+            if not data:
+                return jsonify({'error': 'No data provided'}), 400
+            if not data.get('pdf_url'):
+                return jsonify({'error': 'pdf_url must be provided'}), 400
+            kind = 'extract'
+            payload = {
+                'pdf_url': data['pdf_url'],
+                'filename': data.get('filename', 'document.pdf'),
+                'source_name': declared_name(data.get('filename'), data['pdf_url']),
+                'options': read_extraction_options(data),
+            }
+        else:
+            spool, filename, error_response = receive_upload()
+            if error_response:
+                return error_response
+            options = read_extraction_options(request.values)
+            # Keep the upload on disk until a worker picks the job up
+            os.makedirs(JOBS_DIR, exist_ok=True)
+            spool_path = os.path.join(JOBS_DIR, f'{job_id}.pdf')
+            spool.detach(spool_path)
+            kind = 'upload'
+            payload = {
+                'spool_path': spool_path,
+                'filename': filename,
+                'content_hash': spool.content_hash,
+                'options': options,
+            }
+        
+        queue.enqueue(kind, payload, job_id=job_id)
+        _job_wakeup.set()
+        logger.info(f"📥 Queued job {job_id} ({kind}) for {payload['filename']}")
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/jobs/{job_id}'
+        }), 202
+    
+    except RequestEntityTooLarge:
+        return upload_too_large_response()
+    except InvalidOptionError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    except Exception as e:
+        logger.error(f"❌ Job creation error: {e}")
+        if spool is not None:
+            remove_file(spool.name)
+        return jsonify({'error': f'Failed to queue job: {str(e)}', 'success': False}), 500
+    finally:
+        if spool is not None:
+            spool.close()
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the status, progress and (when finished) the result of a job"""
+    try:
+        job = get_job_queue().get(job_id)
+    except Exception as e:
+        logger.error(f"❌ Job lookup error: {e}")
+        return jsonify({'error': str(e), 'success': False}), 500
+    
+    if job is None:
+        return jsonify({'error': 'Job not found', 'success': False}), 404
+    
+    body = job_status_body(job)
+    try:
+        shape = read_response_shape(request.args)
+        if shape and body.get('result'):
+            body['result'] = shape_extraction_response(body['result'], shape, job['page_spans'])
+    except InvalidOptionError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    return timed_jsonify(body)
+
+_module_import_seconds = time.perf_counter() - _import_started
+
+if PRELOAD_MODELS and __name__ != '__main__':
+    try:
+        preload_models()
+    except Exception as e:
+        logger.error(f"❌ Docling preload failed, workers will load lazily: {e}")
+        _converter_error = None
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     debug_mode = os.environ.get('DEBUG', 'False').lower() == 'true'
@@ -320,14 +5279,7 @@ if __name__ == '__main__':
     logger.info(f"🚀 Starting Docling PDF Extraction Service on port {port}")
     logger.info(f"🔧 Debug mode: {debug_mode}")
     
-    # Test Docling availability
-    try:
-        converter = get_converter()
-        if converter is not None:
-            logger.info("✅ Docling converter is ready and available")
-        else:
-            logger.warning("⚠️ Docling converter is not available")
-    except Exception as e:
-        logger.error(f"❌ Docling converter initialization failed: {e}")
+    # Warm up Docling in the background; /ready turns 200 when it is done
+    ensure_warmup()
     
     app.run(host='0.0.0.0', port=port, debug=debug_mode)
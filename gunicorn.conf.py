@@ -0,0 +1,39 @@
+"""
+Gunicorn settings for the Docling service (used by start.sh)
+
+Single worker by default. With DOCLING_PRELOAD=true the app, the Docling
+converter and its model weights are loaded once in the master; workers are
+forked afterwards and share those pages copy-on-write, so WEB_CONCURRENCY > 1
+no longer multiplies the model memory. Recycled workers (max_requests) are
+forked from the already-loaded master and start instantly.
+"""
+
+import gc
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+timeout = int(os.environ.get('DOCLING_WORKER_TIMEOUT', '120'))  # also read by docling_service
+max_requests = 100
+max_requests_jitter = 10
+preload_app = os.environ.get('DOCLING_PRELOAD', 'false').lower() == 'true'
+
+def pre_fork(server, worker):
+    # Move everything allocated so far into the permanent generation so the
+    # collector never touches (and un-shares) the master's pages in a worker
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Split the CPU between workers instead of each one using every core
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // max(workers, 1)))
+
+def post_worker_init(worker):
+    # Start warming the converter and the job workers as soon as the worker has
+    # loaded the app, instead of waiting for the first request (see /ready).
+    # A recycled or restarted worker thus picks up queued and lease-expired jobs
+    service = sys.modules.get('docling_service')
+    if service is not None:
+        service.start_background_workers()
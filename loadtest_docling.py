@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Concurrency sweep load test for the Docling service
+
+Starts docling_service under a local gunicorn (or targets --url), then for
+each concurrency level runs that many clients for --duration seconds with a
+weighted mix of /upload (multipart), /extract (local file path) and /health
+requests. Reports p50/p95/p99 latency per request type, throughput, error
+and timeout rates, status codes and the service RSS over time as JSON.
+
+    python loadtest_docling.py --simulate --page-seconds 0.2 --page-mb 30
+    python loadtest_docling.py --concurrency 1 2 4 8 --mix upload=6,extract=3,health=1
+    python loadtest_docling.py --url http://localhost:8080 --concurrency 4
+
+--simulate replaces Docling with the service's simulated converter
+(DOCLING_SIMULATE): every page sleeps --page-seconds and holds --page-mb, so
+the Flask/gunicorn layer, admission control and queuing can be stressed
+without loading any model.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+import requests
+
+from benchmark_docling import GunicornTarget, build_corpus
+
+DEFAULT_DOCUMENTS = ['test_upload', 'text_10p', 'scanned_3p', 'tables_5p']
+
+def parse_mix(text):
+    """'upload=6,extract=3,health=1' -> {'upload': 6.0, ...}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('upload', 'extract', 'health'):
+            raise argparse.ArgumentTypeError(f'Unknown request type: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(0, math.ceil(fraction * len(ordered)) - 1)], 4)
+
+def latency_summary(latencies):
+    return {
+        'count': len(latencies),
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': round(max(latencies), 4) if latencies else None,
+    }
+
+class RSSRecorder:
+    """Sample the total RSS of the service processes at a fixed interval"""
+
+    def __init__(self, get_processes, interval=0.5):
+        self.get_processes = get_processes
+        self.interval = interval
+        self.samples = []
+
+    def _run(self, start_time):
+        while not self._stop.wait(self.interval):
+            total = 0
+            for process in self.get_processes():
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    continue
+            self.samples.append([round(time.time() - start_time, 2), total // (1024 * 1024)])
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(time.time(),), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+def send_request(session, base_url, kind, document, timeout):
+    if kind == 'health':
+        return session.get(f'{base_url}/health', timeout=timeout)
+    if kind == 'extract':
+        return session.post(f'{base_url}/extract', json={
+            'pdf_url': document['path'],
+            'filename': os.path.basename(document['path']),
+        }, timeout=timeout)
+    with open(document['path'], 'rb') as f:
+        return session.post(f'{base_url}/upload',
+                            files={'file': (os.path.basename(document['path']), f, 'application/pdf')},
+                            timeout=timeout)
+
+def client_loop(base_url, mix, documents, deadline, timeout, seed, records):
+    """One simulated client: send requests back to back until ``deadline``"""
+    rng = random.Random(seed)
+    session = requests.Session()
+    kinds, weights = zip(*mix.items())
+    while time.time() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        document = rng.choice(documents)
+        record = {'kind': kind, 'document': document['name']}
+        start_time = time.perf_counter()
+        try:
+            response = send_request(session, base_url, kind, document, timeout)
+            record['status'] = response.status_code
+        except requests.Timeout:
+            record['status'] = 'timeout'
+        except requests.RequestException as e:
+            record['status'] = 'error'
+            record['error'] = type(e).__name__
+        record['latency_seconds'] = time.perf_counter() - start_time
+        records.append(record)
+
+def run_level(base_url, concurrency, args, mix, documents, get_processes):
+    """Run ``concurrency`` clients for ``args.duration`` seconds and summarise"""
+    records = []
+    deadline = time.time() + args.duration
+    threads = [
+        threading.Thread(target=client_loop,
+                         args=(base_url, mix, documents, deadline, args.timeout, args.seed + index, records),
+                         daemon=True)
+        for index in range(concurrency)
+    ]
+    start_time = time.time()
+    with RSSRecorder(get_processes) as rss:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.time() - start_time
+
+    statuses = {}
+    for record in records:
+        statuses[str(record['status'])] = statuses.get(str(record['status']), 0) + 1
+    ok = [record for record in records if record['status'] == 200]
+    timeouts = [record for record in records if record['status'] == 'timeout']
+
+    by_kind = {}
+    for kind in mix:
+        kind_records = [record for record in records if record['kind'] == kind]
+        by_kind[kind] = dict(
+            latency_summary([record['latency_seconds'] for record in kind_records if record['status'] == 200]),
+            errors=len([record for record in kind_records if record['status'] != 200]),
+        )
+
+    total = len(records) or 1
+    return {
+        'concurrency': concurrency,
+        'duration_seconds': round(elapsed, 2),
+        'requests': len(records),
+        'throughput_rps': round(len(ok) / elapsed, 3) if elapsed else None,
+        'error_rate': round((len(records) - len(ok)) / total, 4),
+        'timeout_rate': round(len(timeouts) / total, 4),
+        'status_counts': statuses,
+        'latency': latency_summary([record['latency_seconds'] for record in ok]),
+        'by_kind': by_kind,
+        'rss_peak_mb': max((sample[1] for sample in rss.samples), default=None),
+        'rss_samples': rss.samples,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrency sweep for docling_service')
+    parser.add_argument('--url', help='target a running service instead of starting gunicorn')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--duration', type=float, default=30, help='seconds per concurrency level')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('upload=6,extract=3,health=1'))
+    parser.add_argument('--documents', nargs='+', default=DEFAULT_DOCUMENTS, help='corpus document names')
+    parser.add_argument('--timeout', type=float, default=120, help='client timeout per request (seconds)')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--cache', action='store_true', help='keep the extraction cache enabled')
+    parser.add_argument('--simulate', action='store_true', help='use the simulated converter')
+    parser.add_argument('--page-seconds', type=float, default=0.5, help='simulated time per page')
+    parser.add_argument('--page-mb', type=float, default=20, help='simulated memory per page')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'docling_bench_corpus'))
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    args = parser.parse_args()
+
+    documents = build_corpus(args.corpus_dir, args.documents)
+    if not documents:
+        parser.error('no documents selected')
+
+    target = None
+    data_dir = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        get_processes = list  # Remote service: RSS is not visible from here
+    else:
+        data_dir = tempfile.mkdtemp(prefix='docling_load_')
+        env = {'DOCLING_DATA_DIR': data_dir, 'DOCLING_JOB_WORKERS': '0'}
+        if not args.cache:
+            env['DOCLING_CACHE_MAX_MB'] = '0'
+        if args.simulate:
+            env.update({
+                'DOCLING_SIMULATE': 'true',
+                'DOCLING_SIMULATE_PAGE_SECONDS': str(args.page_seconds),
+                'DOCLING_SIMULATE_PAGE_MB': str(args.page_mb),
+            })
+        print(f"🚀 Starting gunicorn with {args.workers} worker(s)...", file=sys.stderr)
+        target = GunicornTarget(env, args.workers)
+        base_url = target.base_url
+        get_processes = target.processes
+
+    levels = []
+    try:
+        for concurrency in args.concurrency:
+            print(f"⏱️ Concurrency {concurrency} for {args.duration}s...", file=sys.stderr)
+            level = run_level(base_url, concurrency, args, args.mix, documents, get_processes)
+            print(f"📊 c={concurrency}: {level['throughput_rps']} req/s, p50 {level['latency']['p50']}s, "
+                  f"p99 {level['latency']['p99']}s, errors {level['error_rate']:.1%}, "
+                  f"peak RSS {level['rss_peak_mb']} MB", file=sys.stderr)
+            levels.append(level)
+    finally:
+        if target is not None:
+            target.close()
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'url': args.url,
+            'workers': None if args.url else args.workers,
+            'mix': args.mix,
+            'documents': [document['name'] for document in documents],
+            'simulate': {'page_seconds': args.page_seconds, 'page_mb': args.page_mb} if args.simulate else None,
+            'cache': args.cache,
+        },
+        'levels': levels,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"💾 Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
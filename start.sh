@@ -5,10 +5,7 @@ export PORT=${PORT:-8080}
 
 echo "Starting Docling service on port $PORT"
 
-# Start the Docling service with single worker to avoid OOM
-exec gunicorn docling_service:app \
-    --workers 1 \
-    --bind 0.0.0.0:$PORT \
-    --timeout 120 \
-    --max-requests 100 \
-    --max-requests-jitter 10
+# Start the Docling service; worker count, timeouts and model preloading
+# are configured in gunicorn.conf.py (single worker unless WEB_CONCURRENCY
+# is raised together with DOCLING_PRELOAD=true)
+exec gunicorn docling_service:app --config gunicorn.conf.py
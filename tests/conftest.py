@@ -0,0 +1,48 @@
+"""Offline test setup: simulated converter, throwaway data directory, no warm-up or job threads"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# docling_service reads its configuration at import time
+os.environ.update({
+    'DOCLING_DATA_DIR': tempfile.mkdtemp(prefix='docling_tests_'),
+    'DOCLING_SIMULATE': 'true',
+    'DOCLING_SIMULATE_PAGE_SECONDS': '0',
+    'DOCLING_SIMULATE_PAGE_MB': '1',
+    'DOCLING_WARMUP': 'false',
+    'DOCLING_JOB_WORKERS': '0',
+})
+
+import docling_service  # noqa: E402
+
+@pytest.fixture
+def service():
+    return docling_service
+
+@pytest.fixture
+def client():
+    return docling_service.app.test_client()
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Write a PDF with one text page per string (``None`` = blank page, like a scan)"""
+    import fitz  # PyMuPDF
+
+    def make(pages, name='doc.pdf'):
+        doc = fitz.open()
+        for text in pages:
+            page = doc.new_page()
+            if text:
+                page.insert_text((72, 72), text, fontsize=11)
+        path = tmp_path / name
+        doc.save(str(path))
+        doc.close()
+        return str(path)
+
+    return make
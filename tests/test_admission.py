@@ -0,0 +1,105 @@
+"""Memory-budget admission control and the pre-read upload check"""
+
+import io
+import threading
+import time
+
+import pytest
+
+@pytest.fixture
+def controller(service, monkeypatch):
+    monkeypatch.setattr(service, 'get_process_rss_mb', lambda: 0)
+    return service.AdmissionController(budget_mb=1000, max_waiting=1)
+
+def test_precheck_rejects_what_never_fits(service, controller):
+    with pytest.raises(service.AdmissionRejected) as error:
+        controller.precheck(1500)
+    assert error.value.status == 413
+    controller.precheck(900)
+
+def test_precheck_rejects_when_the_queue_is_full(service, controller):
+    controller.reserved_mb = 800
+    controller.waiting = 1
+    with pytest.raises(service.AdmissionRejected) as error:
+        controller.precheck(300)
+    assert error.value.status == 429
+    assert error.value.retry_after == service.ADMISSION_RETRY_AFTER_SECONDS
+    controller.precheck(100)  # Fits right away
+    controller.precheck(300, queued=False)  # Background jobs wait instead
+
+def test_first_conversion_is_always_admitted(controller):
+    controller.baseline_mb = 900
+    with controller.admit(50):
+        assert controller.active == 1
+
+def test_idle_worker_admits_despite_a_high_rss(service, controller, monkeypatch):
+    # After a large conversion the allocator keeps RSS near the budget
+    monkeypatch.setattr(service, 'get_process_rss_mb', lambda: 950)
+    with controller.admit(100):
+        assert controller.active == 1
+    with pytest.raises(service.AdmissionRejected) as error:
+        controller.acquire(1100)
+    assert error.value.status == 413
+
+def test_never_fits_is_judged_against_the_idle_baseline(service, controller, monkeypatch):
+    monkeypatch.setattr(service, 'get_process_rss_mb', lambda: 600)
+    controller.record_idle_baseline()
+    assert controller.stats()['idle_baseline_mb'] == 600
+    with pytest.raises(service.AdmissionRejected) as error:
+        controller.acquire(500)
+    assert error.value.status == 413
+    controller.precheck(350)
+
+def test_waiting_conversion_times_out(service, controller):
+    with controller.admit(800):
+        start = time.time()
+        with pytest.raises(service.AdmissionRejected) as error:
+            controller.acquire(300, timeout=0.2)
+        assert error.value.status == 429
+        assert time.time() - start >= 0.2
+    assert controller.stats()['rejected'] == 1
+    assert controller.reserved_mb == 0
+
+def test_waiting_conversion_runs_after_a_release(controller):
+    controller.acquire(800)
+    admitted = threading.Event()
+
+    def wait_for_memory():
+        with controller.admit(300, timeout=5):
+            admitted.set()
+
+    thread = threading.Thread(target=wait_for_memory)
+    thread.start()
+    time.sleep(0.1)
+    assert not admitted.is_set() and controller.waiting == 1
+    controller.release(800)
+    thread.join(5)
+    assert admitted.is_set()
+
+def test_upload_rejected_before_reading(service, client, monkeypatch):
+    monkeypatch.setattr(service, '_admission_controller', service.AdmissionController(100, 0))
+    response = client.post('/upload', data=b'%PDF-1.4\n' + b'0' * 1024, content_type='application/pdf')
+    assert response.status_code == 413
+
+    busy = service.AdmissionController(10000, 0)
+    busy.baseline_mb, busy.reserved_mb = 0, 9900
+    monkeypatch.setattr(service, '_admission_controller', busy)
+    response = client.post('/upload', data=b'%PDF-1.4\n' + b'0' * 1024, content_type='application/pdf')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(service.ADMISSION_RETRY_AFTER_SECONDS)
+
+    # Natively parsed formats never reach the converter, so they skip the check
+    response = client.post('/upload', data=b'# Title\n\nSome text.\n', content_type='text/markdown')
+    assert response.status_code == 200
+
+def test_upload_precheck_follows_the_declared_format(service, client, monkeypatch):
+    monkeypatch.setattr(service, '_admission_controller', service.AdmissionController(100, 0))
+    body = b'0' * 200 * 1024
+
+    # A PDF of this size could never fit, whether raw or multipart
+    assert client.post('/upload', data={'file': (io.BytesIO(body), 'big.pdf')}).status_code == 413
+    # Office and text formats never reach Docling, so they are read (and then parsed)
+    rows = b'a,b\n' + b'1,2\n' * 50 * 1024
+    response = client.post('/upload', data={'file': (io.BytesIO(rows), 'rows.csv')})
+    assert response.status_code == 200
+    assert response.json['metadata']['source_format'] == 'csv'
@@ -0,0 +1,68 @@
+"""Batch pipeline: ordering, timings, in-flight bound and deadline"""
+
+import threading
+import time
+
+def test_results_keep_order_and_report_timings(client, make_pdf):
+    paths = [make_pdf([f'Batch document {n}'], name=f'b{n}.pdf') for n in range(3)]
+    pdfs = [{'pdf_url': path, 'filename': f'b{n}.pdf'} for n, path in enumerate(paths)]
+    pdfs.insert(1, {'filename': 'missing.pdf'})
+
+    response = client.post('/batch_extract', json={'pdfs': pdfs})
+
+    results = response.get_json()['results']
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    assert [result['success'] for result in results] == [True, False, True, True]
+    assert set(results[0]['timings']) == {'download_seconds', 'queue_seconds', 'conversion_seconds',
+                                          'total_seconds'}
+
+def test_failed_download_reports_its_own_duration(service, monkeypatch):
+    def download_batch_item(pdf_data):
+        time.sleep(pdf_data['delay'])
+        raise ValueError('unreachable')
+
+    monkeypatch.setattr(service, 'download_batch_item', download_batch_item)
+    monkeypatch.setattr(service, 'BATCH_DOWNLOAD_WORKERS', 1)
+    results = service.run_batch([{'delay': 0.3}, {'delay': 0.05}], max_workers=1)
+
+    # The second download waited 0.3 s for the pool but only took 0.05 s itself
+    assert results[1]['timings']['download_seconds'] < 0.2
+
+def test_downloads_stay_within_twice_the_workers(service, monkeypatch):
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'peak': 0}
+
+    def download_batch_item(pdf_data):
+        with lock:
+            state['in_flight'] += 1
+            state['peak'] = max(state['peak'], state['in_flight'])
+        return None, False, None
+
+    def convert_batch_item(pdf_data, *downloaded):
+        time.sleep(0.02)
+        with lock:
+            state['in_flight'] -= 1
+        now = time.time()
+        return {'success': True}, now, now
+
+    monkeypatch.setattr(service, 'download_batch_item', download_batch_item)
+    monkeypatch.setattr(service, 'convert_batch_item', convert_batch_item)
+    monkeypatch.setattr(service, 'BATCH_DOWNLOAD_WORKERS', 8)
+    results = service.run_batch([{}] * 20, max_workers=1)
+
+    assert all(result['success'] for result in results)
+    assert state['peak'] <= 2
+
+def test_items_not_started_by_the_deadline_fail(service, monkeypatch):
+    def convert_batch_item(pdf_data, *downloaded):
+        time.sleep(0.6)
+        now = time.time()
+        return {'success': True}, now, now
+
+    monkeypatch.setattr(service, 'download_batch_item', lambda pdf_data: (None, False, None))
+    monkeypatch.setattr(service, 'convert_batch_item', convert_batch_item)
+    monkeypatch.setattr(service, 'BATCH_DEADLINE_SECONDS', 1)
+    results = service.run_batch([{}] * 6, max_workers=1)
+
+    assert [result['success'] for result in results] == [True, True, True, False, False, False]
+    assert '/jobs' in results[-1]['error']
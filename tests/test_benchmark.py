@@ -0,0 +1,27 @@
+"""Offline benchmark: generated corpus and per-document runs"""
+
+import benchmark_docling
+
+def test_run_document_reports_each_run(tmp_path):
+    documents = benchmark_docling.build_corpus(str(tmp_path), ['text_1p'])
+    target = benchmark_docling.InProcessTarget({})
+
+    result = benchmark_docling.run_document(target, documents[0], 2, {})
+
+    assert result['pages'] == 1
+    assert len(result['runs']) == 2
+    run = result['runs'][0]
+    assert 'error' not in run
+    assert run['output_chars'] > 0
+    assert run['docling_pages'] == 0
+
+def test_run_document_counts_docling_pages(tmp_path):
+    # Scanned pages go through the (simulated) Docling path, so docling_pages is an int > 0
+    documents = benchmark_docling.build_corpus(str(tmp_path), ['scanned_3p'])
+    target = benchmark_docling.InProcessTarget({})
+
+    result = benchmark_docling.run_document(target, documents[0], 1, {})
+
+    run = result['runs'][0]
+    assert 'error' not in run
+    assert run['docling_pages'] == 3
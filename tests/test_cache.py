@@ -0,0 +1,65 @@
+"""Content-addressed extraction cache: keys, expiry, eviction and cache hits"""
+
+import io
+import os
+import time
+
+import pytest
+
+@pytest.fixture
+def cache(service, tmp_path):
+    return service.ExtractionCache(str(tmp_path / 'cache'), max_bytes=10 ** 6, ttl_seconds=3600)
+
+def entry(text):
+    return {'content': text, 'metadata': {'word_count': len(text.split())}}
+
+def test_keys_depend_on_content_and_options(cache):
+    key = cache.make_key('a' * 64, {'pages': [1, 2], 'quality': 'fast'})
+    assert key == cache.make_key('a' * 64, {'quality': 'fast', 'pages': [1, 2]})
+    assert key != cache.make_key('b' * 64, {'pages': [1, 2], 'quality': 'fast'})
+    assert key != cache.make_key('a' * 64, {'pages': [1], 'quality': 'fast'})
+    assert cache.make_key('a' * 64) == cache.make_key('a' * 64, {})
+
+def test_round_trip(cache):
+    key = cache.make_key('a' * 64)
+    assert cache.get(key) is None
+    cache.put(key, entry('cached text'))
+    stored = cache.get(key)
+    assert stored['content'] == 'cached text'
+    assert stored['created_at'] <= time.time()
+
+def test_expired_entries_are_dropped(cache):
+    key = cache.make_key('a' * 64)
+    cache.put(key, entry('old text'))
+    cache.ttl_seconds = -1
+    assert cache.get(key) is None
+    assert not os.path.exists(cache._path(key))
+
+def test_least_recently_used_entries_are_evicted(cache):
+    keys = [cache.make_key(str(number) * 64) for number in range(3)]
+    for age, key in zip((300, 200, 100), keys):
+        cache.put(key, entry(os.urandom(2000).hex()))
+        os.utime(cache._path(key), (time.time() - age, time.time() - age))
+    cache.get(keys[0])  # Now the most recently used
+
+    cache.max_bytes = sum(os.path.getsize(cache._path(key)) for key in keys[:2]) + 100
+    cache.put(cache.make_key('f' * 64), entry('small'))
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+
+def test_second_upload_is_served_from_the_cache(client, make_pdf):
+    pdf_path = make_pdf(['cached upload text'], name='cached.pdf')
+    with open(pdf_path, 'rb') as f:
+        data = f.read()
+
+    def upload():
+        return client.post('/upload', data={'file': (io.BytesIO(data), 'cached.pdf')}).get_json()
+
+    first, second = upload(), upload()
+
+    assert first['metadata']['cached'] is False
+    assert second['metadata']['cached'] is True
+    assert second['content'] == first['content']
+    assert second['metadata']['content_hash'] == first['metadata']['content_hash']
@@ -0,0 +1,55 @@
+"""Structure-aware, token-bounded chunking of extracted markdown"""
+
+MARKDOWN = (
+    '# Intro\n\nFirst paragraph here.\n\n'
+    '## Details\n\n| a | b |\n|---|---|\n| 1 | 2 |\n| 3 | 4 |\n\n'
+    'Second paragraph. It has two sentences.\n\n'
+    '# Next\n\nLast.'
+)
+
+def test_chunks_follow_headings_and_pages(service):
+    spans = [[1, 0, 40], [2, 40, len(MARKDOWN)]]
+    chunks = service.chunk_markdown(MARKDOWN, spans, max_tokens=20)
+
+    assert [chunk['section_path'] for chunk in chunks] == [
+        ['Intro'], ['Intro', 'Details'], ['Intro', 'Details'], ['Next']]
+    assert [chunk['pages'] for chunk in chunks] == [[1], [1, 2], [2], [2]]
+    assert [chunk['index'] for chunk in chunks] == [0, 1, 2, 3]
+    for chunk in chunks:
+        assert MARKDOWN[chunk['start']:chunk['end']] == chunk['text']
+        assert chunk['tokens'] <= 20
+
+def test_without_spans_pages_are_unknown(service):
+    chunks = service.chunk_markdown('Just one paragraph.')
+    assert len(chunks) == 1
+    assert chunks[0]['pages'] is None
+    assert chunks[0]['section_path'] == []
+
+def test_long_paragraphs_split_at_sentence_ends(service):
+    paragraph = ' '.join(f'Sentence number {number} says something.' for number in range(40))
+    chunks = service.chunk_markdown(paragraph, max_tokens=40)
+
+    assert len(chunks) > 1
+    assert all(chunk['tokens'] <= 40 for chunk in chunks)
+    assert all(chunk['text'].endswith('.') for chunk in chunks)
+
+def test_large_tables_repeat_their_header(service):
+    table = '| name | value |\n|---|---|\n' + '\n'.join(f'| row {number} | {number} |' for number in range(60))
+    chunks = service.chunk_markdown(table, max_tokens=40)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk['text'].startswith('| name | value |\n|---|---|\n| row ')
+    rows = [line for chunk in chunks for line in chunk['text'].split('\n')[2:]]
+    assert rows == [f'| row {number} | {number} |' for number in range(60)]
+
+def test_chunk_endpoint(service, client):
+    response = client.post('/chunk?max_tokens=64', data=MARKDOWN.encode(), content_type='text/markdown')
+    body = response.get_json()
+    assert response.status_code == 200
+    assert 'content' not in body
+    assert body['metadata']['chunk_count'] == len(body['chunks'])
+    assert body['chunks'][0]['section_path'] == ['Intro']
+
+    response = client.post('/chunk?max_tokens=5', data=MARKDOWN.encode(), content_type='text/markdown')
+    assert response.status_code == 400
@@ -0,0 +1,63 @@
+"""Compressed responses and compressed result storage"""
+
+import gzip
+import json
+import zlib
+
+import pytest
+from werkzeug.http import parse_accept_header
+
+def test_stored_round_trip(service):
+    data = json.dumps({'content': 'Table of Contents ' * 50, 'metadata': {'word_count': 150}}).encode()
+    stored = service.compress_stored(data)
+    assert stored.startswith(service.STORAGE_MAGIC)
+    assert len(stored) < len(data) // 5
+    assert service.decompress_stored(stored) == data
+    assert service.decompress_stored(b'{"legacy": true}') == b'{"legacy": true}'
+
+def test_encoding_follows_the_client_preference(service):
+    def choose(header):
+        return service.choose_response_encoding(parse_accept_header(header))
+
+    assert choose('gzip') == 'gzip'
+    assert choose('identity') is None
+    assert choose('gzip;q=0.5, zstd;q=0.1') == 'gzip'
+    assert choose('gzip;q=0') is None
+    if service.get_response_encodings() != ('gzip',):  # zstandard or brotli installed
+        assert choose('gzip;q=0, *') == service.get_response_encodings()[0]
+
+def test_large_json_is_gzipped(client, make_pdf):
+    pdf_path = make_pdf(['\n'.join(['compressible words on a line'] * 40)], name='large.pdf')
+    plain = client.post('/extract', json={'pdf_url': pdf_path})
+    compressed = client.post('/extract', json={'pdf_url': pdf_path}, headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert json.loads(gzip.decompress(compressed.data))['content'] == plain.get_json()['content']
+
+def test_small_responses_stay_plain(client):
+    response = client.get('/healthz', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+def test_streamed_records_are_flushed(client, make_pdf):
+    response = client.post('/extract', json={'pdf_url': make_pdf(['one', 'two'], name='flushed.pdf'),
+                                             'stream': 'ndjson'},
+                           headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    decompressor = zlib.decompressobj(31)
+    first_piece = next(iter(response.response))
+    first_piece += next(iter(response.response))  # The record, then its flush
+    assert decompressor.decompress(first_piece).decode().endswith('\n')
+    response.close()
+
+@pytest.mark.parametrize('encoding, module', [('zstd', 'zstandard'), ('br', 'brotli')])
+def test_optional_encodings(service, encoding, module):
+    library = pytest.importorskip(module)
+    compressor = service.StreamCompressor(encoding)
+    data = compressor.compress(b'{"a": 1}\n' * 100) + compressor.finish()
+    if encoding == 'zstd':
+        assert library.ZstdDecompressor().decompressobj().decompress(data) == b'{"a": 1}\n' * 100
+    else:
+        assert library.decompress(data) == b'{"a": 1}\n' * 100
@@ -0,0 +1,105 @@
+"""Remote downloads against a local HTTP server"""
+
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+BODY = b'%PDF-1.4\n' + bytes(range(256)) * 64
+
+class Handler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(dict(self.headers))
+        if self.path.startswith('/trickle'):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(BODY)))
+            self.end_headers()
+            for byte in BODY[:20]:
+                self.wfile.write(bytes([byte]))
+                self.wfile.flush()
+                time.sleep(0.5)
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = BODY
+        status = 200
+        byte_range = self.headers.get('Range')
+        if byte_range:
+            start, end = (int(value) for value in byte_range.split('=')[1].split('-'))
+            body = BODY[start:end + 1]
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.send_header('Accept-Ranges', 'bytes')
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(BODY)}')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    Handler.requests_seen = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_download_hashes_while_streaming(service, server, monkeypatch):
+    monkeypatch.setattr(service, 'hash_file', lambda *args: pytest.fail('download was read back to hash it'))
+    path, content_hash = service.download_pdf(f'{server}/streamed.pdf')
+    try:
+        assert content_hash == hashlib.sha256(BODY).hexdigest()
+        with open(path, 'rb') as f:
+            assert f.read() == BODY
+    finally:
+        service.remove_file(path)
+
+def test_not_modified_reuses_the_stored_file(service, server, monkeypatch):
+    url = f'{server}/revalidated.pdf?token=first'
+    service.remove_file(service.download_pdf(url)[0])
+    monkeypatch.setattr(service, 'hash_file', lambda *args: pytest.fail('stored file was rehashed'))
+
+    path, content_hash = service.download_pdf(f'{server}/revalidated.pdf?token=second')
+    try:
+        assert Handler.requests_seen[-1]['If-None-Match'] == '"v1"'
+        assert content_hash == hashlib.sha256(BODY).hexdigest()
+        with open(path, 'rb') as f:
+            assert f.read() == BODY
+    finally:
+        service.remove_file(path)
+
+def test_ranged_download(service, server, monkeypatch):
+    monkeypatch.setattr(service, 'DOWNLOAD_PARALLEL_MIN_BYTES', 1024)
+    path, content_hash = service.download_pdf(f'{server}/ranged.pdf', conditional=False)
+    try:
+        assert content_hash == hashlib.sha256(BODY).hexdigest()
+        assert sum('Range' in headers for headers in Handler.requests_seen) == service.DOWNLOAD_PARALLEL_PARTS
+    finally:
+        service.remove_file(path)
+
+def test_size_limit(service, server, monkeypatch):
+    monkeypatch.setattr(service, 'DOWNLOAD_MAX_BYTES', 1024)
+    with pytest.raises(service.DownloadError) as error:
+        service.download_pdf(f'{server}/large.pdf', conditional=False)
+    assert error.value.status == 413
+
+def test_deadline_aborts_a_trickling_body(service, server, monkeypatch):
+    monkeypatch.setattr(service, 'DOWNLOAD_DEADLINE_SECONDS', 1)
+    start = time.time()
+    with pytest.raises(service.DownloadError) as error:
+        service.download_pdf(f'{server}/trickle.pdf', conditional=False)
+    assert error.value.status == 504
+    assert time.time() - start < 3
@@ -0,0 +1,105 @@
+"""Convert once, export many: renderers and /documents/<result_id>/export"""
+
+import io
+import json
+
+import pytest
+
+MARKDOWN = """# Report
+
+Intro line one
+continues here.
+
+- first
+- second
+
+| name | value |
+|---|---|
+| a\\|b | 1 |
+
+```
+code block
+```"""
+
+def test_markdown_blocks(service):
+    assert service.markdown_blocks(MARKDOWN) == [
+        {'type': 'heading', 'level': 1, 'text': 'Report'},
+        {'type': 'paragraph', 'text': 'Intro line one continues here.'},
+        {'type': 'list_item', 'text': 'first'},
+        {'type': 'list_item', 'text': 'second'},
+        {'type': 'table', 'rows': [['name', 'value'], ['a|b', '1']]},
+        {'type': 'code', 'text': 'code block'},
+    ]
+
+def test_renderers(service):
+    pages = [{'page': 1, 'source': 'markdown', 'blocks': service.markdown_blocks(MARKDOWN)}]
+    assert service.render_text(pages).startswith('Report\n\nIntro line one continues here.\n\n- first')
+    assert service.render_outline(pages) == [{'level': 1, 'text': 'Report', 'page': 1}]
+    assert service.render_tables_csv(pages) == 'name,value\r\na|b,1\r\n'
+    body = service.render_html_body(pages)
+    assert '<section data-page="1">' in body
+    assert '<ul>\n<li>first</li>\n<li>second</li>\n</ul>' in body
+    assert '<tr><th>name</th><th>value</th></tr>' in body
+    with pytest.raises(service.InvalidOptionError):
+        service.render_tables_csv(pages, table=2)
+
+@pytest.fixture
+def result_id(client):
+    upload = client.post('/upload', data={'file': (io.BytesIO(MARKDOWN.encode('utf-8')), 'report.md')})
+    assert upload.status_code == 200
+    return upload.json['metadata']['result_id']
+
+@pytest.mark.parametrize('export_format,mimetype', [
+    ('markdown', 'text/markdown'),
+    ('text', 'text/plain'),
+    ('html', 'text/html'),
+    ('json', 'application/json'),
+    ('tables_csv', 'text/csv'),
+    ('outline', 'application/json'),
+])
+def test_export_formats(client, result_id, export_format, mimetype):
+    response = client.get(f'/documents/{result_id}/export?format={export_format}')
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+
+def test_export_json_and_single_table(client, result_id):
+    pages = client.get(f'/documents/{result_id}/export?format=json').json['pages']
+    assert pages[0]['source'] == 'markdown'
+    table = client.get(f'/documents/{result_id}/export?format=tables_csv&table=1')
+    assert table.get_data(as_text=True) == 'name,value\r\na|b,1\r\n'
+
+def test_html_title_follows_each_request(client, result_id):
+    first = client.get(f'/documents/{result_id}/export?format=html&filename=first_report.pdf')
+    second = client.get(f'/documents/{result_id}/export?format=html&filename=other-name.pdf')
+    assert '<title>First Report</title>' in first.get_data(as_text=True)
+    assert '<title>Other Name</title>' in second.get_data(as_text=True)
+
+def test_export_errors(client, result_id):
+    assert client.get(f'/documents/{result_id}/export?format=pdf').status_code == 400
+    assert client.get(f'/documents/{result_id}/export?format=text&table=1').status_code == 400
+    assert client.get(f'/documents/{"0" * 64}/export').status_code == 404
+    assert client.get('/documents/not-an-id/export').status_code == 400
+
+def test_docling_document_round_trip(service, tmp_path):
+    doc_module = pytest.importorskip('docling_core.types.doc')
+    document = doc_module.DoclingDocument(name='sample')
+    document.add_page(page_no=1, size=doc_module.Size(width=600, height=800))
+    provenance = doc_module.ProvenanceItem(page_no=1, bbox=doc_module.BoundingBox(l=0, t=0, r=1, b=1),
+                                           charspan=(0, 1))
+    document.add_title(text='Title', prov=provenance)
+    document.add_heading(text='Section', level=1, prov=provenance)
+    document.add_text(label=doc_module.DocItemLabel.TEXT, text='Body', prov=provenance)
+
+    cache = service.ExtractionCache(str(tmp_path), 10 * 1024 * 1024, 3600)
+    key = 'ab' * 32
+    # Docling page 1 was page 7 of the original document
+    cache.put_blob(key, 'docling', service.serialize_docling_documents([(document, {1: 7})]))
+    pages = service.build_export_pages(cache, key, {'content': '', 'page_spans': None, 'metadata': {}})
+
+    assert pages == [{'page': 7, 'source': 'docling', 'blocks': [
+        {'type': 'heading', 'level': 1, 'text': 'Title'},
+        {'type': 'heading', 'level': 2, 'text': 'Section'},
+        {'type': 'paragraph', 'text': 'Body'},
+    ]}]
+    assert json.loads(service.render_export(cache, key, {'content': ''}, 'outline', 'x'))['outline'][1] == {
+        'level': 2, 'text': 'Section', 'page': 7}
@@ -0,0 +1,56 @@
+"""Tiered fast path: page classification and mixed PyMuPDF/Docling conversions"""
+
+import pytest
+
+CLEAN_TEXT = 'A clean text layer with enough characters to count as real prose.'
+
+@pytest.fixture
+def mixed_pdf(service, tmp_path):
+    """Pages: clean text, a ruled form, a full-page picture, blank"""
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), CLEAN_TEXT)
+    form = doc.new_page()
+    form.insert_text((72, 72), 'A form page with lots of ruling lines drawn around its cells.')
+    for row in range(15):
+        form.draw_line((50, 100 + row * 20), (500, 100 + row * 20))
+    picture = doc.new_page()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 50, 50), False)
+    pixmap.clear_with(128)
+    picture.insert_image(picture.rect, pixmap=pixmap)
+    doc.new_page()
+    path = str(tmp_path / 'mixed.pdf')
+    doc.save(path)
+    doc.close()
+    return path
+
+def test_classify_page(service, mixed_pdf):
+    import fitz  # PyMuPDF
+    with fitz.open(mixed_pdf) as doc:
+        assert [service.classify_page(page) for page in doc] == [
+            ('pymupdf', 'clean_text_layer'), ('docling', 'table_like'),
+            ('docling', 'no_text_layer'), ('pymupdf', 'sparse_text')]
+
+def test_only_complex_pages_go_to_docling(service, mixed_pdf):
+    entry = service.convert_pdf(mixed_pdf)
+    metadata = entry['metadata']
+
+    assert metadata['fast_path_pages'] == 2
+    assert metadata['docling_pages'] == 2
+    assert [item['method'] for item in metadata['page_methods']] == ['pymupdf', 'docling', 'docling', 'pymupdf']
+    page_no, start, end = entry['page_spans'][0]
+    assert page_no == 1 and entry['content'][start:end] == CLEAN_TEXT
+
+def test_fast_path_can_be_disabled(service, mixed_pdf):
+    entry = service.convert_pdf(mixed_pdf, fast_path=False)
+    assert 'page_methods' not in entry['metadata']
+    assert entry['page_spans'] is None
+
+def test_fast_path_option_changes_the_cache_key(client, mixed_pdf):
+    with open(mixed_pdf, 'rb') as f:
+        data = f.read()
+    fast = client.post('/upload', data=data, content_type='application/pdf').get_json()
+    full = client.post('/upload?fast_path=false', data=data, content_type='application/pdf').get_json()
+    assert fast['metadata']['fast_path_pages'] == 2
+    assert full['metadata']['cached'] is False
+    assert 'fast_path_pages' not in full['metadata']
@@ -0,0 +1,115 @@
+"""Format detection and native (non-PDF) parsers"""
+
+import io
+
+import pytest
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data if isinstance(data, bytes) else data.encode('utf-8'))
+    return str(path)
+
+@pytest.fixture
+def docx_path(tmp_path):
+    docx = pytest.importorskip('docx')
+    document = docx.Document()
+    document.add_heading('Report', 0)
+    document.add_heading('Findings', 1)
+    document.add_paragraph('All clear.')
+    document.add_paragraph('first point', style='List Bullet')
+    table = document.add_table(rows=2, cols=2)
+    for (row, col), text in {(0, 0): 'name', (0, 1): 'a|b', (1, 0): 'x', (1, 1): '1'}.items():
+        table.cell(row, col).text = text
+    path = tmp_path / 'report.docx'
+    document.save(str(path))
+    return str(path)
+
+@pytest.fixture
+def pptx_path(tmp_path):
+    pptx = pytest.importorskip('pptx')
+    presentation = pptx.Presentation()
+    first = presentation.slides.add_slide(presentation.slide_layouts[1])
+    first.shapes.title.text = 'Intro'
+    first.placeholders[1].text = 'Hello slide'
+    second = presentation.slides.add_slide(presentation.slide_layouts[5])
+    second.shapes.title.text = 'Numbers'
+    path = tmp_path / 'deck.pptx'
+    presentation.save(str(path))
+    return str(path)
+
+def test_detect_format_by_signature(service, tmp_path, make_pdf, docx_path, pptx_path):
+    assert service.detect_format(make_pdf(['hello'])) == 'pdf'
+    assert service.detect_format(write(tmp_path, 'a.png', b'\x89PNG\r\n\x1a\n' + b'\x00' * 16)) == 'image'
+    assert service.detect_format(docx_path) == 'docx'
+    assert service.detect_format(pptx_path) == 'pptx'
+
+def test_detect_format_for_text(service, tmp_path):
+    assert service.detect_format(write(tmp_path, 'page', '<!DOCTYPE html><html></html>')) == 'html'
+    assert service.detect_format(write(tmp_path, 'rows.csv', 'a,b\n1,2\n'), 'rows.csv') == 'csv'
+    assert service.detect_format(write(tmp_path, 'notes.md', '# Notes\n'), 'notes.md') == 'markdown'
+    assert service.detect_format(write(tmp_path, 'plain', 'just words')) == 'text'
+
+@pytest.mark.parametrize('name,data', [
+    ('empty.pdf', b''),
+    ('login.pdf', '<html><body>Please sign in</body></html>'),
+    ('photo.png', 'not an image'),
+    ('blob.bin', b'\x01\x02\x00\x00'),
+    ('archive.zip', b'PK\x03\x04' + b'\x00' * 30),
+])
+def test_detect_format_rejects(service, tmp_path, name, data):
+    with pytest.raises(service.UnsupportedFormatError):
+        service.detect_format(write(tmp_path, name, data), name)
+
+def test_html_to_markdown(service, tmp_path):
+    path = write(tmp_path, 'p.html', '<html><head><style>x{}</style></head><body><h2>Title</h2>'
+                                     '<p>Some <b>bold</b>\n text</p><ul><li>one</li><li>two</li></ul>'
+                                     '<table><tr><th>k</th><th>v</th></tr><tr><td>a</td><td>1</td></tr></table>'
+                                     '<script>ignored()</script></body></html>')
+    assert service.html_to_markdown(path) == (
+        '## Title\n\nSome bold text\n\n- one\n- two\n\n| k | v |\n|---|---|\n| a | 1 |')
+
+def test_csv_to_markdown_sniffs_delimiter(service, tmp_path):
+    path = write(tmp_path, 'checks.csv', 'name;status\nAlice;clear\n')
+    assert service.csv_to_markdown(path) == '| name | status |\n|---|---|\n| Alice | clear |'
+
+def test_docx_to_markdown(service, docx_path):
+    assert service.docx_to_markdown(docx_path) == (
+        '# Report\n\n# Findings\n\nAll clear.\n\n- first point\n\n| name | a\\|b |\n|---|---|\n| x | 1 |')
+
+def test_pptx_fragments_one_per_slide(service, pptx_path):
+    fragments = list(service.pptx_fragments(pptx_path))
+    assert [fragment['page'] for fragment in fragments] == [1, 2]
+    assert fragments[0]['markdown'] == '## Intro\n\nHello slide'
+    assert fragments[1]['markdown'] == '## Numbers'
+
+def test_upload_native_format(client):
+    response = client.post('/upload', data={'file': (io.BytesIO(b'name,status\nBob,pending\n'), 'checks.csv')})
+    assert response.status_code == 200
+    assert response.json['metadata']['source_format'] == 'csv'
+    assert response.json['metadata']['parser'] == 'csv'
+    assert '| Bob | pending |' in response.json['content']
+
+def test_raw_upload_uses_content_type(client):
+    response = client.post('/upload', data=b'# Heading\n', content_type='text/markdown')
+    assert response.status_code == 200
+    assert response.json['metadata']['source_format'] == 'markdown'
+
+@pytest.mark.parametrize('name,data', [('empty.pdf', b''), ('login.pdf', b'<html><body>Please sign in</body></html>')])
+def test_upload_rejects_mismatched_content(client, name, data):
+    response = client.post('/upload', data={'file': (io.BytesIO(data), name)})
+    assert response.status_code == 400
+    assert response.json['success'] is False
+
+def test_extract_url_name_declares_format(client, tmp_path):
+    path = write(tmp_path, 'report.pdf', '<html><body>Please sign in</body></html>')
+    assert client.post('/extract', json={'pdf_url': path}).status_code == 400
+
+def test_pptx_pages_can_be_sliced(client, pptx_path):
+    response = client.post('/extract', json={'pdf_url': pptx_path, 'content_pages': '2'})
+    assert response.status_code == 200
+    assert response.json['content'] == '## Numbers'
+
+def test_pages_option_needs_pdf(client, tmp_path):
+    path = write(tmp_path, 'notes.md', '# Notes\n')
+    response = client.post('/extract', json={'pdf_url': path, 'pages': '1'})
+    assert response.status_code == 400
@@ -0,0 +1,73 @@
+"""Liveness, readiness and background warm-up"""
+
+import os
+
+from conftest import REPO_DIR
+
+def test_liveness(client):
+    assert client.get('/healthz').get_json() == {'ok': True}
+
+def test_ready_when_warm_up_is_disabled(client):
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.get_json()['state'] == 'lazy'
+
+def test_readiness_follows_the_warm_up(service, client, monkeypatch):
+    monkeypatch.setattr(service, '_readiness', dict(service._readiness))
+    service.set_readiness('warming')
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(service.READY_RETRY_AFTER_SECONDS)
+    assert client.get('/health').get_json()['docling_available'] is False
+
+    service.warm_up_converter()  # Simulated converter
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.get_json()['warmup_seconds'] is not None
+
+def test_failed_warm_up_is_not_retried_by_probes(service, client, monkeypatch):
+    monkeypatch.setattr(service, '_readiness', dict(service._readiness))
+
+    def broken_converter():
+        raise RuntimeError('models unavailable')
+
+    monkeypatch.setattr(service, 'get_converter', broken_converter)
+    monkeypatch.setattr(service, 'WARMUP_ATTEMPTS', 1)
+    service.warm_up_converter()
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert 'Retry-After' not in response.headers
+    assert response.get_json()['error'] == 'models unavailable'
+    assert client.get('/health').get_json()['status'] == 'healthy'
+
+def test_failed_warm_up_is_retried(service, client, monkeypatch):
+    monkeypatch.setattr(service, '_readiness', dict(service._readiness))
+    monkeypatch.setattr(service, 'WARMUP_ATTEMPTS', 2)
+    monkeypatch.setattr(service, 'WARMUP_RETRY_SECONDS', 0)
+    get_converter = service.get_converter
+    responses = []
+
+    def flaky_converter():
+        if not responses:
+            responses.append(client.get('/ready'))
+            raise RuntimeError('download interrupted')
+        return get_converter()
+
+    monkeypatch.setattr(service, 'get_converter', flaky_converter)
+    service.warm_up_converter()
+
+    assert responses[0].status_code == 503
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.get_json()['attempts'] == 2
+
+def test_retrying_warm_up_sends_retry_after(service, client, monkeypatch):
+    monkeypatch.setattr(service, '_readiness', dict(service._readiness))
+    service.set_readiness('failed', error='models unavailable', retrying=True)
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(service.READY_RETRY_AFTER_SECONDS)
+
+def test_platform_health_check_is_liveness():
+    with open(os.path.join(REPO_DIR, 'render.yaml')) as f:
+        assert 'healthCheckPath: /healthz' in f.read()
@@ -0,0 +1,77 @@
+"""Durable job queue and the /jobs API"""
+
+import importlib.util
+import os
+import sqlite3
+
+from conftest import REPO_DIR
+
+def test_queue_lifecycle(service, tmp_path):
+    queue = service.JobQueue(str(tmp_path / 'jobs.db'))
+    job_id = queue.enqueue('extract', {'pdf_url': 'x.pdf'})
+
+    job = queue.claim()
+    assert job['id'] == job_id and job['attempts'] == 1
+    assert queue.claim() is None  # Leased to the first claimer
+
+    queue.finish(job_id, result={'success': True, 'content': 'text'})
+    stored = queue.get(job_id)
+    assert stored['status'] == 'succeeded'
+    assert stored['result'] == {'success': True, 'content': 'text'}
+
+def test_expired_lease_is_claimed_again(service, tmp_path, monkeypatch):
+    queue = service.JobQueue(str(tmp_path / 'jobs.db'))
+    job_id = queue.enqueue('extract', {'pdf_url': 'x.pdf'})
+    monkeypatch.setattr(service, 'JOB_LEASE_SECONDS', -1)  # The claimer "dies" immediately
+    queue.claim()
+
+    job = queue.claim()
+    assert job['id'] == job_id and job['attempts'] == 2
+
+def test_job_runs_to_completion(service, client, make_pdf):
+    response = client.post('/jobs', json={'pdf_url': make_pdf(['job text page']), 'filename': 'job.pdf'})
+    assert response.status_code == 202
+
+    queue = service.get_job_queue()
+    service.run_job(queue, queue.claim())
+
+    status = client.get(response.json['status_url']).json
+    assert status['status'] == 'succeeded'
+    assert 'job text page' in status['result']['content']
+
+def test_job_result_serves_content_pages(service, client, make_pdf):
+    pdf_path = make_pdf(['first job page', 'second job page'], name='pages.pdf')
+    response = client.post('/jobs', json={'pdf_url': pdf_path, 'filename': 'pages.pdf'})
+    queue = service.get_job_queue()
+    service.run_job(queue, queue.claim())
+
+    status = client.get(response.json['status_url'] + '?content_pages=2')
+    assert status.status_code == 200
+    result = status.json['result']
+    assert 'second job page' in result['content']
+    assert 'first job page' not in result['content']
+    assert 'page_spans' not in status.json
+
+def test_queue_adds_the_page_spans_column(service, tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, '
+                     'status TEXT NOT NULL, stage TEXT, progress REAL NOT NULL DEFAULT 0, result TEXT, '
+                     'error TEXT, attempts INTEGER NOT NULL DEFAULT 0, lease_expires_at REAL, '
+                     'created_at REAL NOT NULL, updated_at REAL NOT NULL)')
+    queue = service.JobQueue(path)
+    job_id = queue.enqueue('extract', {'pdf_url': 'x.pdf'})
+    queue.finish(job_id, result={'success': True, 'content': 'text'}, page_spans=[[1, 0, 4]])
+    assert queue.get(job_id)['page_spans'] == [[1, 0, 4]]
+
+def test_post_worker_init_starts_job_workers(service, monkeypatch):
+    started = []
+    monkeypatch.setattr(service, 'ensure_job_workers', lambda: started.append('jobs'))
+    monkeypatch.setattr(service, 'ensure_warmup', lambda: started.append('warmup'))
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', os.path.join(REPO_DIR, 'gunicorn.conf.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+
+    config.post_worker_init(worker=None)
+
+    assert sorted(started) == ['jobs', 'warmup']
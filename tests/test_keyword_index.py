@@ -0,0 +1,99 @@
+"""Keyword index: postings codec, BM25 scoring and segment merging"""
+
+import math
+import os
+
+import pytest
+
+@pytest.fixture
+def index(service, tmp_path):
+    return service.KeywordIndex(service.VectorIndex(str(tmp_path), 'test', 4))
+
+def add_documents(index, documents):
+    row = 0
+    for number, texts in enumerate(documents):
+        index.add_document(f'doc-{number}', row, texts)
+        row += len(texts)
+
+def segment_files(index):
+    return sorted(name for name in os.listdir(index.directory) if name.endswith('.post'))
+
+def test_postings_round_trip(service):
+    postings = [(0, 1), (5, 3), (127, 1), (128, 200), (300000, 1), (2 ** 35, 7)]
+    assert service.decode_postings(service.encode_postings(postings)) == postings
+    assert service.decode_postings(service.encode_postings([])) == []
+
+def test_varint_lengths(service):
+    for value, length in ((0, 1), (127, 1), (128, 2), (16383, 2), (16384, 3)):
+        out = bytearray()
+        service.encode_varint(value, out)
+        assert len(out) == length
+
+def test_bm25_matches_the_formula(service, index):
+    texts = ['invoice total due', 'invoice invoice paid', 'shipping address only']
+    add_documents(index, [texts])
+
+    results, count = index.search('invoice', k=10)
+
+    assert count == 3
+    lengths = [len(service.keyword_terms(text)) for text in texts]
+    average = sum(lengths) / 3
+    idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+
+    def bm25(tf, length):
+        norm = service.BM25_K1 * (1 - service.BM25_B + service.BM25_B * length / average)
+        return idf * tf * (service.BM25_K1 + 1) / (tf + norm)
+
+    assert [row for _, row in results] == [1, 0]
+    assert results[0][0] == pytest.approx(bm25(2, lengths[1]))
+    assert results[1][0] == pytest.approx(bm25(1, lengths[0]))
+
+def test_lengths_are_mapped_once_per_append(index):
+    add_documents(index, [['alpha beta']])
+    index.search('alpha')
+    lengths = index._lengths
+    index.search('beta')
+    assert index._lengths is lengths  # No re-read between appends
+
+    index.add_document('doc-1', 1, ['alpha gamma delta'])
+    results, count = index.search('alpha')
+    assert count == 2 and len(index._lengths) == 2
+    assert [row for _, row in results] == [0, 1]  # The shorter chunk ranks first
+
+def test_search_within_a_document(index):
+    add_documents(index, [['alpha beta'], ['alpha gamma']])
+    results, _ = index.search('alpha', document_id='doc-1')
+    assert [row for _, row in results] == [1]
+    assert index.search('alpha', document_id='missing')[0] == []
+
+def test_merges_keep_results_and_delete_replaced_segments(service, index):
+    documents = [[f'common term{number}', f'common filler {number}'] for number in range(30)]
+    add_documents(index, documents)
+
+    meta = index.read_meta()
+    assert len(meta['segments']) <= service.KEYWORD_MAX_SEGMENTS
+    assert segment_files(index) == [f'kw-{number:06d}.post' for number in sorted(meta['segments'])]
+    results, count = index.search('common', k=100)
+    assert count == 60
+    assert sorted(row for _, row in results) == list(range(60))
+    assert [row for _, row in index.search('term17')[0]] == [34]
+
+def test_merges_leave_large_segments_alone(service, index, monkeypatch):
+    add_documents(index, [[f'bulk words {number}' for number in range(2000)]])
+    big_segment = index.read_meta()['segments'][0]
+    merged = []
+    merge = index._merge
+
+    def recording_merge(meta):
+        replaced = merge(meta)
+        merged.extend(replaced)
+        return replaced
+
+    monkeypatch.setattr(index, '_merge', recording_merge)
+
+    for number in range(40):
+        index.add_document(f'small-{number}', 2000 + number, [f'small {number}'])
+
+    assert merged
+    assert big_segment not in merged
+    assert big_segment in index.read_meta()['segments']
@@ -0,0 +1,23 @@
+"""Load generator helpers: request mix and latency summaries"""
+
+import pytest
+
+from loadtest_docling import latency_summary, parse_mix, percentile
+
+@pytest.mark.parametrize('count,fraction,expected', [
+    (10, 0.50, 5),
+    (10, 0.95, 10),
+    (100, 0.95, 95),
+    (100, 0.99, 99),
+    (1, 0.50, 1),
+    (3, 0.50, 2),
+])
+def test_percentile_is_nearest_rank(count, fraction, expected):
+    assert percentile(list(range(1, count + 1)), fraction) == expected
+
+def test_percentile_of_nothing():
+    assert percentile([], 0.5) is None
+    assert latency_summary([])['p50'] is None
+
+def test_parse_mix():
+    assert parse_mix('upload=6,health') == {'upload': 6.0, 'health': 1.0}
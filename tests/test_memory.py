@@ -0,0 +1,26 @@
+"""Model preloading and the /memory report"""
+
+import gc
+
+import pytest
+
+pytest.importorskip('psutil')
+
+def test_preload_records_its_cost(service, monkeypatch):
+    monkeypatch.setattr(service, '_preload_stats', None)
+    try:
+        service.preload_models()
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+    stats = service._preload_stats
+    assert stats['seconds'] >= 0
+    assert isinstance(stats['models_rss_mb'], int)
+
+def test_memory_report(client, service, monkeypatch):
+    monkeypatch.setattr(service, '_preload_stats', None)
+    body = client.get('/memory').get_json()
+    assert body['worker']['rss_mb'] > 0
+    assert body['worker']['uss_mb'] <= body['worker']['rss_mb']
+    assert body['preloaded'] is False
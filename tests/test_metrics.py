@@ -0,0 +1,51 @@
+"""Prometheus metrics: histogram/counter rendering and the /metrics endpoint"""
+
+def test_histogram_is_cumulative(service):
+    histogram = service.Histogram('test_seconds', 'Test latency', ['endpoint'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, endpoint='a')
+
+    text = service.render_metrics([histogram])
+
+    assert '# TYPE test_seconds histogram' in text
+    assert 'test_seconds_bucket{endpoint="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{endpoint="a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{endpoint="a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{endpoint="a"} 3' in text
+    assert 'test_seconds_sum{endpoint="a"} 5.55' in text
+
+def test_label_values_are_escaped(service):
+    counter = service.Counter('test_total', 'Test counter', ['outcome'])
+    counter.inc(outcome='say "hi"\\')
+    assert 'test_total{outcome="say \\"hi\\"\\\\"} 1' in service.render_metrics([counter])
+
+def test_failing_gauge_is_skipped(service):
+    def broken():
+        raise OSError('unreadable')
+
+    text = service.render_metrics([service.Gauge('test_gauge', 'Broken', broken),
+                                   service.Gauge('test_ok', 'Fine', lambda: 2)])
+    assert 'test_gauge' not in text
+    assert 'test_ok 2' in text
+
+def test_metrics_endpoint_counts_extractions(client, make_pdf):
+    client.post('/extract', json={'pdf_url': make_pdf(['metrics text'], name='metrics.pdf')})
+    response = client.get('/metrics')
+
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'docling_extractions_total{source="docling_simple",outcome="success"}' in text
+    assert 'docling_request_seconds_count{endpoint="extract_pdf_content"}' in text
+
+def test_stage_histograms_and_rejections_are_labelled(service, client, make_pdf):
+    client.post('/extract', json={'pdf_url': make_pdf(['staged'], name='stage.pdf'), 'fast_path': False})
+    controller = service.AdmissionController(budget_mb=10, max_waiting=0)
+    try:
+        controller.precheck(100)
+    except service.AdmissionRejected:
+        pass
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'docling_convert_seconds_count{endpoint="extract_pdf_content"}' in text
+    assert '# TYPE docling_admission_rejected_total counter' in text
+    assert 'docling_admission_rejected_total{status="413"}' in text
@@ -0,0 +1,62 @@
+"""Page selection: spec parsing, resolution against the page count and partial extraction"""
+
+import pytest
+
+def test_parse_page_spec(service):
+    assert service.parse_page_spec('1-3,5,8-') == [(1, 3), (5, 5), (8, None)]
+    assert service.parse_page_spec([1, 2, '4-6']) == [(1, 1), (2, 2), (4, 6)]
+    assert service.parse_page_spec(' -2 , ') == [(1, 2)]
+
+@pytest.mark.parametrize('spec', ['0', '3-1', 'a', '1-x', '', ','])
+def test_parse_page_spec_rejects(service, spec):
+    with pytest.raises(service.PageSelectionError):
+        service.parse_page_spec(spec)
+
+def test_resolve_pages(service):
+    assert service.resolve_pages({}, 10) is None
+    assert service.resolve_pages({'pages': '2-4,3,9-'}, 10) == [2, 3, 4, 9, 10]
+    assert service.resolve_pages({'pages': '1-20'}, 3) is None  # Clamped to every page
+    assert service.resolve_pages({'max_pages': 2}, 10) == [1, 2]
+    assert service.resolve_pages({'max_pages': 20}, 10) is None
+    assert service.resolve_pages({'pages': '5-', 'max_pages': 2}, 10) == [5, 6]
+    assert service.resolve_pages({'max_pages': 3}, None) == [1, 2, 3]
+
+def test_resolve_pages_errors(service):
+    with pytest.raises(service.PageSelectionError):
+        service.resolve_pages({'pages': '5-'}, 3)
+    with pytest.raises(service.PageSelectionError):
+        service.resolve_pages({'pages': '2-'}, None)
+
+def test_read_extraction_options_validates_pages(service):
+    assert service.read_extraction_options({'pages': [1, '3-4'], 'max_pages': '2'}) == {
+        'pages': '1,3-4', 'max_pages': 2}
+    assert service.read_extraction_options({'pages': 3}) == {'pages': '3'}
+    for pages in ({'from': 1}, 2.5, True, [[1]]):
+        with pytest.raises(service.PageSelectionError):
+            service.read_extraction_options({'pages': pages})
+    with pytest.raises(service.PageSelectionError):
+        service.read_extraction_options({'max_pages': 0})
+
+def test_partial_upload(client, make_pdf):
+    with open(make_pdf(['one page', 'two page', 'three page'], name='three.pdf'), 'rb') as f:
+        data = f.read()
+
+    response = client.post('/upload?pages=2-&max_pages=1', data=data, content_type='application/pdf')
+    body = response.get_json()
+    assert body['content'] == 'two page'
+    assert body['metadata']['pages'] == [2]
+    assert body['metadata']['partial'] is True
+    assert body['metadata']['total_pages'] == 3
+
+    response = client.post('/upload?pages=5-', data=data, content_type='application/pdf')
+    assert response.status_code == 400
+
+def test_scalar_and_malformed_pages_in_json(client, make_pdf):
+    pdf_path = make_pdf(['one page', 'two page', 'three page'], name='three.pdf')
+    response = client.post('/extract', json={'pdf_url': pdf_path, 'pages': 3})
+    assert response.get_json()['metadata']['pages'] == [3]
+    assert client.post('/extract', json={'pdf_url': pdf_path, 'pages': {'from': 1}}).status_code == 400
+
+    results = client.post('/batch_extract', json={'pdfs': [
+        {'pdf_url': pdf_path, 'pages': 2}, {'pdf_url': pdf_path, 'pages': {'from': 1}}]}).get_json()['results']
+    assert [result['success'] for result in results] == [True, False]
@@ -0,0 +1,60 @@
+"""Per-request profiling mode"""
+
+import pstats
+
+def test_profile_summary(client, make_pdf):
+    response = client.post('/extract', json={'pdf_url': make_pdf(['profiled text'], name='profiled.pdf'),
+                                             'profile': True})
+    profile = response.get_json()['metadata']['profile']
+
+    assert 'classify' in profile['stages']
+    assert profile['top_functions']
+    assert profile['cpu_seconds'] >= 0
+    assert 'artifact_url' not in profile
+
+def test_full_profile_is_downloadable(client, make_pdf, tmp_path):
+    response = client.post('/extract', json={'pdf_url': make_pdf(['stored profile'], name='stored.pdf')},
+                           headers={'X-Profile': 'full'})
+    artifact_url = response.get_json()['metadata']['profile']['artifact_url']
+
+    artifact = client.get(artifact_url)
+    assert artifact.status_code == 200
+    path = tmp_path / 'request.prof'
+    path.write_bytes(artifact.data)
+    assert pstats.Stats(str(path)).total_calls > 0
+
+def test_profile_errors(client, make_pdf):
+    assert client.get('/profiles/not-an-id').status_code == 400
+    assert client.get('/profiles/' + '0' * 32).status_code == 404
+    response = client.post('/extract', json={'pdf_url': make_pdf(['x']), 'profile': 'sometimes'})
+    assert response.status_code == 400
+
+def test_only_threads_started_by_the_request_are_profiled(service):
+    import threading
+
+    def work():
+        sum(range(1000))
+
+    def start_and_join(target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+    outside_ready, outside_go = threading.Event(), threading.Event()
+
+    def outside():
+        outside_ready.set()
+        outside_go.wait()
+        start_and_join(work)  # Another request's thread: not profiled
+
+    other = threading.Thread(target=outside)
+    other.start()
+    outside_ready.wait()
+    with service.RequestProfiler() as profiler:
+        start_and_join(lambda: start_and_join(work))  # A child and a grandchild
+        outside_go.set()
+        other.join()
+    report = profiler.report()
+
+    assert report['profiled_threads'] == 3
+    assert threading.Thread.start is profiler._thread_start
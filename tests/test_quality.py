@@ -0,0 +1,62 @@
+"""Quality tiers: pipeline options, the converter cache and per-tier results"""
+
+from collections import OrderedDict
+
+import pytest
+
+def test_presets_map_to_pipeline_options(service, monkeypatch):
+    pipeline_options = pytest.importorskip('docling.datamodel.pipeline_options')
+    fast = service.build_pdf_pipeline_options('fast')
+    full = service.build_pdf_pipeline_options('full')
+    assert not fast.do_ocr and not fast.do_table_structure
+    assert full.do_ocr and full.do_table_structure
+    assert full.table_structure_options.mode.value == 'accurate'
+
+    # The default tier is the stock pipeline: no picture images unless asked for
+    stock = pipeline_options.PdfPipelineOptions()
+    assert full.generate_picture_images is stock.generate_picture_images is False
+    assert full.images_scale == stock.images_scale
+    monkeypatch.setattr(service, 'PICTURE_IMAGES', True)
+    assert service.build_pdf_pipeline_options('full').images_scale == 2.0
+    assert not service.build_pdf_pipeline_options('balanced').generate_picture_images
+
+def test_other_tiers_share_a_bounded_cache(service, monkeypatch):
+    created = []
+
+    def create_docling_converter(quality):
+        created.append(quality)
+        return object()
+
+    default_converter = object()
+    monkeypatch.setattr(service, 'SIMULATE_CONVERTER', False)
+    monkeypatch.setattr(service, 'DEFAULT_QUALITY', 'full')
+    monkeypatch.setattr(service, 'CONVERTER_CACHE_SIZE', 2)
+    monkeypatch.setattr(service, 'create_docling_converter', create_docling_converter)
+    monkeypatch.setattr(service, '_converter', default_converter)
+    monkeypatch.setattr(service, '_quality_converters', OrderedDict())
+
+    assert service.get_converter() is default_converter
+    fast = service.get_converter('fast')
+    assert service.get_converter('fast') is fast
+    service.get_converter('balanced')  # Drops the fast converter
+    assert service.get_converter('fast') is not fast
+    assert created == ['fast', 'balanced', 'fast']
+    assert service.get_converter('full') is default_converter
+
+def test_quality_is_validated_and_part_of_the_cache_key(service, client, make_pdf):
+    for quality in ('ultra', ['fast'], 1):
+        with pytest.raises(service.InvalidOptionError):
+            service.read_extraction_options({'quality': quality})
+
+    pdf_path = make_pdf([None], name='scan.pdf')  # Blank: goes to the (simulated) converter
+    fast = client.post('/extract', json={'pdf_url': pdf_path, 'quality': 'fast'}).get_json()
+    full = client.post('/extract', json={'pdf_url': pdf_path, 'quality': 'full'}).get_json()
+    assert fast['metadata']['quality'] == 'fast'
+    assert full['metadata']['quality'] == 'full'
+    assert full['metadata']['cached'] is False
+    assert client.post('/extract', json={'pdf_url': pdf_path, 'quality': ['fast']}).status_code == 400
+
+def test_lighter_tiers_cost_less_memory(service, make_pdf):
+    pdf_path = make_pdf([None, None])
+    assert service.estimate_extraction_mb(pdf_path, quality='fast') < \
+        service.estimate_extraction_mb(pdf_path, quality='full')
@@ -0,0 +1,52 @@
+"""Field selection, content paging and /results/<result_id>"""
+
+import pytest
+
+def body():
+    return {'success': True, 'title': 'Doc', 'content': 'abcdefghij',
+            'metadata': {'word_count': 1, 'pages': [1, 2]}}
+
+def test_read_response_shape(service):
+    assert service.read_response_shape({}) is None
+    assert service.read_response_shape({'fields': 'title, metadata.word_count', 'content_limit': '4'}) == {
+        'fields': ['title', 'metadata.word_count'], 'content_limit': 4}
+    for values in ({'content_limit': 0}, {'content_offset': 'x'}, {'fields': 5},
+                   {'content_pages': '1', 'content_offset': 2}):
+        with pytest.raises(service.InvalidOptionError):
+            service.read_response_shape(values)
+
+def test_select_fields(service):
+    assert service.select_fields(body(), ['title', 'metadata.word_count', 'metadata.missing', 'nope.x']) == {
+        'success': True, 'title': 'Doc', 'metadata': {'word_count': 1}}
+
+def test_content_slices(service):
+    shaped = service.shape_extraction_response(body(), {'content_offset': 8, 'content_limit': 5})
+    assert shaped['content'] == 'ij'
+    assert shaped['content_range'] == {'offset': 8, 'length': 2, 'total': 10, 'next_offset': None}
+
+    shaped = service.shape_extraction_response(body(), {'content_limit': 4, 'fields': ['title']})
+    assert shaped == {'success': True, 'title': 'Doc',
+                      'content_range': {'offset': 0, 'length': 4, 'total': 10, 'next_offset': 4}}
+
+def test_content_pages(service):
+    spans = [[1, 0, 3], [2, 5, 7], [3, 8, 10]]
+    shaped = service.shape_extraction_response(body(), {'content_pages': [(2, None)]}, spans)
+    assert shaped['content'] == 'fg\n\nij'
+    assert shaped['content_range']['pages'] == [2, 3]
+    with pytest.raises(service.InvalidOptionError):
+        service.shape_extraction_response(body(), {'content_pages': [(1, 1)]})
+
+def test_results_endpoint_pages_through_a_cached_result(client, make_pdf):
+    pdf_path = make_pdf(['first result page', 'second result page'], name='result.pdf')
+    first = client.post('/extract', json={'pdf_url': pdf_path, 'content_limit': 10,
+                                          'fields': 'metadata.result_id'}).get_json()
+    assert set(first) == {'success', 'metadata', 'content_range'}
+    result_id = first['metadata']['result_id']
+
+    rest = client.get(f"/results/{result_id}?content_offset={first['content_range']['next_offset']}")
+    assert rest.status_code == 200
+    assert rest.get_json()['content'].endswith('second result page')
+
+    page = client.get(f'/results/{result_id}?content_pages=2').get_json()
+    assert page['content'] == 'second result page'
+    assert client.get('/results/' + '0' * 64).status_code == 404
@@ -0,0 +1,167 @@
+"""Single-flight coalescing of identical conversions"""
+
+import os
+import threading
+import time
+
+KEY = '0' * 64
+OTHER_KEY = '00000400' + '0' * 56  # Shared a lock stripe with KEY
+
+def entry(text):
+    return {'content': text, 'metadata': {'word_count': 1}}
+
+def test_threads_share_the_leaders_entry(service, tmp_path):
+    flights = service.SingleFlight(str(tmp_path), wait_seconds=5)
+    results = []
+
+    def follow():
+        with flights.join(KEY, lambda: None) as flight:
+            results.append(flight.entry)
+
+    with flights.join(KEY, lambda: None) as flight:
+        assert flight.entry is None
+        follower = threading.Thread(target=follow)
+        follower.start()
+        time.sleep(0.2)
+        flight.entry = entry('converted')
+    follower.join(5)
+
+    assert results[0]['content'] == 'converted'
+    assert results[0]['metadata']['coalesced'] is True
+    assert 'coalesced' not in flight.entry['metadata']
+
+def test_workers_wait_on_the_per_key_lock_file(service, tmp_path):
+    # Two coordinators sharing a directory stand in for two gunicorn workers
+    leader, follower = (service.SingleFlight(str(tmp_path), wait_seconds=5) for _ in range(2))
+    cache = {}
+    results = []
+
+    def follow():
+        with follower.join(KEY, lambda: cache.get(KEY)) as flight:
+            results.append(flight.entry)
+
+    with leader.join(KEY, lambda: cache.get(KEY)) as flight:
+        assert os.path.exists(tmp_path / f'{KEY}.lock')
+        thread = threading.Thread(target=follow)
+        thread.start()
+        time.sleep(0.3)
+        assert not results
+        cache[KEY] = flight.entry = entry('converted')
+    thread.join(5)
+
+    assert results[0]['metadata']['coalesced'] is True
+    assert not os.path.exists(tmp_path / f'{KEY}.lock')
+
+def test_unrelated_keys_do_not_wait(service, tmp_path):
+    first, second = (service.SingleFlight(str(tmp_path), wait_seconds=5) for _ in range(2))
+    with first.join(KEY, lambda: None):
+        start = time.time()
+        with second.join(OTHER_KEY, lambda: None) as flight:
+            assert flight.entry is None
+        assert time.time() - start < 1
+
+def test_follower_converts_when_the_leader_fails(service, tmp_path):
+    leader, follower = (service.SingleFlight(str(tmp_path), wait_seconds=5) for _ in range(2))
+    results = []
+
+    def follow():
+        with follower.join(KEY, lambda: None) as flight:
+            results.append(flight.entry)
+
+    with leader.join(KEY, lambda: None):
+        thread = threading.Thread(target=follow)
+        thread.start()
+        time.sleep(0.3)
+    thread.join(5)
+
+    assert results == [None]
+
+def test_concurrent_requests_convert_once(service, make_pdf, monkeypatch):
+    pdf_path = make_pdf([None, None], name='scan.pdf')
+    content_hash = service.hash_file(pdf_path)
+    conversions = []
+    convert_pdf = service.convert_pdf
+
+    def slow_convert(*args, **kwargs):
+        conversions.append(args)
+        time.sleep(0.5)
+        return convert_pdf(*args, **kwargs)
+
+    monkeypatch.setattr(service, 'convert_pdf', slow_convert)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        service.extract_with_cache(pdf_path, content_hash, {}, filename='scan.pdf'))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(conversions) == 1
+    assert sorted(bool(entry['metadata'].get('coalesced')) for entry, _ in results) == [False, True, True]
+    assert all(cache_hit is False for _, cache_hit in results)
+
+def test_follower_gets_busy_while_the_leader_converts(service, tmp_path):
+    in_process = service.SingleFlight(str(tmp_path), wait_seconds=0.2)
+    other_worker = service.SingleFlight(str(tmp_path), wait_seconds=5)
+    with in_process.join(KEY, lambda: None):
+        errors = []
+
+        def follow(flights, **kwargs):
+            start = time.time()
+            try:
+                with flights.join(KEY, lambda: None, **kwargs):
+                    pass
+            except service.FlightBusy as e:
+                errors.append((e.status, e.retry_after, time.time() - start))
+
+        threads = [threading.Thread(target=follow, args=(in_process,)),
+                   # The request's own deadline is shorter than the configured wait
+                   threading.Thread(target=follow, args=(other_worker,), kwargs={'deadline': time.time() + 0.3})]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+    assert len(errors) == 2
+    assert all(status == 503 and retry_after for status, retry_after, _ in errors)
+    assert all(waited < 2 for _, _, waited in errors)
+
+def test_background_followers_wait_for_the_leader(service, tmp_path):
+    flights = service.SingleFlight(str(tmp_path), wait_seconds=0.1)
+    results = []
+
+    def follow():
+        with flights.join(KEY, lambda: None, background=True) as flight:
+            results.append(flight.entry)
+
+    with flights.join(KEY, lambda: None) as flight:
+        thread = threading.Thread(target=follow)
+        thread.start()
+        time.sleep(0.4)
+        flight.entry = entry('converted')
+    thread.join(5)
+
+    assert results[0]['content'] == 'converted'
+
+def test_busy_request_gets_503(service, client, make_pdf, monkeypatch, tmp_path):
+    pdf_path = make_pdf([None, None, None], name='busy.pdf')
+    convert_pdf = service.convert_pdf
+    started = threading.Event()
+
+    def slow_convert(*args, **kwargs):
+        started.set()
+        time.sleep(1)
+        return convert_pdf(*args, **kwargs)
+
+    monkeypatch.setattr(service, 'convert_pdf', slow_convert)
+    monkeypatch.setattr(service, '_single_flight', service.SingleFlight(str(tmp_path), wait_seconds=0.2))
+    leader = threading.Thread(target=service.extract_with_cache,
+                              args=(pdf_path, service.hash_file(pdf_path), {}), kwargs={'filename': 'busy.pdf'})
+    leader.start()
+    started.wait(5)
+
+    response = client.post('/extract', json={'pdf_url': pdf_path})
+    leader.join(5)
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
@@ -0,0 +1,22 @@
+"""Cold start: heavy modules stay unloaded until a request needs them"""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import REPO_DIR
+
+def test_import_defers_heavy_modules(tmp_path):
+    script = ('import json, sys, docling_service; '
+              'print(json.dumps([name for name in docling_service.HEAVY_MODULES if name in sys.modules]))')
+    env = dict(os.environ, DOCLING_DATA_DIR=str(tmp_path), DOCLING_WARMUP='false', DOCLING_JOB_WORKERS='0')
+    output = subprocess.run([sys.executable, '-c', script], cwd=REPO_DIR, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    assert json.loads(output.splitlines()[-1]) == []
+
+def test_startup_report(client):
+    report = client.get('/startup').get_json()
+    assert report['pid'] == os.getpid()
+    assert report['module_import_seconds'] > 0
+    assert isinstance(report['heavy_modules_loaded'], list)
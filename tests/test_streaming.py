@@ -0,0 +1,41 @@
+"""Per-page streaming responses (NDJSON and Server-Sent Events)"""
+
+import json
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_ndjson_stream(client, make_pdf):
+    pdf_path = make_pdf(['first streamed page', None, 'third streamed page'], name='streamed.pdf')
+    response = client.post('/extract', json={'pdf_url': pdf_path, 'stream': 'ndjson'})
+
+    assert response.mimetype == 'application/x-ndjson'
+    records = read_ndjson(response)
+    pages = [record for record in records if record['type'] == 'page']
+    assert sorted(record['page'] for record in pages) == [1, 2, 3]
+    summary = records[-1]
+    assert summary['type'] == 'summary'
+    assert 'content' not in summary
+    assert summary['metadata']['cached'] is False
+    assert summary['metadata']['timings']['first_fragment_seconds'] is not None
+
+    # The second request replays the cached result (blank pages left no fragment to keep)
+    replayed = read_ndjson(client.post('/extract', json={'pdf_url': pdf_path, 'stream': 'ndjson'}))
+    assert replayed[-1]['metadata']['cached'] is True
+    assert [record['markdown'] for record in replayed[:-1]] == \
+        [record['markdown'] for record in sorted(pages, key=lambda record: record['page']) if record['markdown']]
+
+def test_sse_stream_from_the_accept_header(client, make_pdf):
+    with open(make_pdf(['event stream page'], name='events.pdf'), 'rb') as f:
+        data = f.read()
+    response = client.post('/upload', data=data, content_type='application/pdf',
+                           headers={'Accept': 'text/event-stream'})
+
+    assert response.mimetype == 'text/event-stream'
+    events = [block.split('\n') for block in response.get_data(as_text=True).strip().split('\n\n')]
+    assert [lines[0] for lines in events] == ['event: page', 'event: summary']
+    assert json.loads(events[0][1][len('data: '):])['markdown'] == 'event stream page'
+
+def test_streaming_rejects_response_shaping(client, make_pdf):
+    response = client.post('/extract', json={'pdf_url': make_pdf(['x']), 'stream': 'ndjson', 'chunk': True})
+    assert response.status_code == 400
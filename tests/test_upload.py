@@ -0,0 +1,44 @@
+"""Upload spooling: hashing on the fly, size limit and cleanup"""
+
+import hashlib
+import io
+import os
+
+import pytest
+
+def test_spool_hashes_while_writing(service):
+    data = os.urandom(300000)
+    spool = service.UploadSpool.from_stream(io.BytesIO(data), chunk_size=4096)
+    try:
+        assert spool.content_hash == hashlib.sha256(data).hexdigest()
+        assert spool.size == len(data)
+        with open(spool.name, 'rb') as f:
+            assert f.read() == data
+    finally:
+        spool.close()
+    assert not os.path.exists(spool.name)
+
+def test_spool_enforces_the_limit(service):
+    with pytest.raises(service.RequestEntityTooLarge):
+        service.UploadSpool.from_stream(io.BytesIO(b'x' * 5000), max_bytes=4096, chunk_size=1024)
+
+def test_raw_and_multipart_uploads_agree(service, client, make_pdf):
+    with open(make_pdf(['spooled upload'], name='spooled.pdf'), 'rb') as f:
+        data = f.read()
+    spooled_before = set(os.listdir(service.SPOOL_DIR)) if os.path.isdir(service.SPOOL_DIR) else set()
+
+    raw = client.post('/upload', data=data, content_type='application/pdf', headers={'X-Filename': 'a.pdf'})
+    multipart = client.post('/upload', data={'file': (io.BytesIO(data), 'a.pdf')},
+                            content_type='multipart/form-data')
+
+    assert raw.status_code == multipart.status_code == 200
+    assert raw.json['metadata']['content_hash'] == hashlib.sha256(data).hexdigest()
+    assert multipart.json['metadata']['content_hash'] == raw.json['metadata']['content_hash']
+    assert multipart.json['metadata']['filename'] == 'a.pdf'
+    assert set(os.listdir(service.SPOOL_DIR)) == spooled_before
+
+def test_upload_errors(service, client, monkeypatch):
+    assert client.post('/upload', data={}, content_type='multipart/form-data').status_code == 400
+    monkeypatch.setitem(service.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    response = client.post('/upload', data=b'%PDF-1.4\n' + b'0' * 2048, content_type='application/pdf')
+    assert response.status_code == 413
@@ -0,0 +1,87 @@
+"""Per-user vector index and /search"""
+
+import numpy as np
+import pytest
+
+@pytest.fixture
+def index(service, tmp_path):
+    return service.VectorIndex(str(tmp_path / 'alice'), 'test', 3)
+
+def records(*texts):
+    return [{'text': text} for text in texts]
+
+def test_search_ranks_by_cosine_similarity(index):
+    vectors = np.array([[1, 0, 0], [0, 1, 0], [0.8, 0.6, 0]], dtype=np.float32)
+    assert index.add_document('doc', records('x', 'y', 'xy'), vectors)
+    assert not index.add_document('doc', records('x'), vectors[:1])  # Already indexed
+
+    results, count = index.search([1, 0, 0], k=2)
+    assert count == 3
+    assert [record['text'] for _, record in results] == ['x', 'xy']
+    assert results[1][0] == pytest.approx(0.8)
+    assert results[0][1]['document_id'] == 'doc'
+
+def test_search_within_a_document(index):
+    index.add_document('first', records('a'), np.array([[1, 0, 0]], dtype=np.float32))
+    index.add_document('second', records('b', 'c'), np.array([[1, 0, 0], [0, 0, 1]], dtype=np.float32))
+
+    results, _ = index.search([1, 0, 0], k=5, document_id='second')
+    assert [record['text'] for _, record in results] == ['b', 'c']
+    assert index.search([1, 0, 0], document_id='missing')[0] == []
+
+def test_interrupted_append_is_discarded(index):
+    index.add_document('first', records('a'), np.array([[1, 0, 0]], dtype=np.float32))
+    with open(index._vectors_path, 'ab') as f:
+        f.write(b'\0' * 7)  # A crash left part of a row behind
+    index.add_document('second', records('b'), np.array([[0, 1, 0]], dtype=np.float32))
+
+    results, count = index.search([0, 1, 0], k=1)
+    assert count == 2
+    assert results[0][1]['text'] == 'b'
+
+def test_embedder_mismatch_is_refused(service, index):
+    index.add_document('doc', records('a'), np.array([[1, 0, 0]], dtype=np.float32))
+    with pytest.raises(ValueError):
+        service.VectorIndex(index.directory, 'other', 3).read_meta()
+
+def test_hashing_embedder_is_normalized(service):
+    vectors = service.HashingEmbedder(64).embed(['invoice total due', 'invoice total due', ''])
+    assert np.linalg.norm(vectors[0]) == pytest.approx(1.0)
+    assert np.array_equal(vectors[0], vectors[1])
+
+def test_index_and_search_endpoints(client):
+    markdown = b'# Invoices\n\nThe invoice total is due in thirty days.\n\n' \
+               b'# Shipping\n\nParcels ship from the warehouse every Monday.'
+    upload = client.post('/upload?index=true&user_id=bob&max_tokens=32', data=markdown,
+                         content_type='text/markdown').get_json()
+    assert upload['metadata']['index']['chunks'] == 2
+
+    body = client.get('/search?user_id=bob&q=invoice+total&k=1').get_json()
+    assert body['total_chunks'] == 2
+    assert body['results'][0]['section_path'] == ['Invoices']
+
+    assert client.get('/search?user_id=bob').status_code == 400
+    assert client.get('/search?user_id=../etc&q=x').status_code == 400
+    assert client.get('/search?user_id=bob&q=x&mode=fuzzy').status_code == 400
+
+def test_search_rejects_non_string_parameters(client):
+    assert client.post('/search', json={'user_id': 'bob', 'q': ['invoice']}).status_code == 400
+    assert client.post('/search', json={'user_id': 'bob', 'q': 'x', 'document_id': ['a']}).status_code == 400
+
+def test_open_indexes_are_bounded(service, monkeypatch):
+    from collections import OrderedDict
+    monkeypatch.setattr(service, 'INDEX_CACHE_SIZE', 2)
+    monkeypatch.setattr(service, '_vector_indexes', OrderedDict())
+    monkeypatch.setattr(service, '_keyword_indexes', OrderedDict())
+
+    carol = service.get_keyword_index('carol')
+    carol._segments[1] = ({}, b'')
+    service.get_vector_index('dave')
+    service.get_vector_index('carol')  # Now the most recently used
+    service.get_keyword_index('erin')
+    assert list(service._vector_indexes) == ['carol', 'erin']
+    assert service.get_keyword_index('carol') is carol
+    service.get_keyword_index('frank')
+    assert list(service._keyword_indexes) == ['carol', 'frank']
+    service.get_keyword_index('gina')
+    assert 'carol' not in service._keyword_indexes and carol._segments == {}